@@ -0,0 +1,444 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import sqlite3
+import threading
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from task_store import DEFAULT_TASK_DB_PATH
+
+# Constants
+JOB_LEASE_SECONDS = 30 # A claimed job whose worker stops heartbeating is re-claimed after this long
+HEARTBEAT_INTERVAL_SECONDS = 2 # Lease renewal
+STOP_POLL_INTERVAL_SECONDS = 0.25 # How often running jobs are checked for stop requests from other processes
+WORKER_POLL_INTERVAL_SECONDS = 0.5 # How often an idle worker looks for queued jobs
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', '8')) # Jobs one worker process runs at once
+MAX_JOB_ATTEMPTS = 3 # Claims per job; a job that keeps killing its worker is failed after this many
+LIVE_STATES = ("queued", "claimed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    task_id          TEXT PRIMARY KEY,
+    job_type         TEXT NOT NULL,
+    payload          TEXT,
+    state            TEXT NOT NULL,
+    worker_id        TEXT,
+    lease_until      REAL NOT NULL DEFAULT 0,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    pinned_to        TEXT,
+    created_at       TEXT NOT NULL,
+    updated_at       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, created_at);
+CREATE TABLE IF NOT EXISTS wallet_leases (
+    address     TEXT PRIMARY KEY,
+    holder      TEXT NOT NULL,
+    task_id     TEXT NOT NULL,
+    lease_until REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS wallet_leases_by_task ON wallet_leases (task_id);
+"""
+
+
+class Job:
+    """A claimed job: what to run and how often it has been tried."""
+
+    def __init__(self, task_id: str, job_type: str, payload: Dict[str, Any], attempts: int):
+        self.task_id = task_id
+        self.job_type = job_type
+        self.payload = payload
+        self.attempts = attempts
+
+
+class JobQueue:
+    """
+    Durable job queue in SQLite (the task database, WAL mode).
+
+    The API enqueues one job per task; any number of worker processes on the same host
+    claim jobs atomically and hold them under a lease they renew by heartbeating. If a
+    worker dies, its lease runs out and another worker re-claims the job, which then
+    resumes from the task's per-key checkpoint. Stop requests are flags on the job row,
+    so they reach whichever process runs it. Wallet leases (same heartbeat) keep two
+    tasks from using one wallet at the same time, across all workers.
+
+    The payload never holds plaintext secrets. A job whose secrets live only in one
+    worker's memory is pinned to that worker: no other worker claims it, and the owner's
+    heartbeat keeps its lease alive while it waits in the queue. If that worker dies, the
+    job is an orphan (see reap_orphans()) and must be re-submitted with its secrets.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_TASK_DB_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # isolation_level=None: transactions are explicit (BEGIN IMMEDIATE serialises claims across processes)
+        self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+
+    def _migrate(self) -> None:
+        """Brings databases created by older versions up to the current schema."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'pinned_to' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN pinned_to TEXT")
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def enqueue(
+        self,
+        task_id: str,
+        job_type: str,
+        payload: Dict[str, Any],
+        pinned_to: Optional[str] = None,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+    ) -> bool:
+        """
+        Queues a job for the task, optionally pinned to one worker. A task whose earlier job has
+        ended (resume) or was orphaned is queued again with fresh attempts; returns False if its
+        job is still queued or running.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (task_id, job_type, payload, state, pinned_to, lease_until, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?) "
+                "ON CONFLICT(task_id) DO UPDATE SET job_type = excluded.job_type, payload = excluded.payload, state = 'queued', "
+                "worker_id = NULL, pinned_to = excluded.pinned_to, lease_until = excluded.lease_until, attempts = 0, "
+                "cancel_requested = 0, created_at = excluded.created_at, updated_at = excluded.updated_at "
+                "WHERE jobs.state NOT IN ('queued', 'claimed') OR (jobs.pinned_to IS NOT NULL AND jobs.lease_until < ?)",
+                (task_id, job_type, json.dumps(payload, default=str), pinned_to, now + lease_seconds if pinned_to else 0,
+                 self._now(), self._now(), now),
+            )
+            return cursor.rowcount > 0
+
+    def claim(self, worker_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[Job]:
+        """Takes the oldest queued job (or one whose worker's lease expired); None if there is nothing to do."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT task_id, job_type, payload, attempts FROM jobs "
+                    "WHERE (pinned_to IS NULL OR pinned_to = ?) AND (state = 'queued' OR (state = 'claimed' AND lease_until < ?)) "
+                    "ORDER BY created_at LIMIT 1",
+                    (worker_id, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                task_id, job_type, payload, attempts = row
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'claimed', worker_id = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? WHERE task_id = ?",
+                    (worker_id, now + lease_seconds, self._now(), task_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return Job(task_id, job_type, json.loads(payload or '{}'), attempts + 1)
+
+    def heartbeat(self, worker_id: str, task_ids: List[str], lease_seconds: float = JOB_LEASE_SECONDS) -> Set[str]:
+        """
+        Extends the leases on a worker's jobs and on the wallets they hold. Returns the task_ids
+        whose job this worker still holds; a job missing from the result was re-claimed by another
+        worker (our lease had run out) or finished elsewhere, and must not run here any longer.
+        Queued jobs pinned to this worker are kept alive too.
+        """
+        marks = ','.join('?' * len(task_ids))
+        lease_until = time.time() + lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE pinned_to = ? AND state = 'queued'", (lease_until, worker_id),
+                )
+                if not task_ids:
+                    self._conn.execute("COMMIT")
+                    return set()
+                self._conn.execute(
+                    f"UPDATE jobs SET lease_until = ? WHERE worker_id = ? AND state = 'claimed' AND task_id IN ({marks})",
+                    (lease_until, worker_id, *task_ids),
+                )
+                held = {task_id for (task_id,) in self._conn.execute(
+                    f"SELECT task_id FROM jobs WHERE worker_id = ? AND state = 'claimed' AND task_id IN ({marks})",
+                    (worker_id, *task_ids),
+                )}
+                if held:
+                    held_marks = ','.join('?' * len(held))
+                    self._conn.execute(f"UPDATE wallet_leases SET lease_until = ? WHERE task_id IN ({held_marks})", (lease_until, *held))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return held
+
+    def reap_orphans(self, worker_id: str) -> List[str]:
+        """
+        Ends pinned jobs whose worker stopped renewing them (crashed or shut down): nobody else
+        can run them without their secrets. Returns their task_ids; the tasks need a resume.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                task_ids = [task_id for (task_id,) in self._conn.execute(
+                    "SELECT task_id FROM jobs WHERE pinned_to IS NOT NULL AND pinned_to != ? "
+                    "AND state IN ('queued', 'claimed') AND lease_until < ?",
+                    (worker_id, now),
+                )]
+                if task_ids:
+                    marks = ','.join('?' * len(task_ids))
+                    self._conn.execute(
+                        f"UPDATE jobs SET state = 'orphaned', payload = NULL, worker_id = NULL, updated_at = ? WHERE task_id IN ({marks})",
+                        (self._now(), *task_ids),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return task_ids
+
+    def stop_requests(self, task_ids: List[str]) -> Set[str]:
+        """Those of task_ids whose stop was requested (read-only, cheap enough to poll often)."""
+        if not task_ids:
+            return set()
+        marks = ','.join('?' * len(task_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT task_id FROM jobs WHERE cancel_requested = 1 AND task_id IN ({marks})", task_ids,
+            ).fetchall()
+        return {task_id for (task_id,) in rows}
+
+    def finish(self, task_id: str, worker_id: str, state: str = 'done') -> bool:
+        """Marks a job finished (done / failed / cancelled) and drops its payload; False if worker_id no longer holds it."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, payload = NULL, worker_id = NULL, updated_at = ? WHERE task_id = ? AND worker_id = ?",
+                (state, self._now(), task_id, worker_id),
+            )
+            return cursor.rowcount > 0
+
+    def release(self, task_id: str, worker_id: str) -> None:
+        """Puts a claimed job back in the queue (worker shutting down); the next claim resumes it."""
+        with self._lock:
+            # A clean hand-back is not a failed attempt
+            self._conn.execute(
+                "UPDATE jobs SET state = 'queued', worker_id = NULL, lease_until = 0, attempts = MAX(attempts - 1, 0), updated_at = ? "
+                "WHERE task_id = ? AND state = 'claimed' AND worker_id = ?",
+                (self._now(), task_id, worker_id),
+            )
+
+    def request_cancel(self, task_id: str) -> bool:
+        """
+        Asks for a job to stop. Returns True if it had not been claimed yet and is now
+        cancelled outright; False if a worker runs it (it sees the flag on its next heartbeat).
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = 'cancelled', payload = NULL, updated_at = ? WHERE task_id = ? AND state = 'queued'",
+                (self._now(), task_id),
+            )
+            if cursor.rowcount:
+                return True
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE task_id = ?", (self._now(), task_id))
+            return False
+
+    def lock_wallet(self, address: str, holder: str, task_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[str]:
+        """
+        Takes the wallet for holder (one key of one task). Returns None on success, otherwise
+        the task currently using the wallet. Leases of dead workers expire like job leases.
+        """
+        now = time.time()
+        address = address.lower()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO wallet_leases (address, holder, task_id, lease_until) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(address) DO UPDATE SET holder = excluded.holder, task_id = excluded.task_id, lease_until = excluded.lease_until "
+                "WHERE wallet_leases.lease_until < ? OR wallet_leases.holder = excluded.holder",
+                (address, holder, task_id, now + lease_seconds, now),
+            )
+            if cursor.rowcount:
+                return None
+            row = self._conn.execute("SELECT task_id FROM wallet_leases WHERE address = ?", (address,)).fetchone()
+        return row[0] if row else None
+
+    def unlock_wallet(self, address: str, holder: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM wallet_leases WHERE address = ? AND holder = ?", (address.lower(), holder))
+
+    def is_live(self, task_id: str) -> bool:
+        """True if the task's job is queued or claimed (a worker will run or is running it) and not orphaned."""
+        with self._lock:
+            row = self._conn.execute("SELECT state, pinned_to, lease_until FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None or row[0] not in LIVE_STATES:
+            return False
+        return row[1] is None or row[2] >= time.time()
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except sqlite3.Error:
+            pass
+
+
+# --- Worker --- #
+JobRunner = Callable[[Job], Awaitable[None]]
+
+
+class JobWorker:
+    """
+    Claims jobs from a JobQueue and runs them on the current event loop.
+
+    runner(job) executes one job; on_stop(task_id) is called when a stop request arrives
+    for a running job, on_error(task_id, message) when a job fails outside its runner and
+    on_orphan(task_id) when another worker died holding a pinned job (see reap_orphans()).
+    on_error and on_orphan are coroutines: they adopt the task's record, which reads SQLite,
+    so they do that off the event loop.
+    A stop cancels the job's asyncio.Task (see cancel()), so it takes effect at the job's
+    next await instead of after its current delay or receipt wait. So does losing the
+    lease: if the loop stalls past JOB_LEASE_SECONDS and another worker re-claims a job,
+    the next heartbeat finds it gone and cancels the local copy before it sends more.
+    Runs inside the API process (embedded) or as a standalone process (api/worker.py);
+    both can share one queue.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        runner: JobRunner,
+        on_stop: Callable[[str], None],
+        on_error: Callable[[str, str], Awaitable[None]],
+        concurrency: int = WORKER_CONCURRENCY,
+        worker_id: Optional[str] = None,
+        on_orphan: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        self.queue = queue
+        self.runner = runner
+        self.on_stop = on_stop
+        self.on_error = on_error
+        self.on_orphan = on_orphan
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running: Dict[str, asyncio.Task] = {}
+        self._stopping: Set[str] = set()
+        self._lost: Set[str] = set() # Jobs re-claimed by another worker while running here
+        self._wake: Optional[asyncio.Event] = None
+        self._closed = False
+
+    def cancel(self, task_id: str) -> bool:
+        """Cancels a running job because its task was stopped; False if it does not run here."""
+        job_task = self._running.get(task_id)
+        if job_task is None:
+            return False
+        self._stopping.add(task_id)
+        job_task.cancel()
+        return True
+
+    def _lose(self, task_id: str) -> None:
+        job_task = self._running.get(task_id)
+        if job_task is None or task_id in self._lost:
+            return # Already finished (its job row was closed) or already being cancelled
+        print(f"Warning: Worker {self.worker_id} lost its lease on task {task_id}; cancelling the local run.")
+        self._lost.add(task_id)
+        job_task.cancel()
+
+    def wake(self) -> None:
+        """Skips the idle poll wait (a job was just enqueued in this process)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self) -> None:
+        """Claims and runs jobs until close() is called."""
+        self._wake = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat_loop())
+        try:
+            while not self._closed:
+                job = None
+                if len(self._running) < self.concurrency:
+                    job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+                if job is not None:
+                    if job.task_id in self._running:
+                        continue # Our own lease had lapsed and we took the job back; it is still running
+                    self._running[job.task_id] = asyncio.create_task(self._run_job(job))
+                    continue
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), WORKER_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            heartbeat.cancel()
+
+    async def _run_job(self, job: Job) -> None:
+        state = 'done'
+        try:
+            if job.attempts > MAX_JOB_ATTEMPTS:
+                await self.on_error(job.task_id, f"Task abandoned: its worker stopped unexpectedly {job.attempts - 1} times.")
+                state = 'failed'
+                return
+            await self.runner(job)
+        except asyncio.CancelledError:
+            if job.task_id in self._stopping:
+                state = 'cancelled' # Stopped by the user; the runner already recorded it
+                return
+            if job.task_id in self._lost:
+                state = None # Another worker runs it now; its job row is not ours to update
+                return
+            # Worker shutting down: hand the job back so another worker resumes it from its checkpoint
+            await asyncio.to_thread(self.queue.release, job.task_id, self.worker_id)
+            state = None
+            raise
+        except Exception as e:
+            await self.on_error(job.task_id, f"Task crashed: {e}\nTraceback:\n{traceback.format_exc()}")
+            state = 'failed'
+        finally:
+            self._running.pop(job.task_id, None)
+            self._stopping.discard(job.task_id)
+            self._lost.discard(job.task_id)
+            if state is not None:
+                await asyncio.to_thread(self.queue.finish, job.task_id, self.worker_id, state)
+            self.wake() # A slot is free
+
+    async def _heartbeat_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        renewed_at = loop.time()
+        while True:
+            await asyncio.sleep(STOP_POLL_INTERVAL_SECONDS)
+            running = list(self._running)
+            try:
+                if loop.time() - renewed_at >= HEARTBEAT_INTERVAL_SECONDS:
+                    held = await asyncio.to_thread(self.queue.heartbeat, self.worker_id, running)
+                    renewed_at = loop.time()
+                    for task_id in set(running) - held:
+                        self._lose(task_id)
+                    running = [task_id for task_id in running if task_id in held]
+                    for task_id in await asyncio.to_thread(self.queue.reap_orphans, self.worker_id):
+                        if self.on_orphan is not None:
+                            await self.on_orphan(task_id)
+                stop_ids = await asyncio.to_thread(self.queue.stop_requests, running)
+            except sqlite3.Error as e:
+                print(f"Warning: Job heartbeat failed: {e}")
+                continue
+            for task_id in stop_ids - self._stopping:
+                self.on_stop(task_id)
+                self.cancel(task_id)
+
+    async def close(self) -> None:
+        """Stops claiming, cancels running jobs and returns them to the queue."""
+        self._closed = True
+        self.wake()
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
@@ -1,22 +1,39 @@
 import sys
 import os
 import asyncio
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, validator, create_model, field_validator, root_validator
-from typing import List, Dict, Any, Optional, Literal, Union, Annotated
+from typing import List, Dict, Any, Optional, Literal, Union, Annotated, Callable, Awaitable
 import random
 import uuid
+import base64
 from datetime import datetime, timezone
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
 from eth_account import Account
 from decimal import Decimal
 import traceback
+from contextlib import asynccontextmanager
+import sqlite3
 
 # Add scripts directory to path to allow imports
 SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts')
 sys.path.append(SCRIPTS_DIR)
 
+from rpc_pool import get_async_web3, ChainMismatchError # Shared, pooled Web3 providers (one per RPC URL)
+from multicall import get_balances_for_owners, get_token_decimals, NATIVE_KEY
+from balance_cache import balance_cache # Per-block wallet balance cache (invalidated by our own sends)
+from tx_scheduler import tx_scheduler # Process-wide send budget, shared fairly between running tasks
+
+# Make api/ modules importable regardless of how uvicorn was launched
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(API_DIR)
+
+from task_store import ACTIVE_STATUSES, TaskStore # SQLite-backed task metadata + logs
+from task_events import TaskEventBus # Live log/status push to SSE subscribers
+from job_queue import Job, JobQueue, JobWorker # Durable task queue shared by the API and worker processes
+
 # Import refactored script functions
 import_errors = {}
 try:
@@ -30,7 +47,7 @@ except ImportError as e_magma:
     import_errors['magma'] = str(e_magma)
 
 try:
-    from uniswap import execute_uniswap_swap
+    from uniswap import execute_uniswap_swap, DEFAULT_TOKEN_ADDRESSES as UNISWAP_TOKENS
 except ImportError as e_uniswap:
     import_errors['uniswap'] = str(e_uniswap)
 
@@ -76,7 +93,7 @@ except ImportError as e_rubic:
 
 # --- NEW: Import Ambient --- #
 try:
-    from ambient import execute_ambient_swap
+    from ambient import execute_ambient_swap, AMBIENT_TOKENS
 except ImportError as e_ambient:
     import_errors['ambient'] = str(e_ambient)
 
@@ -88,7 +105,7 @@ except ImportError as e_apriori:
 
 # --- NEW: Import Bean --- #
 try:
-    from bean import execute_bean_swap, DEFAULT_RPC_URLS
+    from bean import execute_bean_swap, DEFAULT_RPC_URLS, DEFAULT_TOKENS as BEAN_TOKENS
 except ImportError as e_bean:
     import_errors['bean'] = str(e_bean)
 
@@ -178,10 +195,23 @@ if 'bima' in import_errors:
     print(f"Warning: Failed to import bima.py: {import_errors['bima']}. Using dummy function.")
     execute_bima_lend_cycle = create_dummy_func('bima_lend_cycle', import_errors['bima'])
 
+# --- Token Sets for /api/v1/balances (symbol -> address), from the scripts' own token maps ---
+BALANCE_TOKEN_SETS: Dict[str, Dict[str, str]] = {}
+if 'bean' not in import_errors:
+    BALANCE_TOKEN_SETS['bean'] = {symbol: details['address'] for symbol, details in BEAN_TOKENS.items()}
+if 'ambient' not in import_errors:
+    BALANCE_TOKEN_SETS['ambient'] = {symbol.upper(): details['address'] for symbol, details in AMBIENT_TOKENS.items()}
+if 'uniswap' not in import_errors:
+    BALANCE_TOKEN_SETS['uniswap'] = dict(UNISWAP_TOKENS)
+
 # --- Task Status Storage ---
-# Simple in-memory storage for demo purposes
-# In a real application, consider using a database or Redis
-task_status_storage: Dict[str, Dict[str, Any]] = {}
+# Dict-like store persisted to SQLite (WAL); survives restarts (see api/task_store.py)
+# Each task's 'logs' is a ring buffer of the latest entries; full history stays on disk
+# Tasks run from a job queue in the same database, so a task whose job is still live
+# (a worker runs it or will resume it) is not marked interrupted at startup
+job_queue = JobQueue()
+task_status_storage = TaskStore(keep_active=job_queue.is_live)
+task_event_bus = TaskEventBus()
 
 # --- Helper function to update task status and logs ---
 def update_task_log(task_id: str, message: str, status: str | None = None, level: str = 'info'):
@@ -192,22 +222,14 @@ def update_task_log(task_id: str, message: str, status: str | None = None, level
         print(f"Warning: Task ID {task_id} not found in storage for logging.")
         return
 
-    timestamp = datetime.now(timezone.utc).isoformat()
-    # Ensure logs list exists
-    if 'logs' not in task or not isinstance(task['logs'], list):
-        task['logs'] = []
-
-    log_entry = {"timestamp": timestamp, "level": level, "message": message}
-    task['logs'].append(log_entry)
+    log_entry = task_status_storage.append_log(task_id, message, level)
+    task_event_bus.publish({"type": "log", "task_id": task_id, **log_entry})
 
     if status:
         task['status'] = status
-        task['last_updated'] = timestamp
-
-    # Optional: Prune old logs if needed
-    max_logs = 1000 # Limit logs per task
-    if len(task['logs']) > max_logs:
-       task['logs'] = task['logs'][-max_logs:]
+        task['last_updated'] = log_entry['timestamp']
+        task_status_storage.save(task_id)
+        task_event_bus.publish({"type": "status", "task_id": task_id, "status": status, "last_updated": task['last_updated']})
 
 
 app = FastAPI(
@@ -233,13 +255,28 @@ app.add_middleware(
     allow_headers=["*"], # Allow all headers
 )
 
+# --- Startup Checks ---
+@app.on_event("startup")
+async def verify_default_rpc_chain():
+    """Fails loudly at boot if the default RPC serves the wrong chain (tasks would be refused anyway)."""
+    rpc_url_to_use = os.environ.get('DEFAULT_RPC_URL', 'https://testnet-rpc.monad.xyz/')
+    try:
+        await get_async_web3(rpc_url_to_use)
+    except ChainMismatchError as e:
+        print(f"ERROR: {e}. Fix DEFAULT_RPC_URL (or EXPECTED_CHAIN_ID) before starting tasks.")
+    except ConnectionError as e:
+        print(f"Warning: Default RPC not reachable at startup: {e}")
+
 # --- Pydantic Models for Request Bodies ---
 class BaseBotRequest(BaseModel):
     private_keys: List[str] = Field(..., min_items=1)
     rpc_url: str | None = None # Allow overriding default
     delay_between_keys_seconds: int = Field(default=60, ge=0)
     delay_between_cycles_seconds: int = Field(default=120, ge=0)
+    max_parallel_keys: int = Field(default=1, ge=1) # Keys processed concurrently (1 = one after another)
     task_description: str | None = None # Optional description for the task
+    priority: int = 0 # Transaction scheduler: higher-priority tasks get send slots first
+    weight: float = Field(default=1.0, gt=0) # Transaction scheduler: share of send slots among tasks of equal priority
 
 class StakeRequest(BaseBotRequest):
     contract_type: str # e.g., 'kitsu', 'apriori', 'magma'
@@ -271,6 +308,21 @@ class SendRequest(BaseBotRequest):
 class PrivateKeyRequest(BaseModel):
     private_key: str = Field(..., pattern=r"^0x[0-9a-fA-F]{64}$") # Basic validation
 
+# --- NEW: Bulk Balances Request Model --- #
+class BalancesRequest(BaseModel):
+    addresses: List[str] = Field(..., min_length=1, max_length=1000)
+    token_sets: List[Literal['bean', 'ambient', 'uniswap']] = Field(default_factory=list) # Empty = native MON only
+    include_native: bool = True
+    rpc_url: Optional[str] = None
+
+    @field_validator('addresses')
+    @classmethod
+    def addresses_must_be_valid(cls, v):
+        invalid = [a for a in v if not Web3.is_address(a)]
+        if invalid:
+            raise ValueError(f'Invalid wallet address format: {invalid[:5]}')
+        return v
+
 # --- NEW: Bebop Request Model --- #
 class BebopRequest(BaseBotRequest):
     amount_mon: float = Field(..., gt=0) # Amount to wrap/unwrap
@@ -347,17 +399,134 @@ class BimaRequest(BaseBotRequest):
         return v
 
 # --- Helper Function for Web3 Connection ---
-def get_w3_connection(rpc_url: str | None = None) -> Web3:
-    """Establishes a Web3 connection."""
+async def get_w3_connection(rpc_url: str | None = None) -> AsyncWeb3:
+    """Establishes a Web3 connection (async: the health probe must not block the event loop)."""
     rpc_url_to_use = rpc_url or os.environ.get('DEFAULT_RPC_URL', 'https://testnet-rpc.monad.xyz/')
-    w3 = Web3(Web3.HTTPProvider(rpc_url_to_use))
     # Add PoA middleware if needed (Monad Testnet might require this)
     # w3.middleware_onion.inject(geth_poa_middleware, layer=0) # Commented out due to ImportError
-    if not w3.is_connected():
+    try:
+        return await get_async_web3(rpc_url_to_use) # Reuses the pooled transport for this URL
+    except ConnectionError:
         raise HTTPException(status_code=503, detail=f"Could not connect to RPC: {rpc_url_to_use}")
-    return w3
 
 # --- Background Task Functions ---
+def _key_address(private_key: str) -> Optional[str]:
+    try:
+        return Account.from_key(private_key).address
+    except Exception:
+        return None # Invalid key: the runner reports it
+
+WALLET_WAIT_POLL_SECONDS = 0.5 # How often a key waiting for a busy wallet checks again
+
+@asynccontextmanager
+async def wallet_in_use(task_id: str, index: int, private_key: str):
+    """
+    Holds the key's wallet for one task while it is processed. A wallet already used by
+    another task (in any worker process) is waited for, so the two never send with
+    interleaved nonces.
+    """
+    address = _key_address(private_key)
+    if address is None:
+        yield # Invalid key: process_key reports it
+        return
+    # Per worker: a copy of the task left running on a worker that lost its job lease can't renew or free this one
+    holder = f"{job_worker.worker_id if job_worker else os.getpid()}/{task_id}#{index}"
+    waiting_logged = False
+    while True:
+        busy_with = await asyncio.to_thread(job_queue.lock_wallet, address, holder, task_id)
+        if busy_with is None:
+            break
+        if not waiting_logged:
+            update_task_log(task_id, f"[Key {index+1}] Wallet {address} is in use by task {busy_with}; waiting for it...")
+            waiting_logged = True
+        await asyncio.sleep(WALLET_WAIT_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        job_queue.unlock_wallet(address, holder) # Synchronous: runs even while the task is being cancelled
+
+async def run_for_each_key(
+    task_id: str,
+    private_keys: List[str],
+    delay_between_keys_seconds: int,
+    max_parallel_keys: int,
+    process_key: Callable[[int, str], Awaitable[bool]],
+) -> bool:
+    """Runs process_key(index, private_key) for every key and returns True only if all keys succeeded.
+
+    With max_parallel_keys == 1 keys run one after another with the configured delay between them.
+    With N > 1 up to N keys run at once and the delay becomes a start-time stagger of delay / N,
+    so each of the N slots still waits roughly the configured delay between its own keys.
+
+    Each finished key is checkpointed in the task's 'completed_keys' (index -> success), so a
+    task resumed by another worker skips keys that are already done instead of repeating them.
+    """
+    completed_keys: Dict[str, bool] = task_status_storage[task_id].setdefault('completed_keys', {})
+    if completed_keys:
+        update_task_log(task_id, f"Resuming: {len(completed_keys)}/{len(private_keys)} keys already processed, skipping them.")
+
+    async def process_key_once(i: int, pk: str) -> bool:
+        async with wallet_in_use(task_id, i, pk):
+            success = await process_key(i, pk)
+        if success or not task_status_storage[task_id].get('stop_requested'): # A key cut short by a stop is not done
+            completed_keys[str(i)] = success
+            task_status_storage.save(task_id)
+        return success
+
+    if max_parallel_keys <= 1:
+        overall_success = True
+        for i, pk in enumerate(private_keys):
+            if str(i) in completed_keys:
+                overall_success = overall_success and completed_keys[str(i)]
+                continue
+
+            # Check before processing each key
+            if task_status_storage.get(task_id, {}).get('stop_requested'):
+                update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
+                return False
+
+            if not await process_key_once(i, pk):
+                overall_success = False
+
+            # Wait between keys if not the last key and delay > 0
+            if i < len(private_keys) - 1 and delay_between_keys_seconds > 0:
+                # Check before sleeping
+                if task_status_storage.get(task_id, {}).get('stop_requested'):
+                    update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
+                    return False
+                update_task_log(task_id, f"Waiting {delay_between_keys_seconds}s before next key...")
+                await asyncio.sleep(delay_between_keys_seconds)
+        return overall_success
+
+    stagger_seconds = delay_between_keys_seconds / max_parallel_keys
+    semaphore = asyncio.Semaphore(max_parallel_keys)
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    update_task_log(task_id, f"Running up to {max_parallel_keys} keys in parallel (start stagger: {stagger_seconds:.1f}s).")
+
+    async def run_one(i: int, pk: str) -> bool:
+        if str(i) in completed_keys:
+            return completed_keys[str(i)]
+        # Key i may not start before i * stagger seconds have passed
+        start_delay = started_at + i * stagger_seconds - loop.time()
+        if start_delay > 0:
+            await asyncio.sleep(start_delay)
+        async with semaphore:
+            if task_status_storage.get(task_id, {}).get('stop_requested'):
+                return False
+            try:
+                return await process_key_once(i, pk)
+            except Exception as e:
+                tb_str = traceback.format_exc()
+                update_task_log(task_id, f"[Key {i+1}/{len(private_keys)}] Unexpected error: {e}\nTraceback:\n{tb_str}", level='error')
+                return False
+
+    results = await asyncio.gather(*(run_one(i, pk) for i, pk in enumerate(private_keys)))
+
+    task = task_status_storage.get(task_id, {})
+    if task.get('stop_requested') and task.get('status') != 'stopped':
+        update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
+    return all(results)
 
 async def run_stake_cycle_task(
     task_id: str, # Added
@@ -372,7 +541,7 @@ async def run_stake_cycle_task(
     update_task_log(task_id, f"Starting background stake task for {len(request.private_keys)} keys (Type: {request.contract_type})...", status='running')
     w3 = None
     try:
-        w3 = get_w3_connection(request.rpc_url)
+        w3 = await get_w3_connection(request.rpc_url)
         update_task_log(task_id, f"Connected to RPC: {w3.provider.endpoint_uri}")
     except HTTPException as e:
         tb_str = traceback.format_exc()
@@ -383,13 +552,8 @@ async def run_stake_cycle_task(
         update_task_log(task_id, f"An unexpected error occurred during RPC connection: {e}\nTraceback:\n{tb_str}", status='failed', level='error')
         return
 
-    overall_success = True # Track if any part fails
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         # Note: Address derivation moved to wallet import endpoint
@@ -400,7 +564,7 @@ async def run_stake_cycle_task(
                 # Check before starting each cycle
                 if task_status_storage.get(task_id, {}).get('stop_requested'):
                     update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                    return # Exit the function
+                    return False # Exit the function
 
                 cycle_prefix = f"{key_prefix} [Cycle {cycle+1}/{request.cycles}]"
                 update_task_log(task_id, f"{cycle_prefix} Starting cycle...")
@@ -413,7 +577,7 @@ async def run_stake_cycle_task(
                         amount_desc = f"{request.amount_mon} MON"
                     except Exception as e:
                         update_task_log(task_id, f"{cycle_prefix} Invalid amount_mon: {request.amount_mon} - {e}", level='error')
-                        overall_success = False
+                        key_success = False
                         break # Stop processing this key's cycles if amount is bad
                 else:
                      # Use random amount - Ensure get_random_amount_wei exists and works
@@ -422,7 +586,7 @@ async def run_stake_cycle_task(
                          amount_desc = f"{w3.from_wei(amount_to_stake_wei, 'ether')} MON (Random)"
                      except Exception as e:
                          update_task_log(task_id, f"{cycle_prefix} Error getting random amount: {e}", level='error')
-                         overall_success = False
+                         key_success = False
                          break # Stop cycles if random amount fails
 
                 stake_result = {}
@@ -494,7 +658,7 @@ async def run_stake_cycle_task(
                     #     update_task_log(task_id, f"{cycle_prefix} Unstake Result: {unstake_result.get('message', 'No message')}")
                     # 
                     #     if not unstake_result.get('success'):
-                    #          overall_success = False # Mark failure if unstake fails
+                    #          key_success = False # Mark failure if unstake fails
                     #          update_task_log(task_id, f"{cycle_prefix} Unstake failed, marking task as potentially incomplete.", level='warning')
                     # else:
                     #     # This case should not happen if stake_fn was found, but good for safety
@@ -502,7 +666,7 @@ async def run_stake_cycle_task(
                     pass # Stake succeeded, no unstake action needed
 
                 else: # Stake failed
-                    overall_success = False # Mark failure if stake fails
+                    key_success = False # Mark failure if stake fails
                     # update_task_log(task_id, f"{cycle_prefix} Skipping unstake due to stake failure.", level='warning') # No longer relevant
                     # Optional: break cycle? continue?
 
@@ -511,7 +675,7 @@ async def run_stake_cycle_task(
                      # Check before sleeping
                      if task_status_storage.get(task_id, {}).get('stop_requested'):
                          update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                         return # Exit the function
+                         return False # Exit the function
                      wait_msg = f"{cycle_prefix} Waiting {request.delay_between_cycles_seconds}s before next stake cycle..."
                      update_task_log(task_id, wait_msg)
                      await asyncio.sleep(request.delay_between_cycles_seconds)
@@ -522,17 +686,13 @@ async def run_stake_cycle_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Error processing key cycles: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False # Mark failure
-
-        # Wait between keys if not the last key and delay > 0
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+            key_success = False # Mark failure
+
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # End of keys loop
     # Only update final status if not stopped
@@ -553,7 +713,7 @@ async def run_swap_task(
     update_task_log(task_id, f"Starting background swap task for {len(request.private_keys)} keys...", status='running')
     w3 = None
     try:
-        w3 = get_w3_connection(request.rpc_url)
+        w3 = await get_w3_connection(request.rpc_url)
         update_task_log(task_id, f"Connected to RPC: {w3.provider.endpoint_uri}")
     except HTTPException as e:
         tb_str = traceback.format_exc()
@@ -564,13 +724,8 @@ async def run_swap_task(
         update_task_log(task_id, f"An unexpected error occurred during RPC connection: {e}\nTraceback:\n{tb_str}", status='failed', level='error')
         return
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -578,7 +733,7 @@ async def run_swap_task(
                 # Check before starting each cycle
                 if task_status_storage.get(task_id, {}).get('stop_requested'):
                     update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                    return # Exit the function
+                    return False # Exit the function
 
                 cycle_prefix = f"{key_prefix} [Cycle {cycle+1}/{request.cycles}]"
                 update_task_log(task_id, f"{cycle_prefix} Starting swap cycle...")
@@ -600,7 +755,7 @@ async def run_swap_task(
                 update_task_log(task_id, f"{cycle_prefix} Swap Result: {swap_result.get('message', 'No message')}")
 
                 if not swap_result.get('success'):
-                    overall_success = False
+                    key_success = False
                     update_task_log(task_id, f"{cycle_prefix} Swap failed.", level='warning')
                     # Decide whether to break or continue cycles/keys on failure
 
@@ -609,7 +764,7 @@ async def run_swap_task(
                     # Check before sleeping
                     if task_status_storage.get(task_id, {}).get('stop_requested'):
                         update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                        return # Exit the function
+                        return False # Exit the function
                     wait_msg = f"{cycle_prefix} Waiting {request.delay_between_cycles_seconds}s before next cycle..."
                     update_task_log(task_id, wait_msg)
                     await asyncio.sleep(request.delay_between_cycles_seconds)
@@ -618,17 +773,13 @@ async def run_swap_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Error processing key cycles: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
 
-        # Wait between keys
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-            # Check before sleeping
-            if task_status_storage.get(task_id, {}).get('stop_requested'):
-                update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                return # Exit the function
-            wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-            update_task_log(task_id, wait_msg)
-            await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -649,7 +800,7 @@ async def run_deploy_task(
     update_task_log(task_id, f"Starting background deploy task for {len(request.private_keys)} keys (Contract: {request.contract_name})...", status='running')
     w3 = None
     try:
-        w3 = get_w3_connection(request.rpc_url)
+        w3 = await get_w3_connection(request.rpc_url)
         update_task_log(task_id, f"Connected to RPC: {w3.provider.endpoint_uri}")
     except HTTPException as e:
         tb_str = traceback.format_exc()
@@ -660,13 +811,8 @@ async def run_deploy_task(
         update_task_log(task_id, f"An unexpected error occurred during RPC connection: {e}\nTraceback:\n{tb_str}", status='failed', level='error')
         return
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -674,7 +820,7 @@ async def run_deploy_task(
                 # Check before starting each cycle (deployment)
                 if task_status_storage.get(task_id, {}).get('stop_requested'):
                     update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                    return # Exit the function
+                    return False # Exit the function
 
                 cycle_prefix = f"{key_prefix} [Deployment {cycle+1}/{request.cycles}]"
                 update_task_log(task_id, f"{cycle_prefix} Attempting deploy {request.contract_name} ({request.contract_symbol})...")
@@ -702,7 +848,7 @@ async def run_deploy_task(
 
 
                 if not deploy_result.get('success'):
-                    overall_success = False
+                    key_success = False
                     update_task_log(task_id, f"{cycle_prefix} Deployment reported failure.", level='warning')
                     # Decide handling on failure - maybe break inner loop?
                     # break
@@ -712,7 +858,7 @@ async def run_deploy_task(
                     # Check before sleeping
                     if task_status_storage.get(task_id, {}).get('stop_requested'):
                         update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                        return # Exit the function
+                        return False # Exit the function
                     wait_msg = f"{cycle_prefix} Waiting {request.delay_between_cycles_seconds}s before next deployment..."
                     update_task_log(task_id, wait_msg)
                     await asyncio.sleep(request.delay_between_cycles_seconds)
@@ -721,19 +867,15 @@ async def run_deploy_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Error processing key deployments: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # Maybe continue to the next key instead of stopping everything?
             # continue
 
-        # Wait between keys
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-            # Check before sleeping
-            if task_status_storage.get(task_id, {}).get('stop_requested'):
-                update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                return # Exit the function
-            wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-            update_task_log(task_id, wait_msg)
-            await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -754,7 +896,7 @@ async def run_send_task(
     update_task_log(task_id, f"Starting background send task for {len(request.private_keys)} keys...", status='running')
     w3 = None
     try:
-        w3 = get_w3_connection(request.rpc_url)
+        w3 = await get_w3_connection(request.rpc_url)
         update_task_log(task_id, f"Connected to RPC: {w3.provider.endpoint_uri}")
     except HTTPException as e:
         tb_str = traceback.format_exc()
@@ -765,13 +907,8 @@ async def run_send_task(
         update_task_log(task_id, f"An unexpected error occurred during RPC connection: {e}\nTraceback:\n{tb_str}", status='failed', level='error')
         return
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -781,14 +918,14 @@ async def run_send_task(
                 amount_to_send_wei = w3.to_wei(request.amount_mon, 'ether')
             except Exception as e:
                  update_task_log(task_id, f"{key_prefix} Invalid amount_mon: {request.amount_mon} - {e}", level='error')
-                 overall_success = False
-                 continue # Skip this key if amount is bad
+                 key_success = False
+                 return False # Skip this key if amount is bad
 
             for tx_num in range(request.tx_count):
                 # Check before starting each transaction
                 if task_status_storage.get(task_id, {}).get('stop_requested'):
                     update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                    return # Exit the function
+                    return False # Exit the function
 
                 tx_prefix = f"{key_prefix} [Tx {tx_num+1}/{request.tx_count}]"
                 update_task_log(task_id, f"{tx_prefix} Starting send transaction...")
@@ -802,7 +939,7 @@ async def run_send_task(
                 
                 if not recipient:
                     update_task_log(task_id, f"{tx_prefix} No recipient address available. Skipping send.", level='error')
-                    overall_success = False
+                    key_success = False
                     continue # Skip this transaction
 
                 update_task_log(task_id, f"{tx_prefix} Attempting send {request.amount_mon} MON to {recipient}")
@@ -820,7 +957,7 @@ async def run_send_task(
                 update_task_log(task_id, f"{tx_prefix} Send Result: {send_result.get('message', 'No message')}")
 
                 if not send_result.get('success'):
-                    overall_success = False
+                    key_success = False
                     update_task_log(task_id, f"{tx_prefix} Send failed.", level='warning')
                     # Decide handling on failure
 
@@ -837,17 +974,13 @@ async def run_send_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Error processing key transactions: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
 
-        # Wait between keys
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-            # Check before sleeping
-            if task_status_storage.get(task_id, {}).get('stop_requested'):
-                update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                return # Exit the function
-            wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-            update_task_log(task_id, wait_msg)
-            await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -867,13 +1000,8 @@ async def run_bebop_task(
 
     update_task_log(task_id, f"Starting background Bebop task for {len(request.private_keys)} keys...", status='running')
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -889,7 +1017,7 @@ async def run_bebop_task(
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
 
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Bebop wrap/unwrap failed: {result.get('message', 'Unknown error')}", level='warning')
                 # Decide if we should continue to next key or stop?
                 # continue
@@ -898,18 +1026,14 @@ async def run_bebop_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Bebop task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # continue # Maybe continue to next key?
 
-        # Wait between keys if applicable
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -929,13 +1053,8 @@ async def run_izumi_task(
 
     update_task_log(task_id, f"Starting background Izumi task for {len(request.private_keys)} keys...", status='running')
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -949,7 +1068,7 @@ async def run_izumi_task(
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
 
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Izumi wrap/unwrap failed: {result.get('message', 'Unknown error')}", level='warning')
                 # continue
 
@@ -957,18 +1076,14 @@ async def run_izumi_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Izumi task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # continue
 
-        # Wait between keys if applicable
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -988,13 +1103,8 @@ async def run_lilchogstars_task(
 
     update_task_log(task_id, f"Starting background Lilchogstars Mint task for {len(request.private_keys)} keys...", status='running')
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -1009,7 +1119,7 @@ async def run_lilchogstars_task(
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
 
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Lilchogstars mint failed: {result.get('message', 'Unknown error')}", level='warning')
                 # continue
 
@@ -1017,18 +1127,14 @@ async def run_lilchogstars_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Lilchogstars task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # continue
 
-        # Wait between keys if applicable
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -1048,13 +1154,8 @@ async def run_mono_task(
 
     update_task_log(task_id, f"Starting background Mono task for {len(request.private_keys)} keys...", status='running')
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -1070,7 +1171,7 @@ async def run_mono_task(
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
 
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Mono transaction failed: {result.get('message', 'Unknown error')}", level='warning')
                 # continue
 
@@ -1078,18 +1179,14 @@ async def run_mono_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Mono task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # continue
 
-        # Wait between keys if applicable
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -1108,13 +1205,8 @@ async def run_rubic_task(
         return
 
     update_task_log(task_id, f"Starting background Rubic Swap task for {len(request.private_keys)} keys...", status='running')
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -1126,22 +1218,19 @@ async def run_rubic_task(
             for log_msg in result.get('logs', []):
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Rubic swap failed: {result.get('message', 'Unknown error')}", level='warning')
         except Exception as e:
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Rubic task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
 
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -1161,13 +1250,8 @@ async def run_ambient_task(
 
     update_task_log(task_id, f"Starting background Ambient Swap task for {len(request.private_keys)} keys...", status='running')
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -1184,14 +1268,14 @@ async def run_ambient_task(
             # Check if result is None before accessing it
             if result is None:
                 update_task_log(task_id, f"{key_prefix} Ambient swap failed: Function returned None", level='error')
-                overall_success = False
-                continue
+                key_success = False
+                return False
                 
             for log_msg in result.get('logs', []):
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
 
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Ambient swap failed: {result.get('message', 'Unknown error')}", level='warning')
                 # continue
 
@@ -1199,18 +1283,14 @@ async def run_ambient_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Ambient task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # continue
 
-        # Wait between keys if applicable
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -1230,13 +1310,8 @@ async def run_apriori_task(
 
     update_task_log(task_id, f"Starting background Apriori task for {len(request.private_keys)} keys...", status='running')
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -1251,7 +1326,7 @@ async def run_apriori_task(
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
 
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Apriori cycle failed: {result.get('message', 'Unknown error')}", level='warning')
                 # continue
 
@@ -1259,18 +1334,14 @@ async def run_apriori_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Apriori task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # continue
 
-        # Wait between keys if applicable
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -1290,13 +1361,8 @@ async def run_bean_task(
 
     update_task_log(task_id, f"Starting background Bean Swap task for {len(request.private_keys)} keys...", status='running')
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -1315,7 +1381,7 @@ async def run_bean_task(
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
 
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Bean swap failed: {result.get('message', 'Unknown error')}", level='warning')
                 # continue
 
@@ -1323,18 +1389,14 @@ async def run_bean_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Bean task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # continue
 
-        # Wait between keys if applicable
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -1354,13 +1416,8 @@ async def run_bima_task(
 
     update_task_log(task_id, f"Starting background Bima Lend task for {len(request.private_keys)} keys...", status='running')
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
-        # Check before processing each key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-            return # Exit the function
-
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
         try:
@@ -1375,7 +1432,7 @@ async def run_bima_task(
                 update_task_log(task_id, f"{key_prefix} {log_msg}")
 
             if not result.get('success'):
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{key_prefix} Bima lend cycle failed: {result.get('message', 'Unknown error')}", level='warning')
                 # continue
 
@@ -1383,18 +1440,14 @@ async def run_bima_task(
             tb_str = traceback.format_exc()
             error_msg = f"{key_prefix} Unexpected error during Bima task execution: {e}"
             update_task_log(task_id, f"{error_msg}\nTraceback:\n{tb_str}", level='error')
-            overall_success = False
+            key_success = False
             # continue
 
-        # Wait between keys if applicable
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # Only update final status if not stopped
     if not task_status_storage.get(task_id, {}).get('stop_requested'):
@@ -1436,11 +1489,16 @@ async def get_wallet_balance(address: str):
         # Use checksum address
         checksum_address = Web3.to_checksum_address(address)
 
-        w3 = get_w3_connection() # Use default RPC
+        rpc_url_to_use = os.environ.get('DEFAULT_RPC_URL', 'https://testnet-rpc.monad.xyz/') # Use default RPC
+        try:
+            w3 = await get_async_web3(rpc_url_to_use)
+        except ConnectionError:
+            raise HTTPException(status_code=503, detail=f"Could not connect to RPC: {rpc_url_to_use}")
 
-        balance_wei = w3.eth.get_balance(checksum_address)
+        # Served from the per-block cache; concurrent requests for the same wallet share one RPC call
+        balance_wei = await balance_cache.get_balance(w3, checksum_address)
         # Convert Wei to MON (Ether) using Decimal for precision
-        balance_mon = w3.from_wei(balance_wei, 'ether')
+        balance_mon = Web3.from_wei(balance_wei, 'ether')
 
         # Return as string for consistent JSON representation of potentially large/small numbers
         return {"address": checksum_address, "balance": str(balance_mon)}
@@ -1453,13 +1511,94 @@ async def get_wallet_balance(address: str):
         print(f"Error fetching balance for {address}: {e}") # Log server-side
         raise HTTPException(status_code=500, detail=f"Could not fetch balance: {e}")
 
+@app.post("/api/v1/balances", tags=["Wallet Info"])
+async def get_bulk_balances(request: BalancesRequest):
+    """
+    Native and token balances for many wallets at once.
+    All reads are packed into Multicall3 aggregate3 calls (a few hundred reads per eth_call),
+    so 300 wallets x 6 tokens costs a handful of RPC requests.
+    """
+    unavailable = [name for name in request.token_sets if name not in BALANCE_TOKEN_SETS]
+    if unavailable:
+        raise HTTPException(status_code=400, detail=f"Token sets unavailable (script import failed): {unavailable}")
+
+    try:
+        w3 = await get_async_web3(request.rpc_url)
+    except ConnectionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    token_addresses = [address for name in request.token_sets for address in BALANCE_TOKEN_SETS[name].values()]
+    try:
+        decimals = await get_token_decimals(w3, token_addresses)
+        raw_balances = await get_balances_for_owners(w3, request.addresses, token_addresses, include_native=request.include_native)
+    except Exception as e:
+        print(f"Error fetching bulk balances: {e}") # Log server-side
+        raise HTTPException(status_code=500, detail=f"Could not fetch balances: {e}")
+
+    def to_units(balance_wei: Optional[int], token_decimals: Optional[int]) -> Optional[str]:
+        if balance_wei is None or token_decimals is None:
+            return None # Read failed; other balances are still returned
+        return format(Decimal(balance_wei) / (Decimal(10) ** token_decimals), 'f')
+
+    balances = {}
+    for owner, owner_balances in raw_balances.items():
+        entry: Dict[str, Any] = {}
+        if request.include_native:
+            entry['native'] = to_units(owner_balances.get(NATIVE_KEY), 18)
+        entry['tokens'] = {
+            name: {
+                symbol: to_units(owner_balances.get(address.lower()), decimals.get(address.lower()))
+                for symbol, address in BALANCE_TOKEN_SETS[name].items()
+            }
+            for name in request.token_sets
+        }
+        balances[owner] = entry
+    return {"balances": balances}
+
 # --- Task Status Endpoints ---
 
+def _encode_task_cursor(task: Dict[str, Any]) -> str:
+    raw = f"{task.get('start_time') or ''}|{task.get('task_id') or ''}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_task_cursor(cursor: str) -> tuple:
+    try:
+        start_time, task_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return start_time, task_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @app.get("/api/v1/tasks", tags=["Tasks"])
-async def get_tasks():
-    """Retrieves the status and summary of all managed tasks."""
-    # Return a copy to avoid modifying the original data structure directly
-    return {"tasks": task_status_storage.copy()}
+async def get_tasks(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+):
+    """
+    Retrieves compact summaries of managed tasks, newest first.
+    Full logs are only returned by /api/v1/tasks/{task_id}.
+    - status: comma-separated filter, e.g. "running,pending"
+    - cursor: pass back next_cursor from the previous page
+    """
+    status_filter = {s.strip().lower() for s in status.split(',') if s.strip()} if status else None
+    tasks = [
+        task for task in task_status_storage.values()
+        if status_filter is None or str(task.get('status', '')).lower() in status_filter
+    ]
+    # Newest first; task_id breaks ties so the order (and therefore the cursor) is stable
+    tasks.sort(key=lambda t: (t.get('start_time') or '', t.get('task_id') or ''), reverse=True)
+
+    if cursor:
+        after = _decode_task_cursor(cursor)
+        tasks = [t for t in tasks if (t.get('start_time') or '', t.get('task_id') or '') < after]
+
+    page = tasks[:limit]
+    next_cursor = _encode_task_cursor(page[-1]) if len(tasks) > limit else None
+    return {
+        "tasks": {task['task_id']: task_status_storage.summary(task['task_id']) for task in page},
+        "next_cursor": next_cursor,
+    }
 
 
 @app.get("/api/v1/tasks/{task_id}", tags=["Tasks"])
@@ -1470,6 +1609,33 @@ async def get_task_status(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
+@app.get("/api/v1/tasks/{task_id}/logs", tags=["Tasks"])
+def get_task_logs( # Plain def: may read SQLite, so FastAPI runs it in the threadpool
+    task_id: str,
+    after: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+):
+    """Returns only the log entries with seq > after (for incremental tailing)."""
+    page = task_status_storage.logs_after(task_id, after, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return page
+
+@app.get("/api/v1/task-events", tags=["Tasks"])
+async def stream_task_events(request: Request, task_id: Optional[str] = None):
+    """
+    Server-Sent Events stream of task 'log' and 'status' events (all tasks, or one with ?task_id=).
+    A 'lagged' event means log lines were dropped for this slow client; catch up via /tasks/{task_id}/logs.
+    """
+    if task_id is not None and task_id not in task_status_storage:
+        raise HTTPException(status_code=404, detail="Task not found")
+    subscriber = task_event_bus.subscribe(task_id)
+    return StreamingResponse(
+        task_event_bus.stream(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- NEW: Stop Task Endpoint ---
 @app.post("/api/v1/stop-task/{task_id}", tags=["Tasks"])
 async def stop_task(task_id: str):
@@ -1485,17 +1651,89 @@ async def stop_task(task_id: str):
     if task.get("stop_requested"):
         return {"message": "Task stop already requested.", "task_id": task_id}
 
-    # Set the flag and update status
-    task["stop_requested"] = True
-    update_task_log(task_id, "Stop request received by user.", status='stopping', level='info')
+    if await asyncio.to_thread(job_queue.request_cancel, task_id):
+        # No worker had picked it up yet
+        task["stop_requested"] = True
+        update_task_log(task_id, "Task stopped by user before it started.", status='stopped', level='warning')
+        return {"message": "Task stopped.", "task_id": task_id}
+
+    if task_status_storage.owns(task_id):
+        # Running in this process: set the flag, update status and cancel the job right away
+        task["stop_requested"] = True
+        update_task_log(task_id, "Stop request received by user.", status='stopping', level='info')
+        if job_worker is not None:
+            job_worker.cancel(task_id)
+    # Otherwise another worker process runs it and sees the request within STOP_POLL_INTERVAL_SECONDS
 
     return {"message": "Task stop request sent.", "task_id": task_id}
 
 
+# --- Resume Task Endpoint ---
+RESUMABLE_STATUSES = ('stopped', 'interrupted', 'failed')
+
+class ResumeTaskRequest(BaseModel):
+    # Keys are not stored in plaintext; resend the task's keys in their original order
+    private_keys: List[str] = Field(..., min_items=1)
+
+def first_incomplete_unit(task: Dict[str, Any], key_count: int, step_count: int) -> Optional[Dict[str, int]]:
+    """1-based key (and step, for workflows) the resumed task continues from; None if everything is done."""
+    completed_keys = task.get('completed_keys', {})
+    completed_steps = task.get('completed_steps', {})
+    for i in range(key_count):
+        if completed_keys.get(str(i)):
+            continue
+        done = completed_steps.get(str(i), {})
+        next_step = next((j for j in range(step_count) if str(j) not in done), 0)
+        return {"key": i + 1, "step": next_step + 1}
+    return None
+
+@app.post("/api/v1/tasks/{task_id}/resume", tags=["Tasks"])
+async def resume_task(task_id: str, request: ResumeTaskRequest):
+    """
+    Re-queues a stopped, interrupted or failed task. Keys (and workflow steps) that already
+    completed are skipped; failed keys are retried from their first incomplete step.
+    """
+    task = task_status_storage.get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task.get("status") not in RESUMABLE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Task is not in a resumable state (current: {task.get('status')})")
+    job_type = task.get("task_type")
+    if job_type not in JOB_RUNNERS:
+        raise HTTPException(status_code=400, detail=f"Task type '{job_type}' cannot be resumed")
+
+    key_addresses = task.get("key_addresses")
+    if key_addresses is not None and [_key_address(pk) for pk in request.private_keys] != key_addresses:
+        raise HTTPException(status_code=400, detail="private_keys do not match the task's keys (same keys, same order required)")
+
+    model, _ = JOB_RUNNERS[job_type]
+    try:
+        resumed_request = model(**{**task.get("config", {}), "private_keys": request.private_keys})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Stored task config is no longer valid: {e}")
+
+    step_count = len(task.get("config", {}).get("steps", [])) or 1
+    resume_from = first_incomplete_unit(task, len(request.private_keys), step_count)
+    if resume_from is None:
+        raise HTTPException(status_code=400, detail="Every key already completed; nothing to resume")
+
+    # Failed keys are retried; their finished steps stay checkpointed
+    task['completed_keys'] = {i: ok for i, ok in task.get('completed_keys', {}).items() if ok}
+    task['stop_requested'] = False
+    update_task_log(
+        task_id,
+        f"Resume requested: continuing from key {resume_from['key']}" + (f", step {resume_from['step']}" if job_type == "multi_step" else "") + ".",
+        status='pending',
+    )
+    if not await enqueue_task(task_id, job_type, resumed_request):
+        raise HTTPException(status_code=409, detail="Task is already queued or running")
+    return {"message": "Task resume queued.", "task_id": task_id, "resume_from": resume_from}
+
+
 # --- Bot Action Endpoints ---
 
 @app.post("/api/v1/start-stake-cycle", tags=["Bot Actions"])
-async def start_stake_bot(request: StakeRequest, background_tasks: BackgroundTasks):
+async def start_stake_bot(request: StakeRequest):
     """Starts the stake/unstake bot cycles in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Stake Cycle ({request.contract_type})"
@@ -1510,12 +1748,12 @@ async def start_stake_bot(request: StakeRequest, background_tasks: BackgroundTas
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_stake_cycle_task, task_id, request)
+    await enqueue_task(task_id, "stake", request)
     return {"message": "Stake bot cycle initiated in background.", "task_id": task_id}
 
 
 @app.post("/api/v1/start-swap", tags=["Bot Actions"])
-async def start_swap_bot(request: SwapRequest, background_tasks: BackgroundTasks):
+async def start_swap_bot(request: SwapRequest):
     """Starts swap operations in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Swap ({request.token_from_symbol} -> {request.token_to_symbol})"
@@ -1530,12 +1768,12 @@ async def start_swap_bot(request: SwapRequest, background_tasks: BackgroundTasks
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_swap_task, task_id, request)
+    await enqueue_task(task_id, "swap", request)
     return {"message": "Swap operations initiated in background.", "task_id": task_id}
 
 
 @app.post("/api/v1/start-deploy", tags=["Bot Actions"])
-async def start_deploy_bot(request: DeployRequest, background_tasks: BackgroundTasks):
+async def start_deploy_bot(request: DeployRequest):
     """Starts contract deployment operations in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Deploy ({request.contract_name})"
@@ -1550,12 +1788,12 @@ async def start_deploy_bot(request: DeployRequest, background_tasks: BackgroundT
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_deploy_task, task_id, request)
+    await enqueue_task(task_id, "deploy", request)
     return {"message": "Contract deployment initiated in background.", "task_id": task_id}
 
 
 @app.post("/api/v1/start-send", tags=["Bot Actions"])
-async def start_send_bot(request: SendRequest, background_tasks: BackgroundTasks):
+async def start_send_bot(request: SendRequest):
     """Starts MON sending operations in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Send MON ({request.mode})"
@@ -1570,12 +1808,12 @@ async def start_send_bot(request: SendRequest, background_tasks: BackgroundTasks
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_send_task, task_id, request)
+    await enqueue_task(task_id, "send", request)
     return {"message": "MON sending initiated in background.", "task_id": task_id}
 
 # --- NEW: Bebop API Endpoint --- #
 @app.post("/api/v1/start-bebop", tags=["Bot Actions"])
-async def start_bebop_bot(request: BebopRequest, background_tasks: BackgroundTasks):
+async def start_bebop_bot(request: BebopRequest):
     """Starts Bebop MON wrap/unwrap operations in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Bebop Wrap/Unwrap ({request.amount_mon} MON)"
@@ -1590,12 +1828,12 @@ async def start_bebop_bot(request: BebopRequest, background_tasks: BackgroundTas
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_bebop_task, task_id, request)
+    await enqueue_task(task_id, "bebop", request)
     return {"message": "Bebop wrap/unwrap task initiated in background.", "task_id": task_id}
 
 # --- NEW: Izumi API Endpoint --- #
 @app.post("/api/v1/start-izumi", tags=["Bot Actions"])
-async def start_izumi_bot(request: IzumiRequest, background_tasks: BackgroundTasks):
+async def start_izumi_bot(request: IzumiRequest):
     """Starts Izumi MON wrap/unwrap operations in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Izumi Wrap/Unwrap ({request.amount_mon} MON)"
@@ -1610,12 +1848,12 @@ async def start_izumi_bot(request: IzumiRequest, background_tasks: BackgroundTas
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_izumi_task, task_id, request)
+    await enqueue_task(task_id, "izumi", request)
     return {"message": "Izumi wrap/unwrap task initiated in background.", "task_id": task_id}
 
 # --- NEW: Lilchogstars API Endpoint --- #
 @app.post("/api/v1/start-lilchogstars", tags=["Bot Actions"])
-async def start_lilchogstars_bot(request: LilchogstarsRequest, background_tasks: BackgroundTasks):
+async def start_lilchogstars_bot(request: LilchogstarsRequest):
     """Starts Lilchogstars NFT minting in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Lilchogstars Mint (Qty: {request.quantity})"
@@ -1630,12 +1868,12 @@ async def start_lilchogstars_bot(request: LilchogstarsRequest, background_tasks:
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_lilchogstars_task, task_id, request)
+    await enqueue_task(task_id, "lilchogstars", request)
     return {"message": "Lilchogstars mint task initiated in background.", "task_id": task_id}
 
 # --- NEW: Mono API Endpoint --- #
 @app.post("/api/v1/start-mono", tags=["Bot Actions"])
-async def start_mono_bot(request: MonoRequest, background_tasks: BackgroundTasks):
+async def start_mono_bot(request: MonoRequest):
     """Starts the Mono transaction task in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Mono Transaction"
@@ -1650,12 +1888,12 @@ async def start_mono_bot(request: MonoRequest, background_tasks: BackgroundTasks
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_mono_task, task_id, request)
+    await enqueue_task(task_id, "mono", request)
     return {"message": "Mono transaction task initiated in background.", "task_id": task_id}
 
 # --- NEW: Rubic API Endpoint --- #
 @app.post("/api/v1/start-rubic", tags=["Bot Actions"])
-async def start_rubic_bot(request: RubicRequest, background_tasks: BackgroundTasks):
+async def start_rubic_bot(request: RubicRequest):
     """Starts the Rubic swap (MON to USDT) task in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Rubic Swap ({request.amount_mon} MON -> USDT)"
@@ -1670,12 +1908,12 @@ async def start_rubic_bot(request: RubicRequest, background_tasks: BackgroundTas
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_rubic_task, task_id, request)
+    await enqueue_task(task_id, "rubic", request)
     return {"message": "Rubic swap task initiated in background.", "task_id": task_id}
 
 # --- NEW: Ambient API Endpoint --- #
 @app.post("/api/v1/start-ambient", tags=["Bot Actions"])
-async def start_ambient_bot(request: AmbientRequest, background_tasks: BackgroundTasks):
+async def start_ambient_bot(request: AmbientRequest):
     """Starts the Ambient swap task in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Ambient Swap ({request.token_in_symbol} -> {request.token_out_symbol})"
@@ -1690,12 +1928,12 @@ async def start_ambient_bot(request: AmbientRequest, background_tasks: Backgroun
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_ambient_task, task_id, request)
+    await enqueue_task(task_id, "ambient", request)
     return {"message": "Ambient swap task initiated in background.", "task_id": task_id}
 
 # --- NEW: Apriori API Endpoint --- #
 @app.post("/api/v1/start-apriori", tags=["Bot Actions"])
-async def start_apriori_bot(request: AprioriRequest, background_tasks: BackgroundTasks):
+async def start_apriori_bot(request: AprioriRequest):
     """Starts the Apriori full cycle task in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Apriori Full Cycle"
@@ -1710,12 +1948,12 @@ async def start_apriori_bot(request: AprioriRequest, background_tasks: Backgroun
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_apriori_task, task_id, request)
+    await enqueue_task(task_id, "apriori", request)
     return {"message": "Apriori full cycle task initiated in background.", "task_id": task_id}
 
 # --- NEW: Bean API Endpoint --- #
 @app.post("/api/v1/start-bean", tags=["Bot Actions"])
-async def start_bean_bot(request: BeanRequest, background_tasks: BackgroundTasks):
+async def start_bean_bot(request: BeanRequest):
     """Starts the Bean swap task in the background."""
     task_id = str(uuid.uuid4())
     swap_dir = "MON->Token" if request.direction == 'to_token' else f"{request.token_symbol}->MON"
@@ -1731,12 +1969,12 @@ async def start_bean_bot(request: BeanRequest, background_tasks: BackgroundTasks
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_bean_task, task_id, request)
+    await enqueue_task(task_id, "bean", request)
     return {"message": "Bean swap task initiated in background.", "task_id": task_id}
 
 # --- NEW: Bima API Endpoint --- #
 @app.post("/api/v1/start-bima", tags=["Bot Actions"])
-async def start_bima_bot(request: BimaRequest, background_tasks: BackgroundTasks):
+async def start_bima_bot(request: BimaRequest):
     """Starts the Bima lend cycle task in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Bima Lend Cycle ({request.percent_to_lend})"
@@ -1751,7 +1989,7 @@ async def start_bima_bot(request: BimaRequest, background_tasks: BackgroundTasks
         "logs": []
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_bima_task, task_id, request)
+    await enqueue_task(task_id, "bima", request)
     return {"message": "Bima lend cycle task initiated in background.", "task_id": task_id}
 
 # --- NEW: Pydantic Models for Multi-Step Workflow ---
@@ -1765,6 +2003,7 @@ class StakeStepConfig(StakeRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True) # Delay between cycles within a single key might be handled differently or removed
     task_description: Optional[str] = Field(None, exclude=True)
     # Add specific fields required only for stake step config
@@ -1779,6 +2018,7 @@ class SwapStepConfig(SwapRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     # Add specific fields required only for swap step config
@@ -1792,6 +2032,7 @@ class DeployStepConfig(DeployRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     # Add specific fields required only for deploy step config
@@ -1803,6 +2044,7 @@ class SendStepConfig(SendRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     # Add specific fields required only for send step config
@@ -1815,6 +2057,7 @@ class BebopStepConfig(BebopRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     amount_mon: float
@@ -1823,6 +2066,7 @@ class IzumiStepConfig(IzumiRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     amount_mon: float
@@ -1831,6 +2075,7 @@ class LilchogstarsStepConfig(LilchogstarsRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     quantity: int
@@ -1839,6 +2084,7 @@ class MonoStepConfig(MonoRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     recipient_address: str
@@ -1848,6 +2094,7 @@ class RubicStepConfig(RubicRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     amount_mon: float
@@ -1856,6 +2103,7 @@ class AmbientStepConfig(AmbientRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     token_in_symbol: Optional[str]
@@ -1866,6 +2114,7 @@ class AprioriStepConfig(AprioriRequest): # Assuming Apriori cycle takes no speci
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
 
@@ -1873,6 +2122,7 @@ class BeanStepConfig(BeanRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     direction: Literal['to_token', 'to_mon']
@@ -1883,6 +2133,7 @@ class BimaStepConfig(BimaRequest):
     private_keys: Optional[List[str]] = Field(None, exclude=True)
     rpc_url: Optional[str] = Field(None, exclude=True)
     delay_between_keys_seconds: Optional[int] = Field(None, exclude=True)
+    max_parallel_keys: Optional[int] = Field(None, exclude=True)
     delay_between_cycles_seconds: Optional[int] = Field(None, exclude=True)
     task_description: Optional[str] = Field(None, exclude=True)
     percent_to_lend: Optional[List[float]]
@@ -1917,10 +2168,21 @@ class MultiStepWorkflowRequest(BaseModel):
     rpc_url: Optional[str] = None
     task_description: Optional[str] = "Multi-Step Workflow"
     delay_between_keys_seconds: int = Field(default=60, ge=0)
+    max_parallel_keys: int = Field(default=1, ge=1) # Keys processed concurrently (1 = one after another)
+    priority: int = 0 # See BaseBotRequest
+    weight: float = Field(default=1.0, gt=0)
     steps: List[Step] = Field(..., min_items=1)
 
 
 # --- NEW: Background Task Function for Multi-Step Workflow ---
+def step_tx_hashes(result: Dict[str, Any]) -> List[str]:
+    """Transaction hashes reported by a step result ('tx_hash', 'swap_tx_hash', apriori's 'stake_tx', ...)."""
+    hashes = []
+    for key, value in result.items():
+        if (key == 'tx_hash' or key.endswith('_tx_hash') or key.endswith('_tx')) and value:
+            hashes.append(value.hex() if isinstance(value, (bytes, bytearray)) else str(value))
+    return hashes
+
 async def run_multi_step_task(
     task_id: str,
     request: MultiStepWorkflowRequest,
@@ -1931,7 +2193,7 @@ async def run_multi_step_task(
 
     w3 = None
     try:
-        w3 = get_w3_connection(request.rpc_url)
+        w3 = await get_w3_connection(request.rpc_url)
         update_task_log(task_id, f"Connected to RPC: {w3.provider.endpoint_uri}")
         rpc_to_use = w3.provider.endpoint_uri
     except HTTPException as e:
@@ -1943,25 +2205,28 @@ async def run_multi_step_task(
         update_task_log(task_id, f"An unexpected error occurred during RPC connection: {e}\\nTraceback:\\n{tb_str}", status='failed', level='error')
         return
 
-    overall_success = True
-    for i, pk in enumerate(request.private_keys):
+    # Checkpoint of finished steps: completed_steps[key index][step index] = {tx_hashes, completed_at}
+    completed_steps: Dict[str, Dict[str, Any]] = task_status_storage[task_id].setdefault('completed_steps', {})
+
+    async def process_key(i: int, pk: str) -> bool:
+        key_success = True
         key_prefix = f"[Key {i+1}/{len(request.private_keys)}]"
         update_task_log(task_id, f"{key_prefix} Processing key...")
-
-        # Check for stop request before starting steps for this key
-        if task_status_storage.get(task_id, {}).get('stop_requested'):
-            update_task_log(task_id, "Task execution stopped by user before processing key.", status='stopped', level='warning')
-            return
+        key_checkpoint = completed_steps.setdefault(str(i), {})
 
         key_step_success = True # Track success for the current key across all steps
         for step_index, step in enumerate(request.steps):
             step_prefix = f"{key_prefix} [Step {step_index+1}/{len(request.steps)} ({step.type})]"
+            done = key_checkpoint.get(str(step_index))
+            if done is not None:
+                update_task_log(task_id, f"{step_prefix} Already completed{' (tx ' + ', '.join(done['tx_hashes']) + ')' if done['tx_hashes'] else ''}, skipping.")
+                continue
             update_task_log(task_id, f"{step_prefix} Starting step...")
 
             # Check for stop request before each step
             if task_status_storage.get(task_id, {}).get('stop_requested'):
                 update_task_log(task_id, f"{step_prefix} Task execution stopped by user.", status='stopped', level='warning')
-                return
+                return False
 
             step_result = {'success': False, 'message': 'Step not executed', 'logs': []}
             config_data = step.config or {}
@@ -2134,14 +2399,20 @@ async def run_multi_step_task(
 
                 if not step_result.get('success'):
                     key_step_success = False
-                    overall_success = False
+                    key_success = False
                     update_task_log(task_id, f"{step_prefix} Step failed. Stopping steps for this key.", level='warning')
                     break # Stop processing further steps for this key if one fails
 
+                key_checkpoint[str(step_index)] = {
+                    "tx_hashes": step_tx_hashes(step_result),
+                    "completed_at": datetime.now(timezone.utc).isoformat(),
+                }
+                task_status_storage.save(task_id)
+
             else:
                 # Should not happen if logic is correct, but handle defensively
                 key_step_success = False
-                overall_success = False
+                key_success = False
                 update_task_log(task_id, f"{step_prefix} Step execution returned None or unexpected result.", level='error')
                 break
 
@@ -2151,15 +2422,11 @@ async def run_multi_step_task(
 
         # End of steps loop for one key
 
-        # Wait between keys if specified and not the last key
-        if i < len(request.private_keys) - 1 and request.delay_between_keys_seconds > 0:
-             # Check before sleeping
-             if task_status_storage.get(task_id, {}).get('stop_requested'):
-                 update_task_log(task_id, "Task execution stopped by user.", status='stopped', level='warning')
-                 return # Exit the function
-             wait_msg = f"Waiting {request.delay_between_keys_seconds}s before next key..."
-             update_task_log(task_id, wait_msg)
-             await asyncio.sleep(request.delay_between_keys_seconds)
+        return key_success
+
+    overall_success = await run_for_each_key(
+        task_id, request.private_keys, request.delay_between_keys_seconds, request.max_parallel_keys, process_key
+    )
 
     # End of keys loop
     # Only update final status if not stopped
@@ -2174,7 +2441,7 @@ async def run_multi_step_task(
 
 # --- NEW: Multi-Step Workflow Endpoint ---
 @app.post("/api/v1/start-multi-step-workflow", tags=["Bot Actions"])
-async def start_multi_step_workflow(request: MultiStepWorkflowRequest, background_tasks: BackgroundTasks):
+async def start_multi_step_workflow(request: MultiStepWorkflowRequest):
     """Starts a multi-step workflow in the background."""
     task_id = str(uuid.uuid4())
     desc = request.task_description or f"Multi-Step Workflow ({len(request.steps)} steps)"
@@ -2192,15 +2459,190 @@ async def start_multi_step_workflow(request: MultiStepWorkflowRequest, backgroun
         "config": { # Store non-sensitive config
             "rpc_url": request.rpc_url,
             "delay_between_keys_seconds": request.delay_between_keys_seconds,
+            "max_parallel_keys": request.max_parallel_keys,
+            "priority": request.priority,
+            "weight": request.weight,
             "steps": [step.model_dump() for step in request.steps] # Store steps config
         },
         "logs": [],
         "stop_requested": False # Ensure stop flag is initialized
     }
     update_task_log(task_id, f"Task '{desc}' created with ID: {task_id}. Queued for execution.")
-    background_tasks.add_task(run_multi_step_task, task_id, request)
+    await enqueue_task(task_id, "multi_step", request)
     return {"message": "Multi-step workflow initiated in background.", "task_id": task_id}
 
 
+# --- Job Queue --- #
+# Tasks are queued in SQLite and run by JobWorkers: one embedded in each API process (unless
+# EMBEDDED_WORKER=0) and any number of standalone ones (python api/worker.py).
+# Private keys are never written to the queue in plaintext. By default they stay in the memory
+# of the API process that received them and its embedded worker runs the task; if that process
+# goes away the task is marked interrupted and needs POST /api/v1/tasks/{id}/resume with its keys.
+# Setting TASK_KEYS_PASSWORD (opt-in) stores them encrypted (keystore v3) in the job instead, so
+# any worker started with the same password can run or take over the task.
+EMBEDDED_WORKER = os.environ.get('EMBEDDED_WORKER', '1') != '0'
+TASK_KEYS_PASSWORD = os.environ.get('TASK_KEYS_PASSWORD') or None
+KEYSTORE_SCRYPT_N = 2 ** 14 # scrypt cost per key (~0.1s); the password is the operator's, not a user's
+TASK_SYNC_INTERVAL_SECONDS = 0.5 # How often this process picks up task updates written by other workers
+
+# job_type -> (request model, runner)
+JOB_RUNNERS: Dict[str, tuple] = {
+    "stake": (StakeRequest, run_stake_cycle_task),
+    "swap": (SwapRequest, run_swap_task),
+    "deploy": (DeployRequest, run_deploy_task),
+    "send": (SendRequest, run_send_task),
+    "bebop": (BebopRequest, run_bebop_task),
+    "izumi": (IzumiRequest, run_izumi_task),
+    "lilchogstars": (LilchogstarsRequest, run_lilchogstars_task),
+    "mono": (MonoRequest, run_mono_task),
+    "rubic": (RubicRequest, run_rubic_task),
+    "ambient": (AmbientRequest, run_ambient_task),
+    "apriori": (AprioriRequest, run_apriori_task),
+    "bean": (BeanRequest, run_bean_task),
+    "bima": (BimaRequest, run_bima_task),
+    "multi_step": (MultiStepWorkflowRequest, run_multi_step_task),
+}
+
+job_worker: Optional[JobWorker] = None
+_background_loops: List[asyncio.Task] = []
+_task_private_keys: Dict[str, List[str]] = {} # task_id -> keys, for jobs pinned to this process's worker
+
+def encrypt_private_keys(private_keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+    # Invalid keys can't be encrypted; they come back as '' and the runner reports them
+    return [Account.encrypt(pk, TASK_KEYS_PASSWORD, iterations=KEYSTORE_SCRYPT_N) if _key_address(pk) else None for pk in private_keys]
+
+def decrypt_private_keys(keystores: List[Optional[Dict[str, Any]]]) -> List[str]:
+    if TASK_KEYS_PASSWORD is None:
+        raise ValueError("Task keys are encrypted; start this worker with the same TASK_KEYS_PASSWORD as the API")
+    try:
+        return ['0x' + bytes(Account.decrypt(keystore, TASK_KEYS_PASSWORD)).hex() if keystore else '' for keystore in keystores]
+    except ValueError as e:
+        raise ValueError(f"Could not decrypt task keys ({e}); TASK_KEYS_PASSWORD must match the API's") from None
+
+async def enqueue_task(task_id: str, job_type: str, request: BaseModel) -> bool:
+    """Queues a created (or resumed) task; a worker (this process or another) picks it up."""
+    task = task_status_storage[task_id]
+    # Public addresses only: lets /resume check it was given the same keys, in the same order
+    task['key_addresses'] = [_key_address(pk) for pk in request.private_keys]
+    task_status_storage.save(task_id)
+    payload = request.model_dump(exclude={'private_keys'})
+    pinned_to = None
+    if TASK_KEYS_PASSWORD is not None:
+        payload['encrypted_private_keys'] = await asyncio.to_thread(encrypt_private_keys, request.private_keys)
+    elif job_worker is not None:
+        # Keys stay in this process; only its worker can run the task
+        _task_private_keys[task_id] = list(request.private_keys)
+        pinned_to = job_worker.worker_id
+    else:
+        update_task_log(task_id, "No worker can run this task: set TASK_KEYS_PASSWORD or enable EMBEDDED_WORKER.", status='failed', level='error')
+        raise HTTPException(status_code=503, detail="Task keys are kept in memory but this API process runs no worker (EMBEDDED_WORKER=0); set TASK_KEYS_PASSWORD to hand tasks to standalone workers")
+    def enqueue() -> bool:
+        task_status_storage.flush() # The worker may be another process: the task row must be on disk first
+        return job_queue.enqueue(task_id, job_type, payload, pinned_to=pinned_to)
+    queued = await asyncio.to_thread(enqueue)
+    if queued and job_worker is not None:
+        job_worker.wake()
+    return queued
+
+async def run_job(job: Job) -> None:
+    """Runs one claimed job: takes over the task's record and calls its runner."""
+    model, run_fn = JOB_RUNNERS[job.job_type]
+    task = await asyncio.to_thread(task_status_storage.adopt, job.task_id)
+    if task is None:
+        print(f"Warning: Job for unknown task {job.task_id} skipped.")
+        return
+    try:
+        if task.get('status') in ('completed', 'failed', 'stopped'):
+            return
+        payload = dict(job.payload)
+        payload.pop('private_keys', None) # Jobs queued by older versions carried them in plaintext; never used
+        encrypted_keys = payload.pop('encrypted_private_keys', None)
+        if encrypted_keys is not None:
+            private_keys = await asyncio.to_thread(decrypt_private_keys, encrypted_keys)
+        else:
+            private_keys = _task_private_keys.get(job.task_id)
+        if private_keys is None:
+            update_task_log(job.task_id, f"Private keys for this task are no longer available (they are only kept in memory). Resume it with POST /api/v1/tasks/{job.task_id}/resume.", status='interrupted', level='warning')
+            return
+        if task.get('status') != 'pending':
+            # An earlier worker started it and went away (crash, restart or shutdown)
+            update_task_log(job.task_id, f"Resuming task on worker {job_worker.worker_id if job_worker else 'process'} (attempt {job.attempts}).", level='warning')
+        request = model(**payload, private_keys=private_keys)
+        try:
+            with tx_scheduler.flow(job.task_id, weight=request.weight, priority=request.priority):
+                await run_fn(job.task_id, request)
+        except asyncio.CancelledError:
+            # Cancelled mid-await by a stop (or by worker shutdown, which hands the job back)
+            if task.get('stop_requested') and task.get('status') != 'stopped':
+                update_task_log(job.task_id, "Task execution stopped by user.", status='stopped', level='warning')
+            raise
+        if task.get('stop_requested') and task.get('status') == 'stopping':
+            # The stop arrived after the last key: nothing was left to interrupt
+            update_task_log(job.task_id, "Task execution stopped by user.", status='stopped', level='warning')
+    finally:
+        _task_private_keys.pop(job.task_id, None)
+        task_status_storage.release(job.task_id)
+
+def on_job_stop(task_id: str) -> None:
+    """A stop was requested (possibly via another API process) for a job running here; the worker then cancels it."""
+    task = task_status_storage.get(task_id)
+    if not task or task.get('stop_requested'):
+        return
+    task['stop_requested'] = True
+    update_task_log(task_id, "Stop request received by user.", status='stopping', level='info')
+
+async def on_job_error(task_id: str, message: str) -> None:
+    if await asyncio.to_thread(task_status_storage.adopt, task_id) is None:
+        return
+    update_task_log(task_id, message, status='failed', level='error')
+    task_status_storage.release(task_id)
+
+async def on_job_orphaned(task_id: str) -> None:
+    """The process holding the task's keys went away; the task waits for a resume with its keys."""
+    task = await asyncio.to_thread(task_status_storage.adopt, task_id)
+    if task is None:
+        return
+    if task.get('status') in ACTIVE_STATUSES:
+        update_task_log(task_id, f"Task was interrupted: the process holding its private keys stopped. Resume it with POST /api/v1/tasks/{task_id}/resume.", status='interrupted', level='warning')
+    task_status_storage.release(task_id)
+
+async def sync_task_changes() -> None:
+    """Merges task updates and log lines written by other processes and pushes them to SSE subscribers."""
+    while True:
+        await asyncio.sleep(TASK_SYNC_INTERVAL_SECONDS)
+        try:
+            task_rows, log_rows = await asyncio.to_thread(task_status_storage.read_changes)
+        except sqlite3.Error as e:
+            print(f"Warning: Task sync failed: {e}")
+            continue
+        active_task_ids = set()
+        for event in task_status_storage.apply_changes(task_rows, log_rows):
+            task_event_bus.publish(event)
+            active_task_ids.add(event['task_id'])
+        # Other processes' sends only invalidate their own balance cache; drop ours for the wallets they use
+        for task_id in active_task_ids:
+            for address in task_status_storage.get(task_id, {}).get('key_addresses') or []:
+                balance_cache.invalidate(address)
+
+@app.on_event("startup")
+async def start_job_worker():
+    global job_worker
+    _background_loops.append(asyncio.create_task(sync_task_changes()))
+    if EMBEDDED_WORKER:
+        job_worker = JobWorker(job_queue, run_job, on_job_stop, on_job_error, on_orphan=on_job_orphaned)
+        _background_loops.append(asyncio.create_task(job_worker.run()))
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    """Hands running jobs back to the queue (with TASK_KEYS_PASSWORD the next worker resumes them; otherwise they wait for /resume)."""
+    if job_worker is not None:
+        await job_worker.close()
+    for loop_task in _background_loops:
+        loop_task.cancel()
+    await asyncio.gather(*_background_loops, return_exceptions=True)
+    task_status_storage.flush()
+
+
 # Example of how to run the app (e.g., using uvicorn)
-# uvicorn backend.api.main:app --reload --port 8000
\ No newline at end of file
+# uvicorn backend.api.main:app --reload --port 8000
+# Extra worker processes (same host, same TASK_DB_PATH): python backend/api/worker.py
\ No newline at end of file
@@ -0,0 +1,134 @@
+import json
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+# Constants
+SUBSCRIBER_QUEUE_SIZE = 256 # Events buffered per subscriber before we start dropping/coalescing
+HEARTBEAT_INTERVAL_SECONDS = 15 # SSE comment line so proxies don't close idle streams
+
+
+class TaskEventSubscriber:
+    """
+    One live stream (one SSE connection).
+
+    Events go into a bounded queue. When the consumer falls behind and the queue is full,
+    status events are coalesced (only the latest status per task is kept) and log events
+    are dropped and counted; the consumer is then told how many it missed so it can
+    catch up through /api/v1/tasks/{task_id}/logs?after=<seq>. A task's status never
+    goes out before an older status of the same task: a coalesced status replaces the
+    ones still queued, or waits until the queue has drained.
+    """
+
+    def __init__(self, task_id: Optional[str], loop: asyncio.AbstractEventLoop, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.task_id = task_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.coalesced_status: Dict[str, Dict[str, Any]] = {}
+        self.dropped_logs = 0
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        return self.task_id is None or event.get('task_id') == self.task_id
+
+    def offer(self, event: Dict[str, Any]) -> None:
+        """Non-blocking enqueue; must run on the subscriber's loop."""
+        is_status = event['type'] == 'status'
+        if is_status and self.queue.full():
+            self._drop_queued_statuses(event['task_id']) # Superseded by this one; frees room if there were any
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if is_status:
+                self.coalesced_status[event['task_id']] = event
+            else:
+                self.dropped_logs += 1
+            return
+        if is_status:
+            self.coalesced_status.pop(event['task_id'], None) # Older than the one just queued
+
+    def _drop_queued_statuses(self, task_id: str) -> None:
+        kept = []
+        while not self.queue.empty():
+            queued = self.queue.get_nowait()
+            if not (queued['type'] == 'status' and queued['task_id'] == task_id):
+                kept.append(queued)
+        for queued in kept:
+            self.queue.put_nowait(queued)
+
+    def drain_overflow(self) -> list:
+        """
+        Events owed to a slow consumer: a 'lagged' notice, and the latest coalesced statuses
+        once the queue is empty (the queue may still hold older statuses of those tasks).
+        """
+        owed = []
+        if self.dropped_logs:
+            owed.append({"type": "lagged", "dropped": self.dropped_logs})
+            self.dropped_logs = 0
+        if self.coalesced_status and self.queue.empty():
+            owed.extend(self.coalesced_status.values())
+            self.coalesced_status = {}
+        return owed
+
+
+class TaskEventBus:
+    """Fan-out of task log/status events to live subscribers (SSE streams)."""
+
+    def __init__(self):
+        self._subscribers: Set[TaskEventSubscriber] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, task_id: Optional[str] = None) -> TaskEventSubscriber:
+        subscriber = TaskEventSubscriber(task_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: TaskEventSubscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Delivers event to every matching subscriber without ever blocking the publisher."""
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.wants(event)]
+        if not subscribers:
+            return
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        for subscriber in subscribers:
+            if subscriber.loop is current_loop:
+                subscriber.offer(event)
+            else:
+                # Published from a worker thread (or another loop): hand off to the subscriber's loop
+                try:
+                    subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+                except RuntimeError:
+                    self.unsubscribe(subscriber) # Loop closed
+
+    async def stream(self, subscriber: TaskEventSubscriber, is_disconnected) -> AsyncIterator[str]:
+        """Yields SSE-formatted frames for subscriber until the client disconnects."""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                for owed in subscriber.drain_overflow():
+                    yield _format_sse(owed)
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _format_sse(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    lines = [f"event: {event['type']}"]
+    if event['type'] == 'log':
+        lines.append(f"id: {event['task_id']}:{event['seq']}")
+    lines.append(f"data: {json.dumps(event, default=str)}")
+    return "\n".join(lines) + "\n\n"
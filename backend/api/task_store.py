@@ -0,0 +1,421 @@
+import os
+import json
+import queue
+import atexit
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# Constants
+DEFAULT_TASK_DB_PATH = os.environ.get(
+    'TASK_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'tasks.sqlite3'),
+)
+MAX_LOGS_IN_MEMORY = 1000 # Ring buffer size per task; older entries stay on disk only
+WRITER_BATCH_SIZE = 500 # Max queued writes committed in one transaction
+ACTIVE_STATUSES = ("pending", "running", "stopping")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id    TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    version    INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS task_version (
+    id    INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO task_version (id, value) VALUES (0, 0);
+CREATE TABLE IF NOT EXISTS task_logs (
+    task_id   TEXT NOT NULL,
+    seq       INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    level     TEXT NOT NULL,
+    message   TEXT NOT NULL,
+    PRIMARY KEY (task_id, seq)
+);
+"""
+# Every write transaction takes the next value of one shared counter; rows it saves get that
+# version. The write lock orders transactions, so versions grow in commit order across processes
+# (unlike a timestamp taken when the write was queued) and read_changes() can't skip a row.
+_BUMP_VERSION = "UPDATE task_version SET value = value + 1"
+_CURRENT_VERSION = "(SELECT value FROM task_version)"
+
+
+class TaskStore:
+    """
+    Task metadata and logs, kept in memory and persisted to SQLite (WAL mode).
+
+    Behaves like the dict it replaces (get / [] / in / copy), so existing handlers keep
+    working. Each task's 'logs' is a bounded deque, so appending is O(1) and never
+    copies the list. Every log line is also appended as a row in task_logs. Disk writes
+    are queued to a single writer thread, which keeps SQLite I/O off the event loop.
+
+    Several processes (API workers, job workers) can share one database. Each task has
+    a single writer at a time: the process that runs it adopt()s it, and the others
+    pick up its metadata and log lines with read_changes() / apply_changes().
+    keep_active(task_id) tells the startup scan which active tasks are still owned by
+    someone (e.g. have a live job) and must not be marked interrupted.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_TASK_DB_PATH,
+        max_logs: int = MAX_LOGS_IN_MEMORY,
+        keep_active: Optional[Callable[[str], bool]] = None,
+    ):
+        self.db_path = db_path
+        self.max_logs = max_logs
+        self.keep_active = keep_active
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._log_seq: Dict[str, int] = {} # Last seq handed out per task
+        self._level_counts: Dict[str, Dict[str, int]] = {} # Log entries per level, per task (full history)
+        self._owned: Set[str] = set() # Tasks this process runs (their rows on disk are ours; never merged back)
+        self._synced_log_rowid = 0 # Watermarks for read_changes()
+        self._synced_version = 0
+        self._lock = threading.Lock()
+        self._write_queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False) # timeout: other processes may hold the write lock
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # WAL + NORMAL: durable across app crashes, no fsync per commit
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self._conn.commit()
+        # Separate connection for request-time reads; WAL lets it read while the writer commits
+        self._read_conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._read_lock = threading.Lock()
+
+        self._load()
+        self._writer = threading.Thread(target=self._writer_loop, name="task-store-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # --- Startup --- #
+    def _migrate(self) -> None:
+        """Brings databases created by older versions up to the current schema."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+        if 'version' not in columns:
+            self._conn.execute("ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_by_version ON tasks (version)")
+
+    def _read_task(self, conn: sqlite3.Connection, task_id: str, data: str) -> None:
+        """Loads one task (metadata, latest logs, counters) from disk into memory."""
+        task = json.loads(data)
+        rows = conn.execute(
+            "SELECT seq, timestamp, level, message FROM task_logs WHERE task_id = ? ORDER BY seq DESC LIMIT ?",
+            (task_id, self.max_logs),
+        ).fetchall()
+        task['logs'] = deque(
+            ({"seq": seq, "timestamp": ts, "level": level, "message": message} for seq, ts, level, message in reversed(rows)),
+            maxlen=self.max_logs,
+        )
+        level_counts = dict(conn.execute(
+            "SELECT level, COUNT(*) FROM task_logs WHERE task_id = ? GROUP BY level", (task_id,),
+        ).fetchall())
+        with self._lock:
+            self._log_seq[task_id] = rows[0][0] if rows else 0
+            self._level_counts[task_id] = level_counts
+            existing = self._tasks.get(task_id)
+            if existing is None:
+                self._tasks[task_id] = task
+            else:
+                # Keep the dict's identity: handlers may hold a reference to it
+                existing.clear()
+                existing.update(task)
+
+    def _load(self) -> None:
+        """Restores tasks from disk; tasks that were active when their process died are marked interrupted."""
+        now = datetime.now(timezone.utc).isoformat()
+        interrupted = []
+        for task_id, data, version in self._conn.execute("SELECT task_id, data, version FROM tasks").fetchall():
+            self._read_task(self._conn, task_id, data)
+            self._synced_version = max(self._synced_version, version)
+            if self._tasks[task_id].get('status') in ACTIVE_STATUSES and not (self.keep_active and self.keep_active(task_id)):
+                interrupted.append(task_id)
+        self._synced_log_rowid = self._conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM task_logs").fetchone()[0]
+
+        if interrupted:
+            self._conn.execute(_BUMP_VERSION)
+        for task_id in interrupted:
+            task = self._tasks[task_id]
+            task['status'] = 'interrupted'
+            task['last_updated'] = now
+            seq = self._log_seq[task_id] + 1
+            self._log_seq[task_id] = seq
+            entry = {"seq": seq, "timestamp": now, "level": "warning", "message": "Task was interrupted by a server restart."}
+            task['logs'].append(entry)
+            counts = self._level_counts[task_id]
+            counts['warning'] = counts.get('warning', 0) + 1
+            self._conn.execute(
+                "INSERT OR IGNORE INTO task_logs (task_id, seq, timestamp, level, message) VALUES (?, ?, ?, ?, ?)",
+                (task_id, seq, now, entry['level'], entry['message']),
+            )
+            self._conn.execute(
+                f"UPDATE tasks SET data = ?, updated_at = ?, version = {_CURRENT_VERSION} WHERE task_id = ?",
+                (self._serialize_meta(task), now, task_id),
+            )
+        self._conn.commit()
+
+    # --- Multi-process --- #
+    def adopt(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Re-reads a task from disk and makes this process its writer (call before running it)."""
+        self.flush()
+        with self._read_lock:
+            row = self._read_conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                return None
+            self._read_task(self._read_conn, task_id, row[0])
+        self._owned.add(task_id)
+        return self._tasks[task_id]
+
+    def release(self, task_id: str) -> None:
+        """This process no longer writes the task; later changes by others are merged in again."""
+        self._owned.discard(task_id)
+
+    def owns(self, task_id: str) -> bool:
+        return task_id in self._owned
+
+    def read_changes(self) -> Tuple[list, list]:
+        """Task rows and log rows written since the last call (by any process). Blocking; run off the event loop."""
+        with self._read_lock:
+            task_rows = self._read_conn.execute(
+                "SELECT task_id, data, version FROM tasks WHERE version > ? ORDER BY version",
+                (self._synced_version,),
+            ).fetchall()
+            log_rows = self._read_conn.execute(
+                "SELECT rowid, task_id, seq, timestamp, level, message FROM task_logs WHERE rowid > ? ORDER BY rowid",
+                (self._synced_log_rowid,),
+            ).fetchall()
+        if task_rows:
+            self._synced_version = task_rows[-1][2]
+        if log_rows:
+            self._synced_log_rowid = log_rows[-1][0]
+        return task_rows, log_rows
+
+    def apply_changes(self, task_rows: list, log_rows: list) -> List[Dict[str, Any]]:
+        """
+        Merges rows from read_changes() written by other processes into memory and returns
+        them as task events ('status' / 'log') for live subscribers. Our own rows are skipped.
+        """
+        events: List[Dict[str, Any]] = []
+        for task_id, data, _ in task_rows:
+            if task_id in self._owned:
+                continue
+            meta = json.loads(data)
+            with self._lock:
+                task = self._tasks.get(task_id)
+                if task is None:
+                    meta['logs'] = deque(maxlen=self.max_logs)
+                    self._tasks[task_id] = meta
+                    self._log_seq.setdefault(task_id, 0)
+                    self._level_counts.setdefault(task_id, {})
+                    changed = True
+                else:
+                    changed = task.get('status') != meta.get('status')
+                    logs = task['logs']
+                    task.clear()
+                    task.update(meta)
+                    task['logs'] = logs
+            if changed:
+                events.append({"type": "status", "task_id": task_id, "status": meta.get('status'), "last_updated": meta.get('last_updated')})
+        for _, task_id, seq, timestamp, level, message in log_rows:
+            task = self._tasks.get(task_id)
+            if task is None or task_id in self._owned:
+                continue
+            with self._lock:
+                if seq <= self._log_seq.get(task_id, 0):
+                    continue # Written by this process (or already merged)
+                self._log_seq[task_id] = seq
+                entry = {"seq": seq, "timestamp": timestamp, "level": level, "message": message}
+                task['logs'].append(entry)
+                counts = self._level_counts.setdefault(task_id, {})
+                counts[level] = counts.get(level, 0) + 1
+            events.append({"type": "log", "task_id": task_id, **entry})
+        return events
+
+    # --- Dict-like interface --- #
+    def get(self, task_id: str, default: Any = None) -> Any:
+        return self._tasks.get(task_id, default)
+
+    def __getitem__(self, task_id: str) -> Dict[str, Any]:
+        return self._tasks[task_id]
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._tasks
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._tasks)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __setitem__(self, task_id: str, task: Dict[str, Any]) -> None:
+        """Registers a new task (or replaces one) and persists its metadata."""
+        with self._lock:
+            initial_logs = list(task.get('logs') or [])
+            task['logs'] = deque(maxlen=self.max_logs)
+            self._tasks[task_id] = task
+            self._log_seq.setdefault(task_id, 0)
+            self._level_counts.setdefault(task_id, {})
+        self.save(task_id)
+        for entry in initial_logs:
+            self.append_log(task_id, entry.get('message', ''), entry.get('level', 'info'), entry.get('timestamp'))
+
+    def copy(self) -> Dict[str, Dict[str, Any]]:
+        return dict(self._tasks)
+
+    def items(self):
+        return self._tasks.items()
+
+    def values(self):
+        return self._tasks.values()
+
+    # --- Writes --- #
+    def save(self, task_id: str) -> None:
+        """Persists the task's metadata (everything except logs). Call after mutating the task dict."""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        self._write_queue.put((
+            f"INSERT INTO tasks (task_id, data, updated_at, version) VALUES (?, ?, ?, {_CURRENT_VERSION}) "
+            "ON CONFLICT(task_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, version = excluded.version",
+            (task_id, self._serialize_meta(task), datetime.now(timezone.utc).isoformat()),
+        ))
+
+    def append_log(self, task_id: str, message: str, level: str = 'info', timestamp: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Appends one log entry in O(1): ring buffer in memory plus one queued row on disk."""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        timestamp = timestamp or datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            seq = self._log_seq.get(task_id, 0) + 1
+            self._log_seq[task_id] = seq
+            entry = {"seq": seq, "timestamp": timestamp, "level": level, "message": message}
+            task['logs'].append(entry)
+            counts = self._level_counts.setdefault(task_id, {})
+            counts[level] = counts.get(level, 0) + 1
+        self._write_queue.put((
+            "INSERT OR IGNORE INTO task_logs (task_id, seq, timestamp, level, message) VALUES (?, ?, ?, ?, ?)",
+            (task_id, seq, timestamp, level, message),
+        ))
+        return entry
+
+    def last_log_seq(self, task_id: str) -> int:
+        return self._log_seq.get(task_id, 0)
+
+    def logs_after(self, task_id: str, after: int = 0, limit: int = 500) -> Optional[Dict[str, Any]]:
+        """
+        Returns up to limit log entries with seq > after, oldest first.
+        Served from the ring buffer when possible; older entries are read back from disk.
+        """
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        with self._lock:
+            buffered = list(task['logs'])
+            last_seq = self._log_seq.get(task_id, 0)
+
+        entries: List[Dict[str, Any]] = []
+        first_buffered = buffered[0]['seq'] if buffered else last_seq + 1
+        if after + 1 < first_buffered:
+            # Caller is behind the ring buffer: fill the gap from task_logs
+            with self._read_lock:
+                rows = self._read_conn.execute(
+                    "SELECT seq, timestamp, level, message FROM task_logs "
+                    "WHERE task_id = ? AND seq > ? AND seq < ? ORDER BY seq LIMIT ?",
+                    (task_id, after, first_buffered, limit),
+                ).fetchall()
+            entries = [{"seq": seq, "timestamp": ts, "level": level, "message": message} for seq, ts, level, message in rows]
+            if entries:
+                after = entries[-1]['seq']
+        if len(entries) < limit:
+            entries.extend([entry for entry in buffered if entry['seq'] > after][:limit - len(entries)])
+
+        return {
+            "task_id": task_id,
+            "status": task.get('status'),
+            "last_updated": task.get('last_updated'),
+            "logs": entries,
+            "last_seq": entries[-1]['seq'] if entries else after,
+            "has_more": bool(entries) and entries[-1]['seq'] < last_seq,
+        }
+
+    def log_counts(self, task_id: str) -> Dict[str, int]:
+        """Number of log entries per level over the task's whole history (not just the ring buffer)."""
+        return dict(self._level_counts.get(task_id, {}))
+
+    def summary(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Compact view of a task for listings: metadata minus config and logs, plus log counters."""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        logs = task.get('logs')
+        return {
+            "task_id": task_id,
+            "status": task.get('status'),
+            "description": task.get('description'),
+            "task_type": task.get('task_type'),
+            "start_time": task.get('start_time'),
+            "last_updated": task.get('last_updated'),
+            "stop_requested": task.get('stop_requested', False),
+            "log_count": self._log_seq.get(task_id, 0),
+            "log_counts": self.log_counts(task_id),
+            "last_log": logs[-1] if logs else None,
+        }
+
+    @staticmethod
+    def _serialize_meta(task: Dict[str, Any]) -> str:
+        return json.dumps({k: v for k, v in task.items() if k != 'logs'}, default=str)
+
+    # --- Writer thread --- #
+    def _writer_loop(self) -> None:
+        while True:
+            item = self._write_queue.get()
+            batch: List[tuple] = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            # Drain whatever else is queued into the same transaction
+            while not stop and len(batch) < WRITER_BATCH_SIZE:
+                try:
+                    item = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                try:
+                    with self._conn:
+                        self._conn.execute(_BUMP_VERSION)
+                        for sql, params in batch:
+                            self._conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    print(f"Warning: Task store write failed ({len(batch)} statements dropped): {e}")
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._write_queue.task_done()
+            if stop:
+                return
+
+    def flush(self) -> None:
+        """Blocks until every queued write has been committed."""
+        self._write_queue.join()
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._write_queue.put(None)
+            self._writer.join(timeout=5)
+        try:
+            self._conn.close()
+            self._read_conn.close()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,39 @@
+"""
+Standalone job worker: runs queued bot tasks outside the API process.
+
+Start as many as needed on the host that holds the task database (same TASK_DB_PATH):
+    python backend/api/worker.py
+These workers only see tasks whose keys the API stored encrypted, so the API and every
+worker need the same TASK_KEYS_PASSWORD. Set EMBEDDED_WORKER=0 on the API to leave all tasks
+to them. On SIGINT/SIGTERM running tasks are handed back to the queue and resumed by another worker.
+"""
+import asyncio
+import signal
+
+import main # Task store, job queue and runners (importing does not start the API)
+from job_queue import JobWorker
+
+
+async def serve() -> None:
+    worker = JobWorker(main.job_queue, main.run_job, main.on_job_stop, main.on_job_error, on_orphan=main.on_job_orphaned)
+    main.job_worker = worker
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = asyncio.create_task(worker.run())
+    print(f"Job worker {worker.worker_id} started (up to {worker.concurrency} tasks at once).")
+    if main.TASK_KEYS_PASSWORD is None:
+        print("Warning: TASK_KEYS_PASSWORD is not set; this worker can't run tasks, whose keys stay in the API process.")
+    await stop.wait()
+
+    print("Shutting down: handing running tasks back to the queue...")
+    await worker.close()
+    await runner
+    main.task_status_storage.flush()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
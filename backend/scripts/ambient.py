@@ -6,6 +6,13 @@ from eth_abi import abi
 from decimal import Decimal
 from loguru import logger
 from web3 import AsyncWeb3, Web3
+from rpc_pool import get_async_web3
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_eip1559_fees
+from gas_limits import get_gas_limit
+from retry_policy import RetryPolicy
+from multicall import get_token_balances, NATIVE_KEY
 import traceback
 
 # Constants (Use defaults, allow overrides)
@@ -77,39 +84,41 @@ async def execute_ambient_swap(
         # --- Setup --- #
         # Use default RPC if None is provided
         rpc_url_to_use = rpc_url if rpc_url is not None else DEFAULT_RPC_URL
-        w3_async = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(rpc_url_to_use))
-        if not await w3_async.is_connected():
-            raise ConnectionError(f"Could not connect to Async RPC: {rpc_url_to_use}")
+        w3_async = await get_async_web3(rpc_url_to_use) # Shared transport; raises ConnectionError if unreachable
             
         account = Account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
+        send_policy = RetryPolicy(attempts=attempts) # Tries per send (transient RPC faults, stale nonce, low fee)
         router_contract = w3_async.eth.contract(address=Web3.to_checksum_address(ambient_contract_address), abi=AMBIENT_ABI)
         logs.append(f"Starting Ambient Swap | Wallet: {wallet_short}")
 
         # --- Helper: Get Balances --- #
         async def get_balances() -> List[Tuple[str, float, int]]: # symbol, amount_float, amount_wei
             tokens_with_balance = []
-            try:
-                native_balance_wei = await w3_async.eth.get_balance(account.address)
-                if native_balance_wei > 0:
-                    native_amount = float(Web3.from_wei(native_balance_wei, 'ether'))
-                    tokens_with_balance.append(("native", native_amount, native_balance_wei))
-            except Exception as e:
-                 logs.append(format_step('balance', f"⚠️ Failed to get native balance: {e}"))
+            # Native + every token balance in one Multicall3 round trip
+            balances_wei = await get_token_balances(
+                w3_async,
+                account.address,
+                {symbol: details["address"] for symbol, details in token_map.items()},
+                include_native=True,
+            )
+
+            native_balance_wei = balances_wei.get(NATIVE_KEY)
+            if native_balance_wei is None:
+                logs.append(format_step('balance', "⚠️ Failed to get native balance"))
+            elif native_balance_wei > 0:
+                native_amount = float(Web3.from_wei(native_balance_wei, 'ether'))
+                tokens_with_balance.append(("native", native_amount, native_balance_wei))
 
             for symbol, details in token_map.items():
-                try:
-                    token_contract = w3_async.eth.contract(
-                        address=Web3.to_checksum_address(details["address"]),
-                        abi=ERC20_ABI
-                    )
-                    balance_wei = await token_contract.functions.balanceOf(account.address).call()
-                    if balance_wei > 0:
-                        amount = float(Decimal(str(balance_wei)) / Decimal(str(10 ** details["decimals"])))
-                        if symbol.lower() in ["seth", "weth"] and amount < 0.001: continue
-                        tokens_with_balance.append((symbol, amount, balance_wei))
-                except Exception as e:
-                    logs.append(format_step('balance', f"⚠️ Failed to get balance for {symbol}: {e}"))
+                balance_wei = balances_wei.get(symbol)
+                if balance_wei is None:
+                    logs.append(format_step('balance', f"⚠️ Failed to get balance for {symbol}"))
+                    continue
+                if balance_wei > 0:
+                    amount = float(Decimal(str(balance_wei)) / Decimal(str(10 ** details["decimals"])))
+                    if symbol.lower() in ["seth", "weth"] and amount < 0.001: continue
+                    tokens_with_balance.append((symbol, amount, balance_wei))
             return tokens_with_balance
     except Exception as e:
         tb_str = traceback.format_exc()
@@ -207,9 +216,6 @@ async def execute_ambient_swap(
 
         logs.append(format_step('swap', f"Swapping {amount_to_swap_float:.6f} {token_in.upper()} → {token_out.upper()}"))
 
-        # Initialize nonce here so it's always defined
-        nonce = await w3_async.eth.get_transaction_count(account.address)
-        
         # --- Approve Token (if not native) --- #
         is_native_in = token_in.lower() == "native"
         if not is_native_in:
@@ -220,35 +226,26 @@ async def execute_ambient_swap(
             if allowance < amount_to_swap_wei:
                 logs.append(format_step('approve', f"Allowance ({allowance}) < amount ({amount_to_swap_wei}). Approving..."))
                 gas_params_approve = await get_gas_params(w3_async)
-                nonce_approve = nonce  # Use the previously fetched nonce
                 approve_tx = await token_contract.functions.approve(
                     ambient_contract_address, amount_to_swap_wei
                 ).build_transaction({
                     'from': account.address,
-                    'nonce': nonce_approve,
                     'type': 2,
                     'chainId': chain_id,
+                    'gas': 100000, # Placeholder so build_transaction doesn't estimate; replaced below
                     **gas_params_approve,
                 })
-                # Estimate gas for approve
-                try:
-                    gas_est_approve = await w3_async.eth.estimate_gas(approve_tx)
-                    approve_tx['gas'] = int(gas_est_approve * 1.2)
-                except Exception:
-                    approve_tx['gas'] = 100000 # Fallback
+                approve_tx['gas'] = await get_gas_limit(w3_async, approve_tx, fallback=100000) # Learned or estimated once
 
-                signed_approve_tx = Account.sign_transaction(approve_tx, private_key)
-                approve_tx_hash_bytes = await w3_async.eth.send_raw_transaction(signed_approve_tx.raw_transaction)
+                approve_tx_hash_bytes = await send_transaction(w3_async, approve_tx, private_key, policy=send_policy)
                 approve_hash = approve_tx_hash_bytes.hex()
                 approve_link = f"{explorer_url}{approve_hash}"
                 logs.append(format_step('approve', f"Approval Tx Sent: {approve_link}"))
-                receipt_approve = await w3_async.eth.wait_for_transaction_receipt(approve_tx_hash_bytes, timeout=180)
+                receipt_approve = await wait_for_receipt(w3_async, approve_tx_hash_bytes, timeout=180)
                 if receipt_approve.status != 1:
                     logs.append(format_step('approve', f"✘ Approval failed: Status {receipt_approve.status}"))
                     raise Exception(f"Approval failed: Status {receipt_approve.status}")
                 logs.append(format_step('approve', "✔ Approval successful!"))
-                # Increment nonce expected for the swap tx
-                nonce = nonce_approve + 1
                 await asyncio.sleep(random.uniform(pause_between_actions[0], pause_between_actions[1])) # Pause after approve
             else:
                 logs.append(format_step('approve', f"✔ Allowance sufficient ({allowance})."))
@@ -286,25 +283,20 @@ async def execute_ambient_swap(
 
         # --- Prepare Swap Transaction --- #
         gas_params_swap = await get_gas_params(w3_async)
-        # Use the potentially incremented nonce
-
         swap_tx = {
             "to": Web3.to_checksum_address(ambient_contract_address),
             "from": account.address,
             "data": "0x" + tx_data_hex,
             "value": amount_to_swap_wei if is_native_in else 0,
-            "nonce": nonce,
             "type": 2,
             "chainId": chain_id,
             **gas_params_swap,
         }
 
-        # Estimate Gas with fallback and retry mechanisms
-        gas_estimate = 800000  # Default high value
+        # Gas limit (learned from earlier swaps, estimated otherwise) with fallback and retry mechanisms
         try:
-            gas_estimate = await w3_async.eth.estimate_gas(swap_tx)
-            swap_tx['gas'] = int(gas_estimate * 1.5)  # Buffer for swap
-            logs.append(format_step('swap', f"Estimated Gas: {gas_estimate}, Using: {swap_tx['gas']}"))
+            swap_tx['gas'] = await get_gas_limit(w3_async, swap_tx, buffer=1.5)  # Buffer for swap
+            logs.append(format_step('swap', f"Using gas limit: {swap_tx['gas']}"))
         except Exception as est_err:
             error_msg = str(est_err)
             logs.append(format_step('swap', f"⚠️ Gas estimation failed ({error_msg}), using default 800000"))
@@ -320,9 +312,8 @@ async def execute_ambient_swap(
                 
                 # Try to re-estimate gas with smaller amount
                 try:
-                    gas_estimate = await w3_async.eth.estimate_gas(swap_tx)
-                    swap_tx['gas'] = int(gas_estimate * 1.5)
-                    logs.append(format_step('swap', f"Re-estimated gas with smaller amount: {gas_estimate}, Using: {swap_tx['gas']}"))
+                    swap_tx['gas'] = await get_gas_limit(w3_async, swap_tx, buffer=1.5)
+                    logs.append(format_step('swap', f"Re-estimated gas with smaller amount, using: {swap_tx['gas']}"))
                     # Update the amount for tracking
                     amount_to_swap_wei = smaller_amount
                     amount_to_swap_float = float(w3_async.from_wei(smaller_amount, 'ether'))
@@ -335,14 +326,13 @@ async def execute_ambient_swap(
         # --- Sign and Send Swap --- #
         try:
             logs.append(format_step('swap', "Sending swap transaction..."))
-            signed_swap_tx = Account.sign_transaction(swap_tx, private_key)
-            tx_hash_bytes = await w3_async.eth.send_raw_transaction(signed_swap_tx.raw_transaction)
+            tx_hash_bytes = await send_transaction(w3_async, swap_tx, private_key, policy=send_policy)
             tx_hash = tx_hash_bytes.hex()
             tx_link = f"{explorer_url}{tx_hash}"
             logs.append(format_step('swap', f"Swap Tx Hash: {tx_link}"))
 
             # --- Wait for Swap Receipt --- #
-            receipt_swap = await w3_async.eth.wait_for_transaction_receipt(tx_hash_bytes, timeout=180)
+            receipt_swap = await wait_for_receipt(w3_async, tx_hash_bytes, timeout=180)
 
             if receipt_swap.status != 1:
                 logs.append(format_step('swap', f"✘ Swap transaction failed on-chain with status {receipt_swap.status}"))
@@ -404,10 +394,4 @@ async def execute_ambient_swap(
 
 # Helper to get gas params (moved outside class)
 async def get_gas_params(w3: AsyncWeb3) -> Dict[str, int]:
-    latest_block = await w3.eth.get_block('latest')
-    base_fee = latest_block['baseFeePerGas']
-    max_priority_fee = await w3.eth.max_priority_fee
-    return {
-        "maxFeePerGas": base_fee + max_priority_fee,
-        "maxPriorityFeePerGas": max_priority_fee,
-    }
+    return await get_eip1559_fees(w3) # Served from the shared gas oracle
@@ -1,5 +1,10 @@
 import os
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
+from rpc_pool import get_web3, get_async_web3
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 from colorama import init, Fore, Style
 from scripts.rubic import get_func
 import random
@@ -17,6 +22,7 @@ DEFAULT_RPC_URL = "https://testnet-rpc.monad.xyz/"
 DEFAULT_EXPLORER_URL = "https://testnet.monadexplorer.com/tx/0x"
 DEFAULT_CONTRACT_ADDRESS = "0xb2f82D0f38dc453D596Ad40A37799446Cc89274A"
 DEFAULT_CHAIN_ID = 10143
+# Fallback gas limits, only used if the learned limit is unknown and estimation fails
 GAS_LIMIT_STAKE = 500000
 GAS_LIMIT_UNSTAKE = 800000
 GAS_LIMIT_CLAIM = 800000
@@ -26,10 +32,7 @@ DEFAULT_CLAIM_CHECK_URL = "https://liquid-staking-backend-prod-b332fbe9ccfe.hero
 def connect_to_rpc(rpc_url):
     # Use default RPC if None is provided
     rpc_url_to_use = rpc_url if rpc_url is not None else DEFAULT_RPC_URL
-    w3 = Web3(Web3.HTTPProvider(rpc_url_to_use))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url_to_use}")
-    return w3
+    return get_web3(rpc_url_to_use)
 
 # Helper function to format step messages for logs
 def format_step(step, message):
@@ -46,7 +49,7 @@ def format_step(step, message):
 # --- Refactored Execution Functions --- #
 
 async def _apriori_stake(
-    w3: Web3,
+    w3: AsyncWeb3,
     account,
     private_key: str,
     contract_address: str,
@@ -68,27 +71,25 @@ async def _apriori_stake(
                stake_amount.to_bytes(32, 'big') + \
                Web3.to_bytes(hexstr=referrer_address).rjust(32, b'\0')
 
-        gas_price = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-        nonce = await asyncio.get_event_loop().run_in_executor(None, w3.eth.get_transaction_count, account.address)
+        gas_price = await get_gas_price(w3)
 
         tx = {
+            'from': account.address,
             'to': contract_address,
             'data': data,
-            'gas': GAS_LIMIT_STAKE,
             'gasPrice': gas_price,
             'value': stake_amount,
-            'nonce': nonce,
             'chainId': chain_id
         }
+        tx['gas'] = await get_gas_limit(w3, tx, fallback=GAS_LIMIT_STAKE)
 
         logs.append(format_step('stake', 'Sending transaction...'))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash_bytes = await asyncio.get_event_loop().run_in_executor(None, w3.eth.send_raw_transaction, signed_tx.raw_transaction)
+        tx_hash_bytes = await send_transaction(w3, tx, private_key)
         stake_tx_hash = tx_hash_bytes.hex()
         tx_link = f"{explorer_url}{stake_tx_hash}"
         logs.append(format_step('stake', f"Tx Sent: {tx_link}"))
 
-        receipt = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_bytes, timeout=180))
+        receipt = await wait_for_receipt(w3, tx_hash_bytes, timeout=180)
 
         if receipt.status != 1:
              logs.append(format_step('stake', f"✘ Transaction failed on-chain with status {receipt.status}"))
@@ -114,7 +115,7 @@ async def _apriori_stake(
         return {'success': False, 'tx_hash': stake_tx_hash, 'logs': logs, 'error': error_message}
 
 async def _apriori_unstake(
-    w3: Web3,
+    w3: AsyncWeb3,
     account,
     private_key: str,
     contract_address: str,
@@ -134,27 +135,25 @@ async def _apriori_unstake(
                Web3.to_bytes(hexstr=account.address).rjust(32, b'\0') + \
                Web3.to_bytes(hexstr=account.address).rjust(32, b'\0') # owner and receiver are the same
 
-        gas_price = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-        nonce = await asyncio.get_event_loop().run_in_executor(None, w3.eth.get_transaction_count, account.address)
+        gas_price = await get_gas_price(w3)
 
         tx = {
+            'from': account.address,
             'to': contract_address,
             'data': data,
-            'gas': GAS_LIMIT_UNSTAKE,
             'gasPrice': gas_price,
             'value': 0,
-            'nonce': nonce,
             'chainId': chain_id
         }
+        tx['gas'] = await get_gas_limit(w3, tx, fallback=GAS_LIMIT_UNSTAKE)
 
         logs.append(format_step('unstake', 'Sending request...'))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash_bytes = await asyncio.get_event_loop().run_in_executor(None, w3.eth.send_raw_transaction, signed_tx.raw_transaction)
+        tx_hash_bytes = await send_transaction(w3, tx, private_key)
         unstake_tx_hash = tx_hash_bytes.hex()
         tx_link = f"{explorer_url}{unstake_tx_hash}"
         logs.append(format_step('unstake', f"Tx Sent: {tx_link}"))
 
-        receipt = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_bytes, timeout=180))
+        receipt = await wait_for_receipt(w3, tx_hash_bytes, timeout=180)
 
         if receipt.status != 1:
              logs.append(format_step('unstake', f"✘ Request failed on-chain with status {receipt.status}"))
@@ -179,7 +178,7 @@ async def _apriori_unstake(
         return {'success': False, 'tx_hash': unstake_tx_hash, 'logs': logs, 'error': error_message}
 
 async def _apriori_check_and_claim(
-    w3: Web3,
+    w3: AsyncWeb3,
     account,
     private_key: str,
     contract_address: str,
@@ -235,27 +234,25 @@ async def _apriori_check_and_claim(
                offset + \
                encoded_ids
 
-        gas_price = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-        nonce = await asyncio.get_event_loop().run_in_executor(None, w3.eth.get_transaction_count, account.address)
+        gas_price = await get_gas_price(w3)
 
         tx = {
+            'from': account.address,
             'to': contract_address,
             'data': data,
-            'gas': GAS_LIMIT_CLAIM,
             'gasPrice': gas_price,
             'value': 0,
-            'nonce': nonce,
             'chainId': chain_id
         }
+        tx['gas'] = await get_gas_limit(w3, tx, fallback=GAS_LIMIT_CLAIM)
 
         logs.append(format_step('claim', 'Sending transaction...'))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash_bytes = await asyncio.get_event_loop().run_in_executor(None, w3.eth.send_raw_transaction, signed_tx.raw_transaction)
+        tx_hash_bytes = await send_transaction(w3, tx, private_key)
         claim_tx_hash = tx_hash_bytes.hex()
         tx_link = f"{explorer_url}{claim_tx_hash}"
         logs.append(format_step('claim', f"Tx Sent: {tx_link}"))
 
-        receipt = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_bytes, timeout=180))
+        receipt = await wait_for_receipt(w3, tx_hash_bytes, timeout=180)
 
         if receipt.status != 1:
              logs.append(format_step('claim', f"✘ Claim failed: Status {receipt.status}"))
@@ -290,7 +287,7 @@ async def execute_apriori_full_cycle(
     account = None
 
     try:
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url or DEFAULT_RPC_URL)
         account = w3.eth.account.from_key(private_key)
         contract_address = w3.to_checksum_address(contract_address)
         wallet_short = account.address[:8] + "..."
@@ -0,0 +1,119 @@
+import time
+import asyncio
+from typing import Dict, Optional, Set, Tuple
+
+from eth_abi import abi
+from web3 import AsyncWeb3, Web3
+
+# Constants
+BALANCE_TTL_SECONDS = 5.0 # Hard upper bound on entry age, even if the block number could not be refreshed
+BLOCK_NUMBER_TTL_SECONDS = 0.5 # Block number is re-read at most this often (shared by all lookups)
+NATIVE_TOKEN = "native"
+BALANCE_OF_SELECTOR = bytes.fromhex("70a08231") # balanceOf(address)
+
+
+class BalanceCache:
+    """
+    Short-lived balance cache keyed by (address, token, block).
+
+    An entry is served only while the chain is still at the block it was read in (and it is
+    younger than BALANCE_TTL_SECONDS), so results are never staler than one block.
+    Concurrent lookups for the same (address, token) share one in-flight RPC call, and our own
+    sends call invalidate() so the next read after a transaction always goes to the node.
+    Sends made by another process (a job worker) only reach this cache through the API's task
+    sync, which invalidates the task's wallets whenever the task logs; their recipients are
+    refreshed once the chain moves past the cached block.
+    """
+
+    def __init__(self, ttl_seconds: float = BALANCE_TTL_SECONDS, block_ttl_seconds: float = BLOCK_NUMBER_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.block_ttl_seconds = block_ttl_seconds
+        self._entries: Dict[Tuple[str, str], Tuple[int, int, float]] = {} # key -> (balance_wei, block, fetched_at)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._invalidated_during_fetch: Set[asyncio.Future] = set()
+        self._block: Optional[Tuple[int, float]] = None # (block_number, fetched_at)
+        self._block_inflight: Optional[asyncio.Future] = None
+
+    @staticmethod
+    def _key(address: str, token: Optional[str]) -> Tuple[str, str]:
+        return address.lower(), (token or NATIVE_TOKEN).lower()
+
+    async def _current_block(self, w3: AsyncWeb3) -> Optional[int]:
+        now = time.monotonic()
+        if self._block is not None and now - self._block[1] < self.block_ttl_seconds:
+            return self._block[0]
+        if self._block_inflight is not None and not self._block_inflight.done() and self._block_inflight.get_loop() is asyncio.get_running_loop():
+            return await asyncio.shield(self._block_inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._block_inflight = future
+        try:
+            block_number = await w3.eth.block_number
+            self._block = (block_number, time.monotonic())
+        except asyncio.CancelledError:
+            future.set_result(None) # Don't leave waiters hanging; they fall back to TTL-only validity
+            raise
+        except Exception:
+            block_number = None # Fall back to TTL-only validity
+        future.set_result(block_number)
+        return block_number
+
+    async def _fetch(self, w3: AsyncWeb3, address: str, token: Optional[str]) -> int:
+        owner = Web3.to_checksum_address(address)
+        if token is None or token.lower() == NATIVE_TOKEN:
+            return await w3.eth.get_balance(owner)
+        data = BALANCE_OF_SELECTOR + abi.encode(['address'], [owner])
+        result = await w3.eth.call({'to': Web3.to_checksum_address(token), 'data': data})
+        return abi.decode(['uint256'], bytes(result)[:32])[0]
+
+    async def get_balance(self, w3: AsyncWeb3, address: str, token: Optional[str] = None) -> int:
+        """Balance in wei (token=None for native MON, otherwise an ERC20 address)."""
+        key = self._key(address, token)
+        block = await self._current_block(w3)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            balance_wei, entry_block, fetched_at = entry
+            fresh = time.monotonic() - fetched_at < self.ttl_seconds
+            if fresh and (block is None or entry_block == block):
+                return balance_wei
+
+        inflight = self._inflight.get(key)
+        if inflight is not None and not inflight.done() and inflight.get_loop() is asyncio.get_running_loop():
+            return await asyncio.shield(inflight) # Coalesce with the identical request already running
+
+        # The read runs as its own task so that cancelling the caller that started it
+        # (a stopped bot task) doesn't cancel it for the other callers sharing it
+        future = asyncio.ensure_future(self._fetch_and_store(w3, address, token, key, block))
+        future.add_done_callback(lambda f: f.cancelled() or f.exception()) # Mark retrieved if nobody awaits it
+        self._inflight[key] = future
+        return await asyncio.shield(future)
+
+    async def _fetch_and_store(self, w3: AsyncWeb3, address: str, token: Optional[str], key: Tuple[str, str], block: Optional[int]) -> int:
+        future = asyncio.current_task()
+        try:
+            balance_wei = await self._fetch(w3, address, token)
+            # Skip caching if invalidate() ran while this read was in flight
+            if future not in self._invalidated_during_fetch:
+                self._entries[key] = (balance_wei, block if block is not None else -1, time.monotonic())
+            return balance_wei
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            self._invalidated_during_fetch.discard(future) # Also when the read failed
+
+    def invalidate(self, address: Optional[str]) -> None:
+        """Drops every cached balance of address (call after sending a transaction from/to it)."""
+        if not address:
+            return
+        address = address.lower()
+        for key in [key for key in self._entries if key[0] == address]:
+            del self._entries[key]
+        # A read already in flight may have started before the send; don't let it repopulate the cache
+        for key, future in self._inflight.items():
+            if key[0] == address:
+                self._invalidated_during_fetch.add(future)
+
+
+# Process-wide instance (API endpoints and the send helper share it)
+balance_cache = BalanceCache()
@@ -2,7 +2,12 @@ import os
 import random
 import asyncio
 import time
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
+from rpc_pool import get_web3, get_async_web3
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 from web3.exceptions import ContractLogicError
 import traceback
 from typing import Dict, List, Optional, Tuple
@@ -42,6 +47,7 @@ DEFAULT_TOKENS = {
 ERC20_ABI = [
     {"constant": False, "inputs": [{"name": "spender", "type": "address"}, {"name": "amount", "type": "uint256"}], "name": "approve", "outputs": [{"name": "", "type": "bool"}], "type": "function"},
     {"constant": True, "inputs": [{"name": "account", "type": "address"}], "name": "balanceOf", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
+    {"constant": True, "inputs": [{"name": "owner", "type": "address"}, {"name": "spender", "type": "address"}], "name": "allowance", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
     {"constant": True, "inputs": [], "name": "symbol", "outputs": [{"name": "", "type": "string"}], "type": "function"}
 ]
 
@@ -54,17 +60,23 @@ ROUTER_ABI = [
 # Helper function to connect to RPC (picks one randomly)
 def connect_to_rpc(rpc_urls: List[str] = DEFAULT_RPC_URLS):
     # Use default if None is provided
-    urls_to_use = rpc_urls if rpc_urls is not None else DEFAULT_RPC_URLS
-    random.shuffle(urls_to_use)
+    # Shuffle a copy: shuffling in place would reorder DEFAULT_RPC_URLS for every caller
+    urls_to_use = random.sample(rpc_urls or DEFAULT_RPC_URLS, len(rpc_urls or DEFAULT_RPC_URLS))
     for url in urls_to_use:
         try:
-            w3 = Web3(Web3.HTTPProvider(url))
-            if w3.is_connected():
-                return w3
+            return get_web3(url)
         except Exception:
             continue # Try next URL
     raise ConnectionError(f"Could not connect to any RPC in list: {urls_to_use}")
 
+# Async variant used by execute_bean_swap: one transport routing over all URLs (fastest healthy endpoint per call)
+async def connect_to_async_rpc(rpc_urls: List[str] = DEFAULT_RPC_URLS) -> AsyncWeb3:
+    urls_to_use = list(rpc_urls or DEFAULT_RPC_URLS)
+    try:
+        return await get_async_web3(urls_to_use)
+    except Exception as e:
+        raise ConnectionError(f"Could not connect to any RPC in list: {urls_to_use}: {e}")
+
 # Helper function to format step messages for logs
 def format_step(step, message):
     steps = {'approve': 'Approve Token', 'swap': 'Execute Swap', 'balance': 'Check Balance'}
@@ -73,35 +85,33 @@ def format_step(step, message):
 
 # Helper: Approve Token
 async def _bean_approve_token(
-    w3: Web3, account, private_key: str, token_address: str, spender: str, amount_wei: int, chain_id: int, logs: list
+    w3: AsyncWeb3, account, private_key: str, token_address: str, spender: str, amount_wei: int, chain_id: int, logs: list
 ) -> Tuple[bool, Optional[str]]:
     try:
         token_contract = w3.eth.contract(address=token_address, abi=ERC20_ABI)
-        symbol = await asyncio.get_event_loop().run_in_executor(None, token_contract.functions.symbol().call)
+        symbol = await token_contract.functions.symbol().call()
         logs.append(format_step('approve', f'Checking approval for {symbol}...'))
 
-        allowance = await asyncio.get_event_loop().run_in_executor(None, lambda: token_contract.functions.allowance(account.address, spender).call())
+        allowance = await token_contract.functions.allowance(account.address, spender).call()
         if allowance >= amount_wei:
             logs.append(format_step('approve', f"✔ Allowance sufficient for {symbol} ({allowance} >= {amount_wei})."))
             return True, None
 
         logs.append(format_step('approve', f'Approving {symbol} for {spender[:8]}...'))
-        gas_price = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-        nonce = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_transaction_count(account.address))
+        gas_price = await get_gas_price(w3)
 
-        tx = token_contract.functions.approve(spender, amount_wei).build_transaction({
+        tx = await token_contract.functions.approve(spender, amount_wei).build_transaction({
             'from': account.address,
-            'gas': 100000,
+            'gas': 100000, # Placeholder so build_transaction doesn't estimate; replaced below
             'gasPrice': gas_price,
-            'nonce': nonce,
             'chainId': chain_id
         })
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash_bytes = await asyncio.get_event_loop().run_in_executor(None, w3.eth.send_raw_transaction, signed_tx.raw_transaction)
+        tx['gas'] = await get_gas_limit(w3, tx, fallback=100000)
+        tx_hash_bytes = await send_transaction(w3, tx, private_key)
         approve_hash = tx_hash_bytes.hex()
         logs.append(format_step('approve', f"Approval Tx Sent: {approve_hash}"))
 
-        receipt = await asyncio.get_event_loop().run_in_executor(None, w3.eth.wait_for_transaction_receipt, tx_hash_bytes, timeout=180)
+        receipt = await wait_for_receipt(w3, tx_hash_bytes, timeout=180)
         if receipt.status != 1:
             logs.append(format_step('approve', f"✘ Approval failed: Status {receipt.status}"))
             raise Exception(f"Approval failed: Status {receipt.status}")
@@ -120,6 +130,7 @@ async def execute_bean_swap(
     amount: float, # Amount of the input token (MON or the other token)
     # Configurable parameters
     rpc_urls: List[str] = DEFAULT_RPC_URLS,
+    rpc_url = None, # Added for compatibility (main.py passes rpc_url)
     router_address: str = DEFAULT_ROUTER_ADDRESS,
     wmon_address: str = DEFAULT_WMON_ADDRESS,
     token_map: Dict = DEFAULT_TOKENS,
@@ -135,7 +146,9 @@ async def execute_bean_swap(
 
     try:
         # --- Setup --- #
-        w3 = connect_to_rpc(rpc_urls)
+        if rpc_url is not None:
+            rpc_urls = rpc_url if isinstance(rpc_url, list) else [rpc_url]
+        w3 = await connect_to_async_rpc(rpc_urls)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         router_contract = w3.eth.contract(address=w3.to_checksum_address(router_address), abi=ROUTER_ABI)
@@ -157,7 +170,7 @@ async def execute_bean_swap(
             logs.append(format_step('swap', f"MON → {token_symbol} | Amount: {amount_mon}"))
 
             # Check MON balance
-            balance_wei = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_balance(account.address))
+            balance_wei = await w3.eth.get_balance(account.address)
             if balance_wei < amount_wei:
                 logs.append(format_step('balance', f"✘ Insufficient MON balance: {w3.from_wei(balance_wei, 'ether')} < {amount_mon}"))
                 raise ValueError("Insufficient MON balance")
@@ -168,14 +181,13 @@ async def execute_bean_swap(
 
             swap_func = router_contract.functions.swapExactETHForTokens(0, path, account.address, deadline)
 
-            gas_price = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-            nonce = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_transaction_count(account.address))
+            gas_price = await get_gas_price(w3)
 
-            tx = swap_func.build_transaction({
+            tx = await swap_func.build_transaction({
                 'from': account.address,
                 'value': amount_wei,
+                'gas': 300000, # Fallback limit; also keeps build_transaction from estimating
                 'gasPrice': gas_price,
-                'nonce': nonce,
                 'chainId': chain_id
             })
 
@@ -187,7 +199,7 @@ async def execute_bean_swap(
 
             # Check Token balance
             token_contract = w3.eth.contract(address=token_address_cs, abi=ERC20_ABI)
-            balance_token_wei = await asyncio.get_event_loop().run_in_executor(None, lambda: token_contract.functions.balanceOf(account.address).call())
+            balance_token_wei = await token_contract.functions.balanceOf(account.address).call()
             if balance_token_wei < amount_token_wei:
                 logs.append(format_step('balance', f"✘ Insufficient {token_symbol} balance: {balance_token_wei / (10**decimals)} < {amount_token}"))
                 raise ValueError(f"Insufficient {token_symbol} balance")
@@ -200,21 +212,18 @@ async def execute_bean_swap(
             approve_hash = approve_tx_hash_str # Store hash if approval happened
             if not approved:
                 raise Exception("Token approval failed")
-            # Increment nonce only if approval tx was actually sent
-            nonce = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_transaction_count(account.address))
 
             path = [token_address_cs, wmon_address_cs]
             deadline = int(time.time()) + 600
 
             swap_func = router_contract.functions.swapExactTokensForETH(amount_token_wei, 0, path, account.address, deadline)
 
-            gas_price = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-            # Use potentially incremented nonce
+            gas_price = await get_gas_price(w3)
 
-            tx = swap_func.build_transaction({
+            tx = await swap_func.build_transaction({
                 'from': account.address,
+                'gas': 400000, # Higher fallback for token->ETH; also keeps build_transaction from estimating
                 'gasPrice': gas_price,
-                'nonce': nonce,
                 'chainId': chain_id,
                 'value': 0
             })
@@ -222,26 +231,24 @@ async def execute_bean_swap(
         else:
             raise ValueError(f"Invalid swap direction: {direction}")
 
-        # Estimate Gas
+        # Gas limit: learned from earlier swaps, estimated (once) otherwise
+        fallback_gas = tx['gas']
         try:
-            gas_limit = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.estimate_gas(tx))
-            tx['gas'] = int(gas_limit * 1.5) # Buffer
-            logs.append(format_step('swap', f"Estimated Gas: {gas_limit}, Using: {tx['gas']}"))
+            tx['gas'] = await get_gas_limit(w3, tx, buffer=1.5)
+            logs.append(format_step('swap', f"Using gas limit: {tx['gas']}"))
         except Exception as est_err:
-            fallback_gas = 300000 if direction == 'to_token' else 400000 # Higher fallback for token->ETH
             logs.append(format_step('swap', f"⚠️ Gas estimation failed ({est_err}), using default {fallback_gas}"))
             tx['gas'] = fallback_gas
 
         # Sign and Send Swap
         logs.append(format_step('swap', "Sending swap transaction..."))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash_bytes = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.send_raw_transaction(signed_tx.raw_transaction))
+        tx_hash_bytes = await send_transaction(w3, tx, private_key)
         swap_hash = tx_hash_bytes.hex()
         tx_link = f"{explorer_url}{swap_hash}"
         logs.append(format_step('swap', f"Tx Hash: {tx_link}"))
 
         # Wait for receipt
-        receipt = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_bytes, timeout=180))
+        receipt = await wait_for_receipt(w3, tx_hash_bytes, timeout=180)
 
         if receipt.status != 1:
             logs.append(format_step('swap', f"✘ Transaction failed: Status {receipt.status}"))
@@ -3,9 +3,16 @@ import random
 from typing import Dict, List, Optional, Tuple
 from eth_account import Account
 from eth_account.messages import encode_defunct
+from eth_utils import function_abi_to_4byte_selector
 from loguru import logger
 import aiohttp
 from web3 import AsyncWeb3, Web3
+from rpc_pool import get_async_web3
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price, get_eip1559_fees
+from gas_limits import get_gas_limit
+from retry_policy import RetryPolicy
 from colorama import init, Fore, Style
 import traceback
 from scripts.bean import _bean_approve_token
@@ -43,6 +50,17 @@ LENDING_ABI = [
     {"type": "function", "name": "supplyCollateral", "inputs": [{"name": "marketParams", "type": "tuple", "components": [{"name": "loanToken", "type": "address"}, {"name": "collateralToken", "type": "address"}, {"name": "oracle", "type": "address"}, {"name": "irm", "type": "address"}, {"name": "lltv", "type": "uint256"}]}, {"name": "assets", "type": "uint256"}, {"name": "onBehalf", "type": "address"}, {"name": "data", "type": "bytes"}], "outputs": [], "stateMutability": "nonpayable"}
 ]
 
+def _selector(abi: list, name: str) -> str:
+    return '0x' + function_abi_to_4byte_selector(next(item for item in abi if item.get('name') == name)).hex()
+
+# Fallback gas limits per function selector, only used if the learned limit is unknown and estimation fails
+FALLBACK_GAS_LIMITS = {
+    _selector(LENDING_ABI, 'supplyCollateral'): 500000,
+    _selector(FAUCET_ABI, 'getTokens'): 200000,
+    _selector(TOKEN_ABI, 'approve'): 100000,
+}
+DEFAULT_FALLBACK_GAS_LIMIT = 300000
+
 # Helper function to format step messages for logs
 def format_step(step, message):
     steps = {
@@ -87,54 +105,25 @@ async def execute_bima_lend_cycle(
     # --- Helper: Get Gas Params --- #
     async def _get_gas_params() -> Dict[str, int]:
         try:
-            latest_block = await w3_async.eth.get_block('latest')
-            base_fee = latest_block['baseFeePerGas']
-            max_priority_fee = await w3_async.eth.max_priority_fee
-            return {
-                "maxFeePerGas": base_fee + max_priority_fee,
-                "maxPriorityFeePerGas": max_priority_fee,
-            }
+            return await get_eip1559_fees(w3_async)
         except Exception as e:
             logs.append(format_step('gas', f"⚠️ EIP-1559 gas params retrieval failed: {e}. Using legacy gas pricing."))
-            return {"gasPrice": await w3_async.eth.gas_price}
+            return {"gasPrice": await get_gas_price(w3_async)}
 
     # --- Helper: Estimate Gas --- #
     async def _estimate_gas(transaction: dict) -> int:
         try:
-            # Make a copy of transaction to avoid modifying the original
-            tx_for_estimate = transaction.copy()
-            
-            # For gas estimation only, we don't need these fields
-            if 'maxFeePerGas' in tx_for_estimate:
-                del tx_for_estimate['maxFeePerGas']
-            if 'maxPriorityFeePerGas' in tx_for_estimate:
-                del tx_for_estimate['maxPriorityFeePerGas'] 
-            if 'gasPrice' in tx_for_estimate:
-                del tx_for_estimate['gasPrice']
-            if 'type' in tx_for_estimate:
-                del tx_for_estimate['type']
-                
-            estimated = await w3_async.eth.estimate_gas(tx_for_estimate)
-            return int(estimated * 1.2)  # Add 20% buffer
+            # Learned from earlier receipts, otherwise estimated (fee fields are ignored) + 20% buffer
+            return await get_gas_limit(w3_async, transaction)
         except Exception as e:
-            logs.append(format_step('gas', f"⚠️ Gas estimation failed: {e}. Using default."))
-            # Determine a reasonable default based on action
-            if 'data' in transaction and transaction['data']:
-                # Check if the function signature/name appears in the data string
-                # transaction['data'] is already a hex string '0x...'
-                if 'supplyCollateral' in transaction['data']: # Removed .hex()
-                    return 500000  # Higher gas for supply collateral
-                elif 'getTokens' in transaction['data']: # Removed .hex()
-                    return 200000  # Faucet gas
-                elif 'approve' in transaction['data']: # Removed .hex()
-                    return 100000  # Approval gas
-            # Generic fallback
-            return 300000
+            # Calldata is hex, so match on the 4-byte selector rather than the function name
+            selector = (transaction.get('data') or '')[:10].lower()
+            fallback = FALLBACK_GAS_LIMITS.get(selector, DEFAULT_FALLBACK_GAS_LIMIT)
+            logs.append(format_step('gas', f"⚠️ Gas estimation failed: {e}. Using default {fallback}."))
+            return fallback
 
     # --- Helper: Build Transaction --- #
     async def _build_transaction(function_call, to_address: str, value: int = 0) -> Dict:
-        nonce = await w3_async.eth.get_transaction_count(account.address, "latest")
-        
         # Get gas parameters for EIP-1559 transaction
         gas_params = await _get_gas_params()
         
@@ -144,7 +133,6 @@ async def execute_bima_lend_cycle(
             "data": function_call._encode_transaction_data(),
             "chainId": chain_id,
             "value": value,
-            "nonce": nonce,
         }
         
         # Add appropriate gas parameters based on what was returned
@@ -161,10 +149,9 @@ async def execute_bima_lend_cycle(
 
     # --- Helper: Send Transaction --- #
     async def _send_transaction(transaction: Dict) -> str:
-        signed_txn = Account.sign_transaction(transaction, private_key)
-        tx_hash_bytes = await w3_async.eth.send_raw_transaction(signed_txn.raw_transaction)
+        tx_hash_bytes = await send_transaction(w3_async, transaction, private_key)
         logs.append(format_step('send', f"Tx Sent: {tx_hash_bytes.hex()}"))
-        receipt = await w3_async.eth.wait_for_transaction_receipt(tx_hash_bytes, timeout=180)
+        receipt = await wait_for_receipt(w3_async, tx_hash_bytes, timeout=180)
         if receipt.status != 1:
             raise Exception(f"Transaction failed on-chain (Status: {receipt.status}) - Hash: {tx_hash_bytes.hex()}")
         logs.append(format_step('send', f"✔ Tx Confirmed: {tx_hash_bytes.hex()}"))
@@ -172,50 +159,44 @@ async def execute_bima_lend_cycle(
 
     # --- Helper: Bima Login (Requires aiohttp session) --- #
     async def _bima_login(session: aiohttp.ClientSession) -> bool:
-        for _ in range(attempts):
-            try:
-                # 1. Get Nonce (tip_info and timestamp)
-                async with session.get("https://testnet-api-v1.bima.money/bima/wallet/tip_info") as resp:
-                    if resp.status != 200:
-                         logs.append(format_step('login', f"Failed to get nonce (Status: {resp.status})"))
-                         await asyncio.sleep(random.uniform(*pause_between_actions))
-                         continue
-                    nonce_data = await resp.json()
-                    message_to_sign = nonce_data.get("data", {}).get("tip_info", "")
-                    timestamp = nonce_data.get("data", {}).get("timestamp", "")
-                if not message_to_sign or not timestamp:
-                    logs.append(format_step('login', "Nonce/Timestamp not received from API."))
-                    await asyncio.sleep(random.uniform(*pause_between_actions))
-                    continue
+        async def login_once() -> None:
+            # 1. Get Nonce (tip_info and timestamp)
+            async with session.get("https://testnet-api-v1.bima.money/bima/wallet/tip_info") as resp:
+                resp.raise_for_status() # 429/5xx are retried, other statuses are final
+                nonce_data = await resp.json()
+                message_to_sign = nonce_data.get("data", {}).get("tip_info", "")
+                timestamp = nonce_data.get("data", {}).get("timestamp", "")
+            if not message_to_sign or not timestamp:
+                raise ConnectionError("Nonce/Timestamp not received from API.") # Treated as a transient API hiccup
+
+            # 2. Sign Message
+            encoded_msg = encode_defunct(text=message_to_sign)
+            signed_msg = Account.sign_message(encoded_msg, private_key=private_key)
+            signature = signed_msg.signature.hex()
 
-                # 2. Sign Message
-                encoded_msg = encode_defunct(text=message_to_sign)
-                signed_msg = Account.sign_message(encoded_msg, private_key=private_key)
-                signature = signed_msg.signature.hex()
+            # 3. Post Signature
+            login_payload = {"signature": "0x" + signature, "timestamp": int(timestamp)}
+            async with session.post("https://testnet-api-v1.bima.money/bima/wallet/connect", json=login_payload) as login_resp:
+                login_resp.raise_for_status()
 
-                # 3. Post Signature
-                login_payload = {"signature": "0x" + signature, "timestamp": int(timestamp)}
-                async with session.post("https://testnet-api-v1.bima.money/bima/wallet/connect", json=login_payload) as login_resp:
-                    if login_resp.status == 200:
-                        logs.append(format_step('login', "✔ Login successful!"))
-                        return True
-                    else:
-                        logs.append(format_step('login', f"Login API call failed (Status: {login_resp.status})"))
-                        await asyncio.sleep(random.uniform(*pause_between_actions))
-                        continue
-            except Exception as e:
-                logs.append(format_step('login', f"Error during login attempt: {e}"))
-                await asyncio.sleep(random.uniform(*pause_between_actions))
-        logs.append(format_step('login', f"✘ Login failed after {attempts} attempts."))
-        return False
+        def log_retry(error: Exception, kind: str, failures: int, delay: float) -> None:
+            logs.append(format_step('login', f"Login attempt {failures}/{attempts} failed ({kind}): {error}. Retrying in {delay:.1f}s..."))
+
+        # Backoff starts at the configured pause between actions
+        policy = RetryPolicy(attempts=attempts, base_delay=pause_between_actions[0], max_delay=pause_between_actions[1] * 4)
+        try:
+            await policy.run(login_once, on_retry=log_retry)
+        except Exception as e:
+            logs.append(format_step('login', f"✘ Login failed: {e}"))
+            return False
+        logs.append(format_step('login', "✔ Login successful!"))
+        return True
 
     # --- Main Logic --- #
     try:
         # Use default RPC if None is provided
         rpc_url_to_use = rpc_url if rpc_url is not None else DEFAULT_RPC_URL
-        w3_async = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(rpc_url_to_use))
-        if not await w3_async.is_connected():
-            raise ConnectionError(f"Could not connect to Async RPC: {rpc_url_to_use}")
+        w3_async = await get_async_web3(rpc_url_to_use) # Shared transport; raises ConnectionError if unreachable
         account = Account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         faucet_addr_cs = Web3.to_checksum_address(faucet_address)
@@ -296,7 +277,7 @@ async def execute_bima_lend_cycle(
 
             try:
                 approved, approve_tx_hash_str = await _bean_approve_token( # Reusing approve helper
-                    w3_async.eth.get_transaction_count, account, private_key, bmbbtc_addr_cs, spender_addr_cs, amount_to_lend_wei, chain_id, logs
+                    w3_async, account, private_key, bmbbtc_addr_cs, spender_addr_cs, amount_to_lend_wei, chain_id, logs
                 )
                 approve_hash = approve_tx_hash_str
                 if not approved:
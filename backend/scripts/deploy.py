@@ -1,6 +1,15 @@
 import os
+import json
 import asyncio
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
 from web3 import Web3
+from rpc_pool import get_web3, get_async_web3, get_chain_id
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 from solcx import compile_source, install_solc
 from colorama import init # Keep for direct testing
 import traceback # Import traceback
@@ -15,6 +24,11 @@ load_dotenv()
 DEFAULT_RPC_URL = "https://testnet-rpc.monad.xyz/"
 DEFAULT_EXPLORER_URL = "https://testnet.monadexplorer.com/tx/0x"
 DEFAULT_GAS_LIMIT_DEPLOY = 1500000 # Deployment needs more gas
+SOLC_VERSION = '0.8.20' # Use a specific, compatible version
+ARTIFACT_CACHE_DIR = os.environ.get(
+    'DEPLOY_ARTIFACT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.artifacts'),
+)
 
 # ประกาศตัวแปร bytecode ที่ระดับโมดูล สำหรับ import จากไฟล์อื่น
 bytecode = None
@@ -49,10 +63,7 @@ contract Counter {
 
 # --- Helper Functions --- (Copied)
 def connect_to_rpc(rpc_url):
-    w3 = Web3(Web3.HTTPProvider(rpc_url))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url}")
-    return w3
+    return get_web3(rpc_url)
 
 def format_border(text, width=60):
     line1 = f"╔{'═' * (width - 2)}╗"
@@ -64,26 +75,72 @@ def format_step(step, message):
     return f"🔸 {step.capitalize():<15} | {message}"
 # --------------------------
 
+# --- Compiled Artifact Cache --- #
+# (abi, bytecode) keyed by sha256(solc version, contract name, source); mirrored to ARTIFACT_CACHE_DIR
+_artifact_cache: Dict[str, Tuple[list, str]] = {}
+_artifact_lock = threading.Lock() # Parallel keys must not all launch solc for the same artifact
+
+def _artifact_key(source_code: str, contract_name: str, solc_version: str) -> str:
+    digest = hashlib.sha256()
+    for part in (solc_version, contract_name, source_code):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _load_artifact_cache() -> None:
+    """Loads every persisted artifact into memory (called once at import)."""
+    if not os.path.isdir(ARTIFACT_CACHE_DIR):
+        return
+    for file_name in os.listdir(ARTIFACT_CACHE_DIR):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(ARTIFACT_CACHE_DIR, file_name), 'r', encoding='utf-8') as f:
+                artifact = json.load(f)
+            _artifact_cache[file_name[:-len('.json')]] = (artifact['abi'], artifact['bin'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable deploy artifact {file_name}: {e}")
+
+def _persist_artifact(key: str, abi: list, contract_bytecode: str) -> None:
+    try:
+        os.makedirs(ARTIFACT_CACHE_DIR, exist_ok=True)
+        path = os.path.join(ARTIFACT_CACHE_DIR, f"{key}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'abi': abi, 'bin': contract_bytecode}, f)
+        os.replace(tmp_path, path) # Atomic, so a crash never leaves a half-written artifact
+    except OSError as e:
+        # Cache is an optimization only; the in-memory copy still serves this process
+        print(f"Warning: Could not persist deploy artifact: {e}")
+
+_load_artifact_cache()
+
 # Compile Contract Function
-def compile_contract(source_code: str, contract_name: str) -> tuple:
+def compile_contract(source_code: str, contract_name: str, solc_version: str = SOLC_VERSION) -> tuple:
     global bytecode  # Access the global bytecode variable
-    try:
-        # Ensure solc is installed - Specify a version instead of latest
-        target_solc_version = '0.8.20' # Use a specific, compatible version
-        print(f"Ensuring solc version {target_solc_version} is installed...")
-        install_solc(version=target_solc_version)
-        print(f"solc version {target_solc_version} should be installed.")
-        compiled_sol = compile_source(source_code, output_values=["abi", "bin"], solc_version=target_solc_version)
-        contract_interface = compiled_sol[f'<stdin>:{contract_name}']
-        abi = contract_interface['abi']
-        contract_bytecode = contract_interface['bin']
-        
-        # Set the global bytecode variable for importing from other files
-        bytecode = contract_bytecode
-        
-        return abi, contract_bytecode
-    except Exception as e:
-        raise RuntimeError(f"Failed to compile contract (solc version: {target_solc_version}): {e}")
+    key = _artifact_key(source_code, contract_name, solc_version)
+    with _artifact_lock:
+        cached = _artifact_cache.get(key)
+        if cached is None:
+            try:
+                # Ensure solc is installed - Specify a version instead of latest
+                print(f"Ensuring solc version {solc_version} is installed...")
+                install_solc(version=solc_version)
+                print(f"solc version {solc_version} should be installed.")
+                compiled_sol = compile_source(source_code, output_values=["abi", "bin"], solc_version=solc_version)
+                contract_interface = compiled_sol[f'<stdin>:{contract_name}']
+                cached = (contract_interface['abi'], contract_interface['bin'])
+            except Exception as e:
+                raise RuntimeError(f"Failed to compile contract (solc version: {solc_version}): {e}")
+            _artifact_cache[key] = cached
+            _persist_artifact(key, *cached)
+
+    abi, contract_bytecode = cached
+
+    # Set the global bytecode variable for importing from other files
+    bytecode = contract_bytecode
+
+    return abi, contract_bytecode
 
 # Deploy Counter Contract Function - Refactored
 async def execute_deploy_counter(
@@ -94,7 +151,7 @@ async def execute_deploy_counter(
     rpc_url: str = DEFAULT_RPC_URL,
     rpc_urls = None, # Added for compatibility
     explorer_url: str = DEFAULT_EXPLORER_URL,
-    gas_limit: int = DEFAULT_GAS_LIMIT_DEPLOY
+    gas_limit: Optional[int] = None # None = learned limit (DEFAULT_GAS_LIMIT_DEPLOY if it can't be estimated)
 ) -> dict:
     logs = []
     tx_hash_hex = None
@@ -104,8 +161,8 @@ async def execute_deploy_counter(
         if rpc_urls is not None:
             rpc_url = rpc_urls
             
-        # Connect synchronously
-        w3 = connect_to_rpc(rpc_url)
+        # Shared async connection
+        w3 = await get_async_web3(rpc_url)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
 
@@ -124,14 +181,11 @@ async def execute_deploy_counter(
         # Create contract instance
         Contract = w3.eth.contract(abi=abi, bytecode=bytecode)
 
-        # Get chain ID synchronously
-        chain_id = w3.eth.chain_id
-
-        # Estimate gas price synchronously
-        gas_price = w3.eth.gas_price
+        # Get chain ID
+        chain_id = await get_chain_id(w3)
 
-        # Build constructor transaction synchronously
-        nonce = w3.eth.get_transaction_count(account.address)
+        # Estimate gas price
+        gas_price = await get_gas_price(w3)
 
         # Print types for debugging
         print(f"[Debug deploy.py] Types before build_transaction:")
@@ -141,33 +195,32 @@ async def execute_deploy_counter(
         print(f"  account.address: {type(account.address)}")
         print(f"  gas_limit: {type(gas_limit)}")
         print(f"  gas_price: {type(gas_price)}")
-        print(f"  nonce: {type(nonce)}")
         print(f"  chain_id: {type(chain_id)}")
         print(f"  Contract.constructor: {type(Contract.constructor)}")
         print(f"  build_transaction method: {type(Contract.constructor(initial_count, contract_name, contract_symbol).build_transaction)}")
 
-        constructor_tx = Contract.constructor(initial_count, contract_name, contract_symbol).build_transaction(
+        # Build constructor transaction
+        constructor_tx = await Contract.constructor(initial_count, contract_name, contract_symbol).build_transaction(
             {
                 'from': account.address,
-                'gas': gas_limit,
+                'gas': gas_limit or DEFAULT_GAS_LIMIT_DEPLOY, # Placeholder so build_transaction doesn't estimate
                 'gasPrice': gas_price,
-                'nonce': nonce,
                 'chainId': chain_id # Use fetched chain_id
             }
         )
+        if gas_limit is None:
+            constructor_tx['gas'] = await get_gas_limit(w3, constructor_tx, fallback=DEFAULT_GAS_LIMIT_DEPLOY)
 
         logs.append(format_step('deploy', 'Sending deployment transaction...'))
-        # Sign synchronously
-        signed_tx = w3.eth.account.sign_transaction(constructor_tx, private_key)
-        # Send synchronously
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        # Sign locally and send
+        tx_hash = await send_transaction(w3, constructor_tx, private_key)
         tx_hash_hex = tx_hash.hex()
         tx_link = f"{explorer_url}{tx_hash_hex}"
         logs.append(format_step('deploy', f"Tx Hash: {tx_link}"))
 
-        # Wait for transaction receipt synchronously
+        # Wait for transaction receipt
         logs.append(format_step('wait', 'Waiting for transaction receipt...'))
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
+        receipt = await wait_for_receipt(w3, tx_hash, timeout=180)
         logs.append(format_step('wait', f"✔ Receipt received (Status: {receipt.status})"))
 
         if receipt.status == 1:
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+from eth_utils import keccak
+from loguru import logger
+from web3 import AsyncWeb3
+
+# Constants
+GAS_LIMIT_CACHE_PATH = os.environ.get(
+    'GAS_LIMIT_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'gas_limits.json'),
+)
+DEFAULT_GAS_BUFFER = 1.2 # Headroom applied on top of the learned/estimated gas
+LEARNED_DECAY = 0.9 # Each receipt lets a learned value shrink by at most 10% toward the observed gasUsed
+SAVE_INTERVAL_SECONDS = 10 # Table is written to disk at most this often (and at exit)
+MAX_TRACKED_TXS = 10000 # Sent transactions whose receipt we still expect
+_ESTIMATE_IGNORED_FIELDS = ('gas', 'nonce', 'gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas', 'type')
+
+
+def _hex_data(data: Union[bytes, str, None]) -> str:
+    if isinstance(data, (bytes, bytearray)):
+        return '0x' + bytes(data).hex()
+    data = (data or '0x').lower()
+    return data if data.startswith('0x') else '0x' + data
+
+
+def gas_key(tx: Dict[str, Any]) -> str:
+    """'<to>:<4-byte selector>' for calls, '<to>:0x' for plain transfers, 'create:<code hash>' for deployments."""
+    data = _hex_data(tx.get('data'))
+    to = tx.get('to')
+    if not to:
+        return f"create:{keccak(hexstr=data).hex()[:16]}"
+    return f"{to.lower()}:{data[:10]}"
+
+
+class GasLimitCache:
+    """
+    Learned gas limits per (contract address, function selector), persisted as JSON.
+
+    The first transaction of a kind is seeded with eth_estimateGas; afterwards the gasUsed of
+    successful receipts keeps the value current (it rises immediately and decays slowly), so
+    later transactions skip the estimate round trip and don't reserve inflated limits.
+    """
+
+    def __init__(self, path: str = GAS_LIMIT_CACHE_PATH):
+        self.path = path
+        self._limits: Dict[str, int] = {}
+        self._tracked: "OrderedDict[str, tuple]" = OrderedDict() # tx hash -> (key, gas limit sent with)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load()
+        atexit.register(self.save)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                self._limits = {key: int(value) for key, value in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable gas limit cache {self.path}: {e}")
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._limits)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path) # Atomic: readers never see a half-written file
+        except OSError as e:
+            logger.warning(f"Could not write gas limit cache {self.path}: {e}")
+
+    def _update(self, key: str, gas: int) -> None:
+        with self._lock:
+            self._limits[key] = gas
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= SAVE_INTERVAL_SECONDS
+        if due:
+            self.save()
+
+    def learned(self, tx: Dict[str, Any]) -> Optional[int]:
+        return self._limits.get(gas_key(tx))
+
+    async def gas_limit(self, w3: AsyncWeb3, tx: Dict[str, Any], fallback: Optional[int] = None, buffer: float = DEFAULT_GAS_BUFFER) -> int:
+        """
+        Gas limit for tx: learned value if known, otherwise eth_estimateGas (which seeds the table).
+        If estimation fails, returns fallback, or re-raises when no fallback is given.
+        """
+        key = gas_key(tx)
+        learned = self._limits.get(key)
+        if learned is not None:
+            return int(learned * buffer)
+        try:
+            estimated = await w3.eth.estimate_gas({k: v for k, v in tx.items() if k not in _ESTIMATE_IGNORED_FIELDS})
+        except Exception:
+            if fallback is None:
+                raise
+            return fallback
+        self._update(key, estimated)
+        return int(estimated * buffer)
+
+    def track(self, tx_hash: Union[bytes, str], tx: Dict[str, Any]) -> None:
+        """Remembers a sent transaction so its receipt can update the table."""
+        hash_key = _hex_data(tx_hash)
+        with self._lock:
+            self._tracked[hash_key] = (gas_key(tx), tx.get('gas'))
+            while len(self._tracked) > MAX_TRACKED_TXS:
+                self._tracked.popitem(last=False)
+
+    def observe_receipt(self, receipt: Dict[str, Any]) -> None:
+        """Feeds a mined receipt back into the table (only for transactions passed to track())."""
+        with self._lock:
+            tracked = self._tracked.pop(_hex_data(receipt['transactionHash']), None)
+        if tracked is None:
+            return
+        key, sent_gas = tracked
+        gas_used = receipt['gasUsed']
+        if receipt['status'] != 1:
+            if sent_gas is not None and gas_used >= sent_gas:
+                # Ran out of gas: the learned value is too low, re-estimate next time
+                with self._lock:
+                    self._limits.pop(key, None)
+                    self._dirty = True
+            return # Reverted for another reason: gasUsed says nothing about a successful call
+        learned = self._limits.get(key)
+        self._update(key, gas_used if learned is None else max(gas_used, int(learned * LEARNED_DECAY)))
+
+
+# Process-wide instance (send_transaction() tracks, wait_for_receipt() observes)
+gas_limit_cache = GasLimitCache()
+
+
+async def get_gas_limit(w3: AsyncWeb3, tx: Dict[str, Any], fallback: Optional[int] = None, buffer: float = DEFAULT_GAS_BUFFER) -> int:
+    """Shortcut for gas_limit_cache.gas_limit()."""
+    return await gas_limit_cache.gas_limit(w3, tx, fallback, buffer)
@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+from statistics import median
+from typing import Dict, List, Optional
+
+from loguru import logger
+from web3 import AsyncWeb3
+
+# Constants
+GAS_ORACLE_REFRESH_SECONDS = float(os.environ.get('GAS_ORACLE_REFRESH_SECONDS', '1.0')) # Roughly one Monad block
+FEE_HISTORY_BLOCKS = 20 # Blocks sampled by eth_feeHistory for the tip percentiles
+FEE_STRATEGIES = {"slow": 10, "standard": 50, "fast": 90} # Strategy -> priority-fee reward percentile
+DEFAULT_FEE_STRATEGY = "standard"
+BASE_FEE_HEADROOM = 2 # maxFeePerGas = base_fee * headroom + tip; covers base fee growth while a snapshot is reused
+
+
+class GasSnapshot:
+    """Fee data read in one refresh; everything the scripts need to price a transaction."""
+
+    def __init__(self, gas_price: int, base_fee: Optional[int], node_tip: Optional[int], rewards: Dict[int, List[int]]):
+        self.gas_price = gas_price
+        self.base_fee = base_fee
+        self.node_tip = node_tip
+        self.rewards = rewards # Percentile -> reward per sampled block
+        self.fetched_at = time.monotonic()
+
+    def priority_fee(self, strategy: str = DEFAULT_FEE_STRATEGY) -> int:
+        if strategy not in FEE_STRATEGIES:
+            raise ValueError(f"Unknown fee strategy '{strategy}'. Choose from: {', '.join(FEE_STRATEGIES)}")
+        samples = [reward for reward in self.rewards.get(FEE_STRATEGIES[strategy], []) if reward > 0]
+        if samples:
+            return int(median(samples))
+        # Empty blocks pay no tips; fall back to the node's own suggestion
+        if self.node_tip is not None:
+            return self.node_tip
+        return max(self.gas_price - (self.base_fee or 0), 0)
+
+
+class GasOracle:
+    """
+    Shared gas price source for one AsyncWeb3 transport.
+
+    Fee data (eth_gasPrice, eth_maxPriorityFeePerGas and eth_feeHistory, fetched concurrently)
+    is refreshed at most once per GAS_ORACLE_REFRESH_SECONDS; every transaction built in
+    between is priced from memory. Concurrent refreshes are coalesced into one.
+    """
+
+    def __init__(self, w3: AsyncWeb3, refresh_seconds: float = GAS_ORACLE_REFRESH_SECONDS):
+        self.w3 = w3
+        self.refresh_seconds = refresh_seconds
+        self.loop = asyncio.get_running_loop()
+        self._snapshot: Optional[GasSnapshot] = None
+        self._refreshing: Optional[asyncio.Future] = None
+
+    async def snapshot(self) -> GasSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.fetched_at < self.refresh_seconds:
+            return snapshot
+        if self._refreshing is None or self._refreshing.done():
+            # The refresh runs as its own task so that cancelling the caller that started it
+            # (a stopped bot task) doesn't cancel it for the other callers sharing it
+            self._refreshing = asyncio.ensure_future(self._refresh())
+            self._refreshing.add_done_callback(lambda f: f.cancelled() or f.exception()) # Mark retrieved if nobody awaits it
+        return await asyncio.shield(self._refreshing)
+
+    async def _refresh(self) -> GasSnapshot:
+        snapshot = await self._fetch()
+        self._snapshot = snapshot
+        return snapshot
+
+    async def _fetch(self) -> GasSnapshot:
+        percentiles = sorted(FEE_STRATEGIES.values())
+        gas_price, node_tip, history = await asyncio.gather(
+            self.w3.eth.gas_price,
+            self.w3.eth.max_priority_fee,
+            self.w3.eth.fee_history(FEE_HISTORY_BLOCKS, 'latest', percentiles),
+            return_exceptions=True,
+        )
+        if isinstance(gas_price, Exception):
+            raise gas_price # Nothing to price transactions with
+        if isinstance(node_tip, Exception):
+            node_tip = None
+
+        base_fee = None
+        rewards: Dict[int, List[int]] = {}
+        if isinstance(history, Exception):
+            logger.debug(f"eth_feeHistory unavailable, using node fee suggestions: {history}")
+        else:
+            base_fees = history.get('baseFeePerGas') or []
+            if base_fees:
+                base_fee = base_fees[-1] # Last entry is the base fee of the next (pending) block
+            for block_rewards in history.get('reward') or []:
+                for percentile, reward in zip(percentiles, block_rewards):
+                    rewards.setdefault(percentile, []).append(reward)
+        if base_fee is None and node_tip is not None:
+            base_fee = max(gas_price - node_tip, 0)
+        return GasSnapshot(gas_price, base_fee, node_tip, rewards)
+
+
+# --- Process-wide Oracle Registry --- #
+# One oracle per AsyncWeb3 instance (rpc_pool shares those per RPC URL)
+_oracles: Dict[AsyncWeb3, GasOracle] = {}
+
+
+def get_gas_oracle(w3: AsyncWeb3) -> GasOracle:
+    oracle = _oracles.get(w3)
+    # The refresh future belongs to one event loop; rebuild if the loop changed
+    if oracle is None or oracle.loop is not asyncio.get_running_loop():
+        oracle = GasOracle(w3)
+        _oracles[w3] = oracle
+    return oracle
+
+
+async def get_gas_price(w3: AsyncWeb3) -> int:
+    """Drop-in replacement for `await w3.eth.gas_price` (legacy transactions)."""
+    return (await get_gas_oracle(w3).snapshot()).gas_price
+
+
+async def get_eip1559_fees(w3: AsyncWeb3, strategy: str = DEFAULT_FEE_STRATEGY) -> Dict[str, int]:
+    """maxFeePerGas / maxPriorityFeePerGas for a type-2 transaction, priced with the given strategy."""
+    snapshot = await get_gas_oracle(w3).snapshot()
+    if snapshot.base_fee is None:
+        raise ValueError("Base fee unavailable from RPC; use legacy gas pricing")
+    tip = snapshot.priority_fee(strategy)
+    return {
+        "maxFeePerGas": snapshot.base_fee * BASE_FEE_HEADROOM + tip,
+        "maxPriorityFeePerGas": tip,
+    }
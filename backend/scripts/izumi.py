@@ -2,6 +2,11 @@ import os
 import random
 import asyncio
 from web3 import Web3
+from rpc_pool import get_web3, get_async_web3
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 from colorama import init, Fore, Style
 import traceback
 
@@ -13,6 +18,9 @@ DEFAULT_RPC_URL = "https://testnet-rpc.monad.xyz/"
 DEFAULT_EXPLORER_URL = "https://testnet.monadexplorer.com/tx/0x"
 DEFAULT_WMON_CONTRACT = "0x760AfE86e5de5fa0Ee542fc7B7B713e1c5425701"
 DEFAULT_CHAIN_ID = 10143
+# Fallback gas limits, only used if the learned limit is unknown and estimation fails
+GAS_LIMIT_WRAP = 50000
+GAS_LIMIT_UNWRAP = 60000
 
 # ABI for WMON
 wmon_abi = [
@@ -24,10 +32,7 @@ wmon_abi = [
 def connect_to_rpc(rpc_url):
     # Use default RPC if None is provided
     rpc_url_to_use = rpc_url if rpc_url is not None else DEFAULT_RPC_URL
-    w3 = Web3(Web3.HTTPProvider(rpc_url_to_use))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url_to_use}")
-    return w3
+    return get_web3(rpc_url_to_use)
 
 # Helper function to format step messages for logs
 def format_step(step, message):
@@ -57,7 +62,7 @@ async def execute_izumi_wrap_unwrap(
 
     try:
         # --- Setup --- #
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url or DEFAULT_RPC_URL)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         contract = w3.eth.contract(address=w3.to_checksum_address(wmon_contract_address), abi=wmon_abi)
@@ -66,26 +71,24 @@ async def execute_izumi_wrap_unwrap(
 
         # --- Wrap MON --- #
         logs.append(format_step('wrap', f"Preparing to wrap {amount_mon} MON..."))
-        gas_price_wrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-        nonce_wrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_transaction_count(account.address))
+        gas_price_wrap = await get_gas_price(w3)
 
-        tx_wrap = contract.functions.deposit().build_transaction({
+        tx_wrap = await contract.functions.deposit().build_transaction({
             'from': account.address,
             'value': amount_wei,
-            'gas': 50000, # Adjusted gas limit
+            'gas': GAS_LIMIT_WRAP, # Placeholder so build_transaction doesn't estimate; replaced below
             'gasPrice': gas_price_wrap,
-            'nonce': nonce_wrap,
             'chainId': chain_id
         })
+        tx_wrap['gas'] = await get_gas_limit(w3, tx_wrap, fallback=GAS_LIMIT_WRAP)
 
         logs.append(format_step('wrap', 'Sending wrap transaction...'))
-        signed_tx_wrap = w3.eth.account.sign_transaction(tx_wrap, private_key)
-        tx_hash_wrap_bytes = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.send_raw_transaction(signed_tx_wrap.raw_transaction))
+        tx_hash_wrap_bytes = await send_transaction(w3, tx_wrap, private_key)
         wrap_tx_hash = tx_hash_wrap_bytes.hex()
         tx_link_wrap = f"{explorer_url}{wrap_tx_hash}"
         logs.append(format_step('wrap', f"Tx Hash: {tx_link_wrap}"))
 
-        receipt_wrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_wrap_bytes, timeout=180))
+        receipt_wrap = await wait_for_receipt(w3, tx_hash_wrap_bytes, timeout=180)
 
         if receipt_wrap.status != 1:
             logs.append(format_step('wrap', f"✘ Wrap transaction failed: Status {receipt_wrap.status}"))
@@ -99,25 +102,23 @@ async def execute_izumi_wrap_unwrap(
 
         # --- Unwrap WMON --- #
         logs.append(format_step('unwrap', f"Preparing to unwrap {amount_mon} WMON..."))
-        gas_price_unwrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-        nonce_unwrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_transaction_count(account.address))
+        gas_price_unwrap = await get_gas_price(w3)
 
-        tx_unwrap = contract.functions.withdraw(amount_wei).build_transaction({
+        tx_unwrap = await contract.functions.withdraw(amount_wei).build_transaction({
             'from': account.address,
-            'gas': 60000, # Adjusted gas limit
+            'gas': GAS_LIMIT_UNWRAP, # Placeholder so build_transaction doesn't estimate; replaced below
             'gasPrice': gas_price_unwrap,
-            'nonce': nonce_unwrap,
             'chainId': chain_id
         })
+        tx_unwrap['gas'] = await get_gas_limit(w3, tx_unwrap, fallback=GAS_LIMIT_UNWRAP)
 
         logs.append(format_step('unwrap', 'Sending unwrap transaction...'))
-        signed_tx_unwrap = w3.eth.account.sign_transaction(tx_unwrap, private_key)
-        tx_hash_unwrap_bytes = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.send_raw_transaction(signed_tx_unwrap.raw_transaction))
+        tx_hash_unwrap_bytes = await send_transaction(w3, tx_unwrap, private_key)
         unwrap_tx_hash = tx_hash_unwrap_bytes.hex()
         tx_link_unwrap = f"{explorer_url}{unwrap_tx_hash}"
         logs.append(format_step('unwrap', f"Tx Hash: {tx_link_unwrap}"))
 
-        receipt_unwrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_unwrap_bytes, timeout=180))
+        receipt_unwrap = await wait_for_receipt(w3, tx_hash_unwrap_bytes, timeout=180)
 
         if receipt_unwrap.status != 1:
             logs.append(format_step('unwrap', f"✘ Unwrap transaction failed: Status {receipt_unwrap.status}"))
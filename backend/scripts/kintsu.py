@@ -2,6 +2,11 @@ import os
 import random
 import asyncio
 from web3 import Web3
+from rpc_pool import get_web3, get_async_web3, get_chain_id
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 from web3.exceptions import ContractLogicError
 # Keep colorama for potential direct script testing, but API won't use colors directly
 from colorama import init, Fore, Style
@@ -13,6 +18,7 @@ DEFAULT_RPC_URL = "https://testnet-rpc.monad.xyz/"
 DEFAULT_EXPLORER_URL = "https://testnet.monadexplorer.com/tx/0x"
 DEFAULT_KITSU_STAKING_CONTRACT = "0x07AabD925866E8353407E67C1D157836f7Ad923e"
 DEFAULT_CHAIN_ID = 10143 # Monad testnet chain ID
+DEFAULT_GAS_LIMIT = 500000 # Only used if the learned limit is unknown and estimation fails
 
 # ABI remains the same
 staking_abi = [
@@ -23,10 +29,7 @@ staking_abi = [
 
 # Helper function to connect to RPC
 def connect_to_rpc(rpc_url):
-    w3 = Web3(Web3.HTTPProvider(rpc_url))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url}")
-    return w3
+    return get_web3(rpc_url)
 
 # Function to display pretty border (returns string)
 def format_border(text, width=60):
@@ -55,42 +58,39 @@ async def execute_kitsu_stake(
 ) -> dict:
     logs = []
     try:
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         contract = w3.eth.contract(address=w3.to_checksum_address(contract_address), abi=staking_abi)
 
         logs.append(format_border(f"Staking {w3.from_wei(amount_wei, 'ether')} MON | {wallet_short}"))
 
-        balance = w3.eth.get_balance(account.address)
+        balance = await w3.eth.get_balance(account.address)
         logs.append(format_step('stake', f"Balance: {w3.from_wei(balance, 'ether')} MON"))
         if balance < amount_wei:
             raise ValueError(f"Insufficient balance: {w3.from_wei(balance, 'ether')} < {w3.from_wei(amount_wei, 'ether')}")
 
         # Estimate gas price (using legacy method here for simplicity, consider EIP-1559 later)
-        gas_price = w3.eth.gas_price
+        gas_price = await get_gas_price(w3)
 
-        tx = contract.functions.stake().build_transaction({
+        tx = await contract.functions.stake().build_transaction({
             'from': account.address,
             'value': amount_wei,
-            'gas': 500000, # Keep generous gas limit for now
+            'gas': DEFAULT_GAS_LIMIT, # Placeholder so build_transaction doesn't estimate; replaced below
             'gasPrice': gas_price,
-            'nonce': w3.eth.get_transaction_count(account.address),
-            'chainId': w3.eth.chain_id # Get chain ID from connected node
+            'chainId': await get_chain_id(w3) # Get chain ID from connected node
         })
+        tx['gas'] = await get_gas_limit(w3, tx, fallback=DEFAULT_GAS_LIMIT)
 
         logs.append(format_step('stake', "Sending stake transaction..."))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = await send_transaction(w3, tx, private_key)
         tx_hash_hex = tx_hash.hex()
         tx_link = f"{explorer_url}{tx_hash_hex}"
 
         logs.append(format_step('stake', f"Tx Hash: {tx_link}"))
 
         # Wait for receipt (consider adding timeout)
-        receipt = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
-        )
+        receipt = await wait_for_receipt(w3, tx_hash, timeout=180)
 
         if receipt.status == 1:
             logs.append(format_step('stake', "✔ Stake successful!"))
@@ -125,7 +125,7 @@ async def execute_kitsu_unstake(
 ) -> dict:
     logs = []
     try:
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         # Create contract instance using the ABI
@@ -135,30 +135,27 @@ async def execute_kitsu_unstake(
         logs.append(format_border(f"Unstaking {w3.from_wei(amount_wei, 'ether')} MON (amount) | {wallet_short}"))
 
         # Estimate gas price
-        gas_price = w3.eth.gas_price
+        gas_price = await get_gas_price(w3)
 
         # Build transaction using the withdraw function from ABI
-        tx = contract.functions.withdraw(amount_wei).build_transaction({
+        tx = await contract.functions.withdraw(amount_wei).build_transaction({
             'from': account.address,
             # 'value' is not needed for withdraw as it's not payable
-            'gas': 500000, # Keep generous gas limit
+            'gas': DEFAULT_GAS_LIMIT, # Placeholder so build_transaction doesn't estimate; replaced below
             'gasPrice': gas_price,
-            'nonce': w3.eth.get_transaction_count(account.address),
-            'chainId': w3.eth.chain_id
+            'chainId': await get_chain_id(w3)
         })
+        tx['gas'] = await get_gas_limit(w3, tx, fallback=DEFAULT_GAS_LIMIT)
 
         logs.append(format_step('unstake', "Sending unstake transaction..."))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = await send_transaction(w3, tx, private_key)
         tx_hash_hex = tx_hash.hex()
         tx_link = f"{explorer_url}{tx_hash_hex}"
 
         logs.append(format_step('unstake', f"Tx Hash: {tx_link}"))
 
         # Wait for receipt
-        receipt = await asyncio.get_event_loop().run_in_executor(
-             None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
-        )
+        receipt = await wait_for_receipt(w3, tx_hash, timeout=180)
 
         if receipt.status == 1:
             logs.append(format_step('unstake', "✔ Unstake successful!"))
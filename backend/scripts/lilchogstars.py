@@ -3,6 +3,11 @@ import random
 from typing import Dict, List, Optional
 from eth_account import Account
 from web3 import AsyncWeb3, Web3
+from rpc_pool import get_web3, get_async_web3
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_eip1559_fees
+from gas_limits import get_gas_limit
 from loguru import logger
 import traceback
 
@@ -35,10 +40,7 @@ def connect_to_rpc(rpc_url):
     # Use synchronous Web3 for setup, async for calls within the main function
     # Use default RPC if None is provided
     rpc_url_to_use = rpc_url if rpc_url is not None else DEFAULT_RPC_URL
-    w3 = Web3(Web3.HTTPProvider(rpc_url_to_use))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url_to_use}")
-    return w3
+    return get_web3(rpc_url_to_use)
 
 # Helper function to format step messages for logs
 def format_step(step, message):
@@ -66,11 +68,9 @@ async def execute_lilchogstars_mint(
 
     try:
         # --- Setup --- #
-        # Use default RPC URL if none provided and create AsyncWeb3 for interactions
+        # Use default RPC URL if none provided and reuse the shared AsyncWeb3 for interactions
         rpc_url_to_use = rpc_url if rpc_url is not None else DEFAULT_RPC_URL
-        w3_async = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(rpc_url_to_use))
-        if not await w3_async.is_connected():
-            raise ConnectionError(f"Could not connect to Async RPC: {rpc_url_to_use}")
+        w3_async = await get_async_web3(rpc_url_to_use) # Shared transport; raises ConnectionError if unreachable
 
         account = Account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
@@ -112,43 +112,34 @@ async def execute_lilchogstars_mint(
 
         # --- Prepare Mint Transaction (assuming quantity=1) --- #
         logs.append(format_step('mint', f"Preparing mint transaction (quantity=1)..."))
-        latest_block = await w3_async.eth.get_block('latest')
-        base_fee = latest_block['baseFeePerGas']
-        max_priority_fee = await w3_async.eth.max_priority_fee
-        gas_params = {
-            "maxFeePerGas": base_fee + max_priority_fee,
-            "maxPriorityFeePerGas": max_priority_fee,
-        }
-        nonce = await w3_async.eth.get_transaction_count(account.address)
+        gas_params = await get_eip1559_fees(w3_async)
 
         mint_tx = await contract.functions.mint(1).build_transaction({
             "from": account.address,
             "value": 0, # Free mint
-            "nonce": nonce,
             "type": 2,
             "chainId": chain_id,
+            "gas": 300000, # Placeholder so build_transaction doesn't estimate; replaced below
             **gas_params,
         })
 
-        # Estimate gas (optional but good practice)
+        # Gas limit: learned from earlier mints, estimated (once) otherwise
         try:
-            gas_estimate = await w3_async.eth.estimate_gas(mint_tx)
-            mint_tx['gas'] = int(gas_estimate * 1.2) # Add 20% buffer
-            logs.append(format_step('mint', f"Estimated Gas: {gas_estimate}, Using: {mint_tx['gas']}"))
+            mint_tx['gas'] = await get_gas_limit(w3_async, mint_tx)
+            logs.append(format_step('mint', f"Using gas limit: {mint_tx['gas']}"))
         except Exception as est_err:
             logs.append(format_step('mint', f"⚠️ Gas estimation failed ({est_err}), using default 300000"))
             mint_tx['gas'] = 300000 # Fallback gas limit
 
         # --- Sign and Send --- #
         logs.append(format_step('mint', "Sending mint transaction..."))
-        signed_tx = Account.sign_transaction(mint_tx, private_key)
-        tx_hash_bytes = await w3_async.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash_bytes = await send_transaction(w3_async, mint_tx, private_key)
         tx_hash = tx_hash_bytes.hex()
         tx_link = f"{explorer_url}{tx_hash}"
         logs.append(format_step('mint', f"Tx Hash: {tx_link}"))
 
         # --- Wait for Receipt --- #
-        receipt = await w3_async.eth.wait_for_transaction_receipt(tx_hash_bytes, timeout=180)
+        receipt = await wait_for_receipt(w3_async, tx_hash_bytes, timeout=180)
 
         if receipt.status != 1:
             logs.append(format_step('mint', f"✘ Mint transaction failed: Status {receipt.status}"))
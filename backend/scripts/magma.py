@@ -1,7 +1,13 @@
 import os
 import random
 import asyncio
+from typing import Optional
 from web3 import Web3
+from rpc_pool import get_web3, get_async_web3, get_chain_id
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 from colorama import init # Keep for potential direct testing
 
 init(autoreset=True)
@@ -15,10 +21,7 @@ DEFAULT_GAS_LIMIT_UNSTAKE = 800000
 
 # --- Helper Functions (from kintsu.py, adapted) ---
 def connect_to_rpc(rpc_url):
-    w3 = Web3(Web3.HTTPProvider(rpc_url))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url}")
-    return w3
+    return get_web3(rpc_url)
 
 def format_border(text, width=60):
     return f"┌{'─' * (width - 2)}┐\n│ {text:^56} │\n└{'─' * (width - 2)}┘"
@@ -42,45 +45,41 @@ async def execute_magma_stake(
     rpc_url: str = DEFAULT_RPC_URL,
     contract_address: str = DEFAULT_MAGMA_CONTRACT,
     explorer_url: str = DEFAULT_EXPLORER_URL,
-    gas_limit: int = DEFAULT_GAS_LIMIT_STAKE
+    gas_limit: Optional[int] = None # None = learned limit (DEFAULT_GAS_LIMIT_STAKE if it can't be estimated)
 ) -> dict:
     logs = []
     try:
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         contract_checksum = w3.to_checksum_address(contract_address)
 
         logs.append(format_border(f"Staking {w3.from_wei(amount_wei, 'ether')} MON (Magma) | {wallet_short}"))
 
-        balance = w3.eth.get_balance(account.address)
+        balance = await w3.eth.get_balance(account.address)
         logs.append(format_step('stake', f"Balance: {w3.from_wei(balance, 'ether')} MON"))
         if balance < amount_wei:
             raise ValueError(f"Insufficient balance: {w3.from_wei(balance, 'ether')} < {w3.from_wei(amount_wei, 'ether')}")
 
-        gas_price = w3.eth.gas_price
+        gas_price = await get_gas_price(w3)
         tx = {
             'to': contract_checksum,
             'data': '0xd5575982', # Magma stake function selector
             'from': account.address,
             'value': amount_wei,
-            'gas': gas_limit,
             'gasPrice': gas_price,
-            'nonce': w3.eth.get_transaction_count(account.address),
-            'chainId': w3.eth.chain_id
+            'chainId': await get_chain_id(w3)
         }
+        tx['gas'] = gas_limit or await get_gas_limit(w3, tx, fallback=DEFAULT_GAS_LIMIT_STAKE)
 
         logs.append(format_step('stake', 'Sending transaction...'))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = await send_transaction(w3, tx, private_key)
         tx_hash_hex = tx_hash.hex()
         tx_link = f"{explorer_url}{tx_hash_hex}"
 
         logs.append(format_step('stake', f"Tx: {tx_link}"))
 
-        receipt = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
-        )
+        receipt = await wait_for_receipt(w3, tx_hash, timeout=180)
 
         if receipt.status == 1:
             logs.append(format_step('stake', f"✔ Stake successful!"))
@@ -106,11 +105,11 @@ async def execute_magma_unstake(
     rpc_url: str = DEFAULT_RPC_URL,
     contract_address: str = DEFAULT_MAGMA_CONTRACT,
     explorer_url: str = DEFAULT_EXPLORER_URL,
-    gas_limit: int = DEFAULT_GAS_LIMIT_UNSTAKE
+    gas_limit: Optional[int] = None # None = learned limit (DEFAULT_GAS_LIMIT_UNSTAKE if it can't be estimated)
 ) -> dict:
     logs = []
     try:
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         contract_checksum = w3.to_checksum_address(contract_address)
@@ -122,28 +121,24 @@ async def execute_magma_unstake(
         encoded_amount = w3.to_hex(amount_wei)[2:].zfill(64)
         data = unstake_selector + encoded_amount
 
-        gas_price = w3.eth.gas_price
+        gas_price = await get_gas_price(w3)
         tx = {
             'to': contract_checksum,
             'data': data,
             'from': account.address,
-            'gas': gas_limit,
             'gasPrice': gas_price,
-            'nonce': w3.eth.get_transaction_count(account.address),
-            'chainId': w3.eth.chain_id
+            'chainId': await get_chain_id(w3)
         }
+        tx['gas'] = gas_limit or await get_gas_limit(w3, tx, fallback=DEFAULT_GAS_LIMIT_UNSTAKE)
 
         logs.append(format_step('unstake', 'Sending transaction...'))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash = await send_transaction(w3, tx, private_key)
         tx_hash_hex = tx_hash.hex()
         tx_link = f"{explorer_url}{tx_hash_hex}"
 
         logs.append(format_step('unstake', f"Tx: {tx_link}"))
 
-        receipt = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
-        )
+        receipt = await wait_for_receipt(w3, tx_hash, timeout=180)
 
         if receipt.status == 1:
             logs.append(format_step('unstake', f"✔ Unstake successful!"))
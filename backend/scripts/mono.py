@@ -2,6 +2,11 @@ import os
 import asyncio
 import random
 from web3 import Web3
+from rpc_pool import get_web3, get_async_web3
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 import traceback
 
 # Constants
@@ -14,10 +19,7 @@ DEFAULT_VALUE_MON = 0.005 # Further reduced amount
 def connect_to_rpc(rpc_url):
     # Use default RPC if None is provided
     rpc_url_to_use = rpc_url if rpc_url is not None else DEFAULT_RPC_URL
-    w3 = Web3(Web3.HTTPProvider(rpc_url_to_use))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url_to_use}")
-    return w3
+    return get_web3(rpc_url_to_use)
 
 # Helper function to format step messages for logs
 def format_step(step, message):
@@ -44,7 +46,7 @@ async def execute_mono_transaction(
 
     try:
         # --- Setup --- #
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url or DEFAULT_RPC_URL)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
 
@@ -55,7 +57,7 @@ async def execute_mono_transaction(
 
         # --- Check Balance --- #
         logs.append(format_step('balance', "Checking balance..."))
-        balance_wei = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_balance(account.address))
+        balance_wei = await w3.eth.get_balance(account.address)
         balance_mon_str = f"{w3.from_wei(balance_wei, 'ether'):.6f}"
         logs.append(format_step('balance', f"Balance: {balance_mon_str} MON"))
 
@@ -68,8 +70,7 @@ async def execute_mono_transaction(
         # Prepare native transfer to provided recipient address
         recipient = w3.to_checksum_address(recipient_address)
         logs.append(format_step('send', f"Preparing native MON transfer to {recipient} (amount: {value_mon} MON)..."))
-        gas_price = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-        nonce = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_transaction_count(account.address))
+        gas_price = await get_gas_price(w3)
 
         # Build native transaction dict
         tx = {
@@ -77,29 +78,26 @@ async def execute_mono_transaction(
             'to': recipient,
             'value': value_wei,
             'gasPrice': gas_price,
-            'nonce': nonce,
             'chainId': chain_id
         }
 
-        # Estimate Gas
+        # Gas limit: learned from earlier sends, estimated (once) otherwise
         try:
-            gas_limit = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.estimate_gas(tx))
-            tx['gas'] = int(gas_limit * 1.2) # Add buffer
-            logs.append(format_step('send', f"Estimated Gas: {gas_limit}, Using: {tx['gas']}"))
+            tx['gas'] = await get_gas_limit(w3, tx)
+            logs.append(format_step('send', f"Using gas limit: {tx['gas']}"))
         except Exception as est_err:
             logs.append(format_step('send', f"⚠️ Gas estimation failed ({est_err}), using default 500000"))
             tx['gas'] = 500000 # Fallback gas limit
 
         # --- Sign and Send --- #
         logs.append(format_step('send', "Sending transaction..."))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash_bytes = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.send_raw_transaction(signed_tx.raw_transaction))
+        tx_hash_bytes = await send_transaction(w3, tx, private_key)
         tx_hash = tx_hash_bytes.hex()
         tx_link = f"{explorer_url}{tx_hash}"
         logs.append(format_step('send', f"Tx Hash: {tx_link}"))
 
         # --- Wait for Receipt --- #
-        receipt = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_bytes, timeout=180))
+        receipt = await wait_for_receipt(w3, tx_hash_bytes, timeout=180)
 
         if receipt.status != 1:
             logs.append(format_step('send', f"✘ Transaction failed: Status {receipt.status}"))
@@ -0,0 +1,181 @@
+import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from eth_abi import abi
+from web3 import AsyncWeb3, Web3
+
+# Constants
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11" # Same address on every chain incl. Monad testnet
+NATIVE_KEY = "native" # Key used for the native (MON) balance in get_token_balances() results
+BALANCE_OF_SELECTOR = bytes.fromhex("70a08231") # balanceOf(address)
+GET_ETH_BALANCE_SELECTOR = bytes.fromhex("4d2301cc") # getEthBalance(address)
+
+MULTICALL3_ABI = [
+    {"inputs": [{"components": [{"internalType": "address", "name": "target", "type": "address"}, {"internalType": "bool", "name": "allowFailure", "type": "bool"}, {"internalType": "bytes", "name": "callData", "type": "bytes"}], "internalType": "struct Multicall3.Call3[]", "name": "calls", "type": "tuple[]"}], "name": "aggregate3", "outputs": [{"components": [{"internalType": "bool", "name": "success", "type": "bool"}, {"internalType": "bytes", "name": "returnData", "type": "bytes"}], "internalType": "struct Multicall3.Result[]", "name": "returnData", "type": "tuple[]"}], "stateMutability": "payable", "type": "function"},
+    {"inputs": [{"internalType": "address", "name": "addr", "type": "address"}], "name": "getEthBalance", "outputs": [{"internalType": "uint256", "name": "balance", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+]
+
+
+async def aggregate3(
+    w3: AsyncWeb3,
+    calls: Sequence[Tuple[str, bytes]],
+    allow_failure: bool = True,
+    multicall_address: str = MULTICALL3_ADDRESS,
+) -> List[Tuple[bool, bytes]]:
+    """
+    Executes (target, calldata) read calls in a single eth_call through Multicall3.aggregate3.
+    With allow_failure=True a reverting sub-call comes back as (False, revert_data) instead of failing the batch.
+    """
+    if not calls:
+        return []
+    multicall = w3.eth.contract(address=Web3.to_checksum_address(multicall_address), abi=MULTICALL3_ABI)
+    call_structs = [(Web3.to_checksum_address(target), allow_failure, call_data) for target, call_data in calls]
+    results = await multicall.functions.aggregate3(call_structs).call()
+    return [(bool(success), bytes(return_data)) for success, return_data in results]
+
+
+def _decode_uint(success: bool, return_data: bytes) -> Optional[int]:
+    if not success or len(return_data) < 32:
+        return None
+    return abi.decode(['uint256'], return_data[:32])[0]
+
+
+async def _get_token_balances_individually(
+    w3: AsyncWeb3,
+    owner: str,
+    token_addresses: Dict[str, str],
+    include_native: bool,
+) -> Dict[str, Optional[int]]:
+    """Fallback when Multicall3 is unavailable: same result shape, one concurrent call per balance."""
+    owner = Web3.to_checksum_address(owner)
+    call_data = BALANCE_OF_SELECTOR + abi.encode(['address'], [owner])
+
+    async def read_token(address: str) -> Optional[int]:
+        try:
+            return _decode_uint(True, bytes(await w3.eth.call({'to': Web3.to_checksum_address(address), 'data': call_data})))
+        except Exception:
+            return None
+
+    async def read_native() -> Optional[int]:
+        try:
+            return await w3.eth.get_balance(owner)
+        except Exception:
+            return None
+
+    keys = list(token_addresses)
+    reads = [read_token(token_addresses[key]) for key in keys]
+    if include_native:
+        keys.append(NATIVE_KEY)
+        reads.append(read_native())
+    return dict(zip(keys, await asyncio.gather(*reads)))
+
+
+async def get_token_balances(
+    w3: AsyncWeb3,
+    owner: str,
+    token_addresses: Dict[str, str],
+    include_native: bool = True,
+    multicall_address: str = MULTICALL3_ADDRESS,
+) -> Dict[str, Optional[int]]:
+    """
+    Reads owner's ERC20 balances (and native balance under NATIVE_KEY) in one RPC round trip.
+
+    token_addresses maps any key (e.g. symbol) to a token address; the result uses the same keys.
+    A value of None means that particular read failed; the others are still returned.
+    """
+    owner = Web3.to_checksum_address(owner)
+    keys = list(token_addresses)
+    balance_of_data = BALANCE_OF_SELECTOR + abi.encode(['address'], [owner])
+    calls = [(token_addresses[key], balance_of_data) for key in keys]
+    if include_native:
+        keys.append(NATIVE_KEY)
+        calls.append((multicall_address, GET_ETH_BALANCE_SELECTOR + abi.encode(['address'], [owner])))
+
+    try:
+        results = await aggregate3(w3, calls, allow_failure=True, multicall_address=multicall_address)
+    except Exception:
+        # No Multicall3 on this RPC/chain (or the batch itself failed): degrade to per-token reads
+        return await _get_token_balances_individually(w3, owner, token_addresses, include_native)
+    return {key: _decode_uint(success, data) for key, (success, data) in zip(keys, results)}
+
+
+# --- Many Owners / Many Tokens --- #
+DECIMALS_SELECTOR = bytes.fromhex("313ce567") # decimals()
+MAX_CALLS_PER_MULTICALL = 500 # Keeps each eth_call well under node gas/response-size caps
+MAX_CONCURRENT_MULTICALLS = 4
+
+# Token decimals never change; cache them per (lowercased) token address
+_decimals_cache: Dict[str, Optional[int]] = {}
+
+
+async def _aggregate3_chunked(
+    w3: AsyncWeb3,
+    calls: List[Tuple[str, bytes]],
+    multicall_address: str,
+    chunk_size: int,
+) -> List[Optional[Tuple[bool, bytes]]]:
+    """aggregate3 over any number of calls, split into chunks run with bounded concurrency; a failed chunk yields None entries."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_MULTICALLS)
+
+    async def run_chunk(chunk: List[Tuple[str, bytes]]) -> List[Optional[Tuple[bool, bytes]]]:
+        async with semaphore:
+            try:
+                return await aggregate3(w3, chunk, allow_failure=True, multicall_address=multicall_address)
+            except Exception:
+                return [None] * len(chunk)
+
+    chunks = [calls[i:i + chunk_size] for i in range(0, len(calls), chunk_size)]
+    results: List[Optional[Tuple[bool, bytes]]] = []
+    for chunk_result in await asyncio.gather(*(run_chunk(chunk) for chunk in chunks)):
+        results.extend(chunk_result)
+    return results
+
+
+async def get_token_decimals(
+    w3: AsyncWeb3,
+    token_addresses: Sequence[str],
+    multicall_address: str = MULTICALL3_ADDRESS,
+) -> Dict[str, Optional[int]]:
+    """decimals() for each token (keyed by lowercased address), fetched once per process via Multicall3."""
+    missing = sorted({address.lower() for address in token_addresses} - set(_decimals_cache))
+    if missing:
+        results = await _aggregate3_chunked(w3, [(address, DECIMALS_SELECTOR) for address in missing], multicall_address, MAX_CALLS_PER_MULTICALL)
+        for address, result in zip(missing, results):
+            if result is not None: # Don't cache transport failures
+                token_decimals = _decode_uint(*result)
+                # decimals() is a uint8; anything else means the target isn't a standard ERC20
+                _decimals_cache[address] = token_decimals if token_decimals is not None and token_decimals <= 255 else None
+    return {address.lower(): _decimals_cache.get(address.lower()) for address in token_addresses}
+
+
+async def get_balances_for_owners(
+    w3: AsyncWeb3,
+    owners: Sequence[str],
+    token_addresses: Sequence[str],
+    include_native: bool = True,
+    multicall_address: str = MULTICALL3_ADDRESS,
+    chunk_size: int = MAX_CALLS_PER_MULTICALL,
+) -> Dict[str, Dict[str, Optional[int]]]:
+    """
+    Balances of every owner for every token (plus native under NATIVE_KEY), using
+    ceil(owners * (tokens + 1) / chunk_size) eth_calls in total.
+    Returns {checksum_owner: {lowercased_token_address | NATIVE_KEY: balance_wei or None}}.
+    """
+    owners = [Web3.to_checksum_address(owner) for owner in owners]
+    tokens = list(dict.fromkeys(address.lower() for address in token_addresses)) # De-duplicate, keep order
+    keys: List[Tuple[str, str]] = []
+    calls: List[Tuple[str, bytes]] = []
+    for owner in owners:
+        encoded_owner = abi.encode(['address'], [owner])
+        for token in tokens:
+            keys.append((owner, token))
+            calls.append((token, BALANCE_OF_SELECTOR + encoded_owner))
+        if include_native:
+            keys.append((owner, NATIVE_KEY))
+            calls.append((multicall_address, GET_ETH_BALANCE_SELECTOR + encoded_owner))
+
+    balances: Dict[str, Dict[str, Optional[int]]] = {owner: {} for owner in owners}
+    results = await _aggregate3_chunked(w3, calls, multicall_address, chunk_size)
+    for (owner, key), result in zip(keys, results):
+        balances[owner][key] = _decode_uint(*result) if result is not None else None
+    return balances
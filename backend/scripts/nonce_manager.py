@@ -0,0 +1,159 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+from eth_account import Account
+from web3 import AsyncWeb3
+
+from loguru import logger
+
+from balance_cache import balance_cache
+from gas_limits import gas_limit_cache
+from tx_scheduler import tx_scheduler
+from retry_policy import ALREADY_KNOWN, DEFAULT_RETRY_POLICY, NONCE, TRANSIENT_ERRORS, UNDERPRICED, RetryPolicy, bump_fees, classify_error
+
+
+class NonceManager:
+    """
+    Per-address nonce allocator.
+
+    The first allocation for an address is seeded from the node's "pending" count;
+    later allocations are handed out locally, so a wallet sending several transactions
+    does not pay a get_transaction_count round trip for each one and can have more
+    than one transaction in flight.
+    """
+
+    def __init__(self):
+        self._next_nonce: Dict[str, int] = {}
+        # asyncio.Lock is bound to the loop that first awaits it; keep one per (address, loop)
+        self._locks: Dict[str, Tuple[asyncio.Lock, asyncio.AbstractEventLoop]] = {}
+
+    def _lock_for(self, key: str) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        entry = self._locks.get(key)
+        if entry is None or entry[1] is not loop:
+            entry = (asyncio.Lock(), loop)
+            self._locks[key] = entry
+        return entry[0]
+
+    async def allocate(self, w3: AsyncWeb3, address: str) -> int:
+        """Returns the next nonce for address, seeding from the node only when needed."""
+        key = AsyncWeb3.to_checksum_address(address)
+        async with self._lock_for(key):
+            nonce = self._next_nonce.get(key)
+            if nonce is None:
+                nonce = await w3.eth.get_transaction_count(key, "pending")
+            self._next_nonce[key] = nonce + 1
+            return nonce
+
+    async def resync(self, w3: AsyncWeb3, address: str) -> int:
+        """Re-reads the pending nonce from the node and makes it the next one handed out."""
+        key = AsyncWeb3.to_checksum_address(address)
+        async with self._lock_for(key):
+            nonce = await w3.eth.get_transaction_count(key, "pending")
+            self._next_nonce[key] = nonce
+            return nonce
+
+    def invalidate(self, address: str) -> None:
+        """Drops the local counter so the next allocate() re-seeds from the node."""
+        self._next_nonce.pop(AsyncWeb3.to_checksum_address(address), None)
+
+
+# Process-wide instance shared by every script
+nonce_manager = NonceManager()
+
+
+async def _landed(w3: AsyncWeb3, tx_hash: bytes) -> bool:
+    try:
+        await w3.eth.get_transaction(tx_hash)
+        return True
+    except Exception:
+        return False
+
+
+async def send_transaction(
+    w3: AsyncWeb3,
+    tx: Dict,
+    private_key: str,
+    manager: Optional[NonceManager] = None,
+    policy: Optional[RetryPolicy] = None,
+) -> bytes:
+    """
+    Signs and broadcasts tx, filling in the nonce from the nonce manager if it is missing.
+    Each send first waits for a slot from the transaction scheduler (see tx_scheduler.py).
+
+    Failed sends are retried per the retry policy: a nonce error resyncs the counter and
+    resubmits with a fresh nonce, an underpriced error bumps the fees and resubmits, and
+    a timeout/429/connection error resends the same signed transaction after a backoff
+    ("already known" then counts as success). A send that finally fails invalidates the
+    counter (the nonce was never consumed) and re-raises. So does a send cancelled midway
+    (stopped task), which otherwise would leave a gap that blocks the wallet's later
+    transactions. On success the cached balances of sender and recipient are invalidated.
+    Returns the transaction hash bytes.
+    """
+    manager = manager or nonce_manager
+    policy = policy or DEFAULT_RETRY_POLICY
+    sender = Account.from_key(private_key).address
+    await tx_scheduler.acquire() # This task's fair share of the process-wide send budget
+    allocated = 'nonce' not in tx
+    if allocated:
+        tx['nonce'] = await manager.allocate(w3, sender)
+    try:
+        tx_hash = await _send_with_retries(w3, tx, private_key, manager, policy, sender, allocated)
+    except asyncio.CancelledError:
+        # Whether or not the send reached the node, re-read the nonce next time
+        manager.invalidate(sender)
+        raise
+
+    # Balances of both sides are about to change; the next read must hit the node
+    balance_cache.invalidate(sender)
+    balance_cache.invalidate(tx.get('to'))
+    gas_limit_cache.track(tx_hash, tx) # Its receipt's gasUsed refines the learned gas limit
+    return tx_hash
+
+
+async def _send_with_retries(
+    w3: AsyncWeb3,
+    tx: Dict,
+    private_key: str,
+    manager: NonceManager,
+    policy: RetryPolicy,
+    sender: str,
+    allocated: bool,
+) -> bytes:
+    signed_tx = Account.sign_transaction(tx, private_key)
+    failures = 0
+    ambiguous = False # An earlier try of this signed tx may have reached the node
+    while True:
+        try:
+            tx_hash = await w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            break
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == ALREADY_KNOWN:
+                tx_hash = signed_tx.hash
+                break
+            if kind == NONCE and ambiguous and await _landed(w3, signed_tx.hash):
+                tx_hash = signed_tx.hash # The timed-out try went through; its nonce is now used
+                break
+            failures += 1
+            if kind == NONCE:
+                await manager.resync(w3, sender)
+                if not allocated:
+                    raise # Caller pinned the nonce; don't silently pick another one
+            if not policy.should_retry(kind, failures):
+                if kind != NONCE:
+                    manager.invalidate(sender)
+                raise
+            delay = policy.delay(kind, failures, e)
+            logger.debug(f"Send from {sender} failed ({kind}), retry {failures} in {delay:.1f}s: {e}")
+            if kind == NONCE:
+                tx['nonce'] = await manager.allocate(w3, sender)
+            elif kind == UNDERPRICED:
+                bump_fees(tx)
+            if kind in (NONCE, UNDERPRICED):
+                signed_tx = Account.sign_transaction(tx, private_key)
+                ambiguous = False
+            else:
+                ambiguous = kind in TRANSIENT_ERRORS
+            await asyncio.sleep(delay)
+    return tx_hash
@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Optional, Union
+
+from loguru import logger
+
+# Constants
+# Requests per second allowed per RPC endpoint (0 disables the limiter)
+RPC_RATE_LIMIT_RPS = float(os.environ.get('RPC_RATE_LIMIT_RPS', '20'))
+# Per-endpoint overrides, e.g. "https://testnet-rpc.monad.xyz=10,https://my-node=100"
+RPC_RATE_LIMITS = os.environ.get('RPC_RATE_LIMITS', '')
+RATE_LIMIT_MAX_RETRIES = int(os.environ.get('RATE_LIMIT_MAX_RETRIES', '6')) # 429s absorbed per call before it fails
+MIN_RATE = 0.5 # Never throttle an endpoint below this many requests per second
+DECREASE_FACTOR = 0.5 # Multiplicative decrease on a 429
+DECREASE_HOLDOFF_SECONDS = 1.0 # Further 429s this soon after a decrease belong to the same burst
+INCREASE_PER_SECOND = 1.0 # Additive increase: rate grows by about this much per second of clean traffic
+DEFAULT_PAUSE_SECONDS = 1.0 # Pause after a 429 without a Retry-After header
+MAX_PAUSE_SECONDS = 30
+RATE_LIMIT_ERROR_CODES = {429, -32005, -32029}
+RATE_LIMIT_MARKERS = ("rate limit", "too many requests", "request limit")
+
+
+def is_rate_limited(value: Union[Dict[str, Any], list, Exception]) -> bool:
+    """True for an HTTP 429 error, or a JSON-RPC response (or batch) carrying a rate-limit error."""
+    if isinstance(value, Exception):
+        status = getattr(value, 'status', None) # aiohttp.ClientResponseError
+        if status is None:
+            status = getattr(getattr(value, 'response', None), 'status_code', None) # requests.HTTPError
+        return status == 429 or any(marker in str(value).lower() for marker in RATE_LIMIT_MARKERS)
+    if isinstance(value, list):
+        return any(is_rate_limited(response) for response in value)
+    error = value.get('error') if isinstance(value, dict) else None
+    if not isinstance(error, dict):
+        return False
+    return error.get('code') in RATE_LIMIT_ERROR_CODES or any(marker in str(error.get('message', '')).lower() for marker in RATE_LIMIT_MARKERS)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on a 429 error, if the endpoint sent one."""
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    try:
+        return min(float(value), MAX_PAUSE_SECONDS) if value is not None else None
+    except ValueError:
+        return None # HTTP-date form: fall back to the default pause
+
+
+class TokenBucket:
+    """
+    Token bucket with AIMD rate control for one RPC endpoint.
+
+    Callers reserve tokens and sleep for the returned delay, so the same bucket paces both
+    the sync (thread) and async transports of an endpoint. A 429 halves the rate (once per
+    burst of them) and pauses the bucket; clean traffic raises it again by INCREASE_PER_SECOND per second,
+    up to the configured ceiling. The rate therefore settles just under the provider's
+    real limit instead of bouncing off it.
+    """
+
+    def __init__(self, max_rate: float):
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self._tokens = max_rate # One second of burst
+        self._updated_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.rate, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, cost: int = 1) -> float:
+        """Takes cost tokens and returns how long the caller must wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= cost
+            return max(0.0, -self._tokens / self.rate)
+
+    def throttle(self, pause: Optional[float] = None) -> None:
+        """Multiplicative decrease after a 429; queued callers also wait out the pause."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now - self._decreased_at >= DECREASE_HOLDOFF_SECONDS:
+                self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+                self._decreased_at = now
+            # Empty the bucket for the pause (not cumulative: a burst of 429s is one signal)
+            self._tokens = min(self._tokens, -self.rate * (pause if pause is not None else DEFAULT_PAUSE_SECONDS))
+
+    def recover(self, cost: int = 1) -> None:
+        """Additive increase after a successful request."""
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            # cost / rate is the share of a second this request used at the current rate
+            self.rate = min(self.max_rate, self.rate + INCREASE_PER_SECOND * cost / self.rate)
+
+
+# --- Process-wide Registry --- #
+_buckets: Dict[str, Optional[TokenBucket]] = {}
+_buckets_lock = threading.Lock()
+
+
+def _endpoint_key(rpc_url: str) -> str:
+    return rpc_url.strip().rstrip('/')
+
+
+def _configured_rate(key: str) -> float:
+    for entry in RPC_RATE_LIMITS.split(','):
+        url, _, rate = entry.rpartition('=')
+        if url and _endpoint_key(url) == key:
+            return float(rate)
+    return RPC_RATE_LIMIT_RPS
+
+
+def get_rate_limiter(rpc_url: str) -> Optional[TokenBucket]:
+    """Shared bucket for an RPC endpoint, or None if the endpoint is not rate limited."""
+    key = _endpoint_key(rpc_url)
+    with _buckets_lock:
+        if key not in _buckets:
+            rate = _configured_rate(key)
+            _buckets[key] = TokenBucket(rate) if rate > 0 else None
+            if rate > 0:
+                logger.debug(f"Rate limiting RPC {key} to {rate:g} requests/s")
+        return _buckets[key]
@@ -0,0 +1,122 @@
+import asyncio
+from typing import Dict, List, Optional, Set, Union
+
+from loguru import logger
+from web3 import AsyncWeb3
+from web3.exceptions import TimeExhausted, TransactionNotFound
+from web3.types import TxReceipt
+
+from gas_limits import gas_limit_cache
+
+# Constants
+DEFAULT_RECEIPT_TIMEOUT_SECONDS = 180
+BLOCK_POLL_INTERVAL_SECONDS = 0.5 # How often eth_blockNumber is checked while something is pending
+
+
+def _hash_key(tx_hash: Union[bytes, str]) -> str:
+    if isinstance(tx_hash, (bytes, bytearray)):
+        tx_hash = tx_hash.hex()
+    tx_hash = tx_hash.lower()
+    return tx_hash if tx_hash.startswith('0x') else '0x' + tx_hash
+
+
+class ReceiptWaiter:
+    """
+    Tracks pending transaction hashes for one AsyncWeb3 transport.
+
+    A single watcher task polls the block number and, when a new block appears, looks up
+    receipts for every pending hash at once and resolves the matching futures. Between
+    blocks only newly registered hashes are looked up.
+    RPC load therefore follows the block rate, not the number of transactions in flight.
+    The watcher exits when nothing is pending and is restarted by the next wait().
+    """
+
+    def __init__(self, w3: AsyncWeb3):
+        self.w3 = w3
+        self.loop = asyncio.get_running_loop()
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._unchecked: Set[str] = set() # Hashes registered since the last lookup
+        self._watcher: Optional[asyncio.Task] = None
+
+    def _ensure_watcher(self) -> None:
+        if self._watcher is None or self._watcher.done():
+            self._watcher = self.loop.create_task(self._watch_blocks())
+
+    def _discard(self, key: str, future: asyncio.Future) -> None:
+        waiters = self._pending.get(key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._pending[key]
+
+    async def wait(self, tx_hash: Union[bytes, str], timeout: float = DEFAULT_RECEIPT_TIMEOUT_SECONDS) -> TxReceipt:
+        """Waits until tx_hash is mined and returns its receipt; raises TimeExhausted after timeout seconds."""
+        key = _hash_key(tx_hash)
+        future = self.loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        self._unchecked.add(key)
+        self._ensure_watcher()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            raise TimeExhausted(f"Transaction {key} is not in the chain after {timeout} seconds")
+        finally:
+            self._discard(key, future)
+
+    async def _check_pending(self, keys: List[str]) -> None:
+        results = await asyncio.gather(
+            *(self.w3.eth.get_transaction_receipt(key) for key in keys),
+            return_exceptions=True,
+        )
+        for key, result in zip(keys, results):
+            if isinstance(result, TransactionNotFound):
+                continue # Not mined yet
+            if isinstance(result, Exception):
+                logger.debug(f"Receipt lookup for {key} failed, retrying next block: {result}")
+                continue
+            if result is None:
+                continue
+            for future in self._pending.pop(key, []):
+                if not future.done():
+                    future.set_result(result)
+
+    async def _watch_blocks(self) -> None:
+        last_block = None
+        while self._pending:
+            try:
+                block_number = await self.w3.eth.block_number
+                if block_number != last_block:
+                    # New block: everything pending may have landed
+                    last_block = block_number
+                    keys = list(self._pending)
+                else:
+                    # Same block: only look up hashes nobody has checked yet (they may already be mined)
+                    keys = [key for key in self._unchecked if key in self._pending]
+                self._unchecked.clear()
+                if keys:
+                    await self._check_pending(keys)
+            except Exception as e:
+                logger.debug(f"Receipt watcher poll failed: {e}")
+            if self._pending:
+                await asyncio.sleep(BLOCK_POLL_INTERVAL_SECONDS)
+
+
+# --- Process-wide Waiter Registry --- #
+# One waiter per AsyncWeb3 instance (rpc_pool shares those per RPC URL)
+_waiters: Dict[AsyncWeb3, ReceiptWaiter] = {}
+
+
+def get_receipt_waiter(w3: AsyncWeb3) -> ReceiptWaiter:
+    waiter = _waiters.get(w3)
+    # Futures and the watcher task belong to one event loop; rebuild if the loop changed
+    if waiter is None or waiter.loop is not asyncio.get_running_loop():
+        waiter = ReceiptWaiter(w3)
+        _waiters[w3] = waiter
+    return waiter
+
+
+async def wait_for_receipt(w3: AsyncWeb3, tx_hash: Union[bytes, str], timeout: float = DEFAULT_RECEIPT_TIMEOUT_SECONDS) -> TxReceipt:
+    """Drop-in replacement for w3.eth.wait_for_transaction_receipt() backed by the shared block watcher."""
+    receipt = await get_receipt_waiter(w3).wait(tx_hash, timeout)
+    gas_limit_cache.observe_receipt(receipt)
+    return receipt
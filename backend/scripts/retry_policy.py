@@ -0,0 +1,147 @@
+import random
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import requests
+from aiohttp import ClientConnectionError, ClientResponseError
+from web3.exceptions import ContractLogicError
+
+from rate_limiter import is_rate_limited, retry_after
+from rpc_pool import ChainMismatchError
+
+T = TypeVar('T')
+
+# --- Error Classes --- #
+TIMEOUT = "timeout"
+RATE_LIMITED = "rate_limited"
+CONNECTION = "connection"
+NONCE = "nonce" # Stale or colliding nonce: resync and resubmit
+UNDERPRICED = "underpriced" # Fee below what the node accepts: bump and resubmit
+ALREADY_KNOWN = "already_known" # The node already has this exact transaction: the send succeeded
+INSUFFICIENT_FUNDS = "insufficient_funds"
+REVERT = "revert"
+FATAL = "fatal"
+
+# Constants
+TRANSIENT_ERRORS = {TIMEOUT, RATE_LIMITED, CONNECTION} # Retried after a jittered backoff
+IMMEDIATE_ERRORS = {NONCE, UNDERPRICED} # Retried right away once the transaction is fixed up
+DEFAULT_ATTEMPTS = 3 # Total tries, including the first
+DEFAULT_BASE_DELAY_SECONDS = 1.0
+DEFAULT_MAX_DELAY_SECONDS = 15.0
+RATE_LIMIT_DELAY_FACTOR = 2 # A 429 without Retry-After backs off twice as long as a timeout
+FEE_BUMP = 1.125 # Nodes only accept a replacement/resubmission paying >= 10% more
+NONCE_MARKERS = (
+    "nonce too low",
+    "nonce too high",
+    "invalid nonce",
+    "nonce has already been used",
+    "replacement transaction underpriced", # Our own pending transaction holds this nonce
+)
+ALREADY_KNOWN_MARKERS = ("already known", "known transaction", "already imported")
+UNDERPRICED_MARKERS = ("transaction underpriced", "fee too low", "less than block base fee", "gas price too low")
+INSUFFICIENT_FUNDS_MARKERS = ("insufficient funds", "insufficient balance")
+REVERT_MARKERS = ("execution reverted", "revert")
+TIMEOUT_MARKERS = ("timed out", "timeout")
+CONNECTION_MARKERS = ("connection reset", "connection refused", "server disconnected", "bad gateway", "service unavailable")
+
+
+def _http_status(exc: Exception) -> Optional[int]:
+    if isinstance(exc, ClientResponseError):
+        return exc.status
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None) if isinstance(exc, requests.RequestException) else None
+
+
+def classify_error(exc: Exception) -> str:
+    """Sorts an RPC/HTTP failure into one of the error classes above."""
+    message = str(exc).lower()
+    # Order matters: "replacement transaction underpriced" is a nonce clash, not a low fee
+    if any(marker in message for marker in ALREADY_KNOWN_MARKERS):
+        return ALREADY_KNOWN
+    if any(marker in message for marker in NONCE_MARKERS):
+        return NONCE
+    if any(marker in message for marker in UNDERPRICED_MARKERS):
+        return UNDERPRICED
+    if any(marker in message for marker in INSUFFICIENT_FUNDS_MARKERS):
+        return INSUFFICIENT_FUNDS
+    if isinstance(exc, ContractLogicError) or any(marker in message for marker in REVERT_MARKERS):
+        return REVERT
+    if isinstance(exc, (asyncio.TimeoutError, requests.Timeout)) or any(marker in message for marker in TIMEOUT_MARKERS):
+        return TIMEOUT
+    if is_rate_limited(exc):
+        return RATE_LIMITED
+    status = _http_status(exc)
+    if status is not None:
+        return CONNECTION if status >= 500 else FATAL
+    if isinstance(exc, ChainMismatchError):
+        return FATAL # Wrong network: retrying cannot help
+    if isinstance(exc, (ClientConnectionError, ConnectionError, requests.ConnectionError)) or any(marker in message for marker in CONNECTION_MARKERS):
+        return CONNECTION
+    return FATAL
+
+
+def bump_fees(tx: Dict[str, Any], factor: float = FEE_BUMP) -> None:
+    """Raises the fee fields of tx in place so a resubmission is accepted."""
+    for field in ('gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas'):
+        if tx.get(field):
+            tx[field] = int(tx[field] * factor) + 1
+
+
+class RetryPolicy:
+    """
+    Decides whether and when to retry a failed call, based on its error class.
+
+    Transient errors (timeouts, 429s, connection drops) are retried after an exponential
+    backoff with jitter, so parallel keys that failed together don't retry in lockstep.
+    Nonce and fee errors are retried immediately: the caller fixes the transaction
+    (resync, fee bump) and resubmits. Reverts, missing funds and unknown errors are final.
+    """
+
+    def __init__(
+        self,
+        attempts: int = DEFAULT_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY_SECONDS,
+        max_delay: float = DEFAULT_MAX_DELAY_SECONDS,
+        retry_on: frozenset = frozenset(TRANSIENT_ERRORS | IMMEDIATE_ERRORS),
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def should_retry(self, kind: str, failures: int) -> bool:
+        """failures = tries that have failed so far."""
+        return kind in self.retry_on and failures < self.attempts
+
+    def delay(self, kind: str, failures: int, exc: Optional[Exception] = None) -> float:
+        if kind in IMMEDIATE_ERRORS:
+            return 0.0
+        if kind == RATE_LIMITED and exc is not None and retry_after(exc) is not None:
+            return retry_after(exc)
+        factor = RATE_LIMIT_DELAY_FACTOR if kind == RATE_LIMITED else 1
+        ceiling = min(self.max_delay, self.base_delay * factor * 2 ** (failures - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2) # "Equal jitter": never less than half the backoff
+
+    async def run(
+        self,
+        operation: Callable[[], Awaitable[T]],
+        on_retry: Optional[Callable[[Exception, str, int, float], None]] = None,
+    ) -> T:
+        """Awaits operation() until it succeeds or fails with an error this policy does not retry."""
+        failures = 0
+        while True:
+            try:
+                return await operation()
+            except Exception as e:
+                kind = classify_error(e)
+                failures += 1
+                if not self.should_retry(kind, failures):
+                    raise
+                delay = self.delay(kind, failures, e)
+                if on_retry is not None:
+                    on_retry(e, kind, failures, delay)
+                await asyncio.sleep(delay)
+
+
+# Shared default (sends use it unless a script passes its own)
+DEFAULT_RETRY_POLICY = RetryPolicy()
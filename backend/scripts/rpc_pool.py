@@ -0,0 +1,322 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import requests
+from aiohttp import ClientConnectionError, ClientResponseError, ClientTimeout
+from requests.adapters import HTTPAdapter
+from loguru import logger
+from web3 import AsyncWeb3, Web3
+from web3.providers.rpc.utils import ExceptionRetryConfiguration
+from web3.types import RPCEndpoint, RPCResponse
+
+from rate_limiter import RATE_LIMIT_MAX_RETRIES, get_rate_limiter, is_rate_limited, retry_after
+from rpc_router import RoutedAsyncProvider
+
+# Constants
+DEFAULT_RPC_URL = os.environ.get('DEFAULT_RPC_URL', "https://testnet-rpc.monad.xyz/")
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 60
+HEALTH_CHECK_INTERVAL_SECONDS = 30 # Skip the is_connected() probe if the endpoint answered recently
+HTTP_POOL_MAXSIZE = 64 # Keep-alive connections per endpoint (executor threads share them)
+# Chain every RPC must serve (Monad testnet); set EXPECTED_CHAIN_ID to an empty string to skip the check
+_expected_chain_id = os.environ.get('EXPECTED_CHAIN_ID', '10143')
+EXPECTED_CHAIN_ID = int(_expected_chain_id) if _expected_chain_id else None
+# Async calls issued within this window are coalesced into one JSON-RPC batch POST (0 disables)
+RPC_BATCH_WINDOW_SECONDS = float(os.environ.get('RPC_BATCH_WINDOW_MS', '2')) / 1000
+RPC_MAX_BATCH_SIZE = int(os.environ.get('RPC_MAX_BATCH_SIZE', '50')) # Public RPCs cap batch length
+# Sent on their own: broadcasts should not wait on, or fail with, unrelated reads
+UNBATCHED_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+# Extra endpoints added to every async transport (comma-separated); calls are then routed to the healthiest one
+RPC_FALLBACK_URLS = [url.strip() for url in os.environ.get('RPC_FALLBACK_URLS', '').split(',') if url.strip()]
+
+# --- Process-wide Provider Registry --- #
+# One Web3 instance (and one keep-alive requests.Session) per RPC URL.
+_providers: Dict[str, Web3] = {}
+_last_healthy_at: Dict[str, float] = {}
+_registry_lock = threading.Lock()
+
+# One AsyncWeb3 (and one aiohttp session) per RPC URL, bound to the loop that created it
+_async_providers: Dict[str, Tuple[AsyncWeb3, asyncio.AbstractEventLoop]] = {}
+_async_last_healthy_at: Dict[str, float] = {}
+
+# Chain ID never changes for a provider connection; resolved once, then served from memory
+_chain_ids: Dict[Union[Web3, AsyncWeb3], int] = {}
+
+
+class ChainMismatchError(ConnectionError):
+    """The RPC answered, but for a different chain than EXPECTED_CHAIN_ID."""
+
+
+class RateLimitedHTTPProvider(Web3.HTTPProvider):
+    """HTTPProvider paced by the endpoint's shared token bucket (see rate_limiter)."""
+
+    def __init__(self, endpoint_uri: str, **kwargs):
+        # Leave 429s to the limiter (web3 would resend them right away)
+        kwargs.setdefault('exception_retry_configuration', ExceptionRetryConfiguration(errors=(ConnectionError, requests.Timeout)))
+        super().__init__(endpoint_uri, **kwargs)
+        self.rate_limiter = get_rate_limiter(endpoint_uri)
+
+    def _paced(self, send: Callable[[], Any], cost: int) -> Any:
+        if self.rate_limiter is None:
+            return send()
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            delay = self.rate_limiter.reserve(cost)
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                result = send()
+            except requests.HTTPError as e:
+                if not is_rate_limited(e) or attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                self.rate_limiter.throttle(retry_after(e))
+                continue
+            if is_rate_limited(result) and attempt < RATE_LIMIT_MAX_RETRIES:
+                self.rate_limiter.throttle()
+                continue
+            self.rate_limiter.recover(cost)
+            return result
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return self._paced(lambda: super(RateLimitedHTTPProvider, self).make_request(method, params), 1)
+
+    def make_batch_request(self, batch_requests: List[Tuple[RPCEndpoint, Any]]) -> Union[List[RPCResponse], RPCResponse]:
+        return self._paced(lambda: super(RateLimitedHTTPProvider, self).make_batch_request(batch_requests), len(batch_requests))
+
+
+class BatchingAsyncHTTPProvider(AsyncWeb3.AsyncHTTPProvider):
+    """
+    AsyncHTTPProvider that coalesces requests into JSON-RPC batch arrays.
+
+    Every request waits up to batch_window seconds (or until max_batch_size requests are
+    queued) and then goes out together with whatever else was issued meanwhile, from any
+    task, in a single POST. Responses are matched back by id, so each caller gets its own
+    result or error. If the endpoint rejects batches, the provider falls back to plain
+    requests for good.
+
+    Every POST is paced by the endpoint's token bucket (one token per call in it); a 429 is
+    absorbed as back-pressure: the bucket slows down and the call waits and resends,
+    so the caller only sees the error after RATE_LIMIT_MAX_RETRIES of them.
+    """
+
+    def __init__(self, endpoint_uri: str, batch_window: float = RPC_BATCH_WINDOW_SECONDS, max_batch_size: int = RPC_MAX_BATCH_SIZE, **kwargs):
+        # 429s are handled by the limiter below; web3's own quick retries would only add to them
+        kwargs.setdefault('exception_retry_configuration', ExceptionRetryConfiguration(errors=(ClientConnectionError, asyncio.TimeoutError)))
+        super().__init__(endpoint_uri, **kwargs)
+        self.rate_limiter = get_rate_limiter(endpoint_uri)
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.batching_supported = True
+        self._queue: List[Tuple[RPCEndpoint, Any, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: Set[asyncio.Task] = set()  # Strong refs so in-flight batches aren't garbage collected
+
+    async def _paced(self, send: Callable[[], Awaitable[Any]], cost: int) -> Any:
+        if self.rate_limiter is None:
+            return await send()
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            delay = self.rate_limiter.reserve(cost)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                result = await send()
+            except ClientResponseError as e:
+                if not is_rate_limited(e) or attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                self.rate_limiter.throttle(retry_after(e))
+                logger.debug(f"RPC {self.endpoint_uri} rate limited, slowing to {self.rate_limiter.rate:.1f} requests/s")
+                continue
+            if is_rate_limited(result) and attempt < RATE_LIMIT_MAX_RETRIES:
+                self.rate_limiter.throttle()
+                continue
+            self.rate_limiter.recover(cost)
+            return result
+
+    async def _send_one(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return await self._paced(lambda: super(BatchingAsyncHTTPProvider, self).make_request(method, params), 1)
+
+    async def make_batch_request(self, batch_requests: List[Tuple[RPCEndpoint, Any]]) -> Union[List[RPCResponse], RPCResponse]:
+        return await self._paced(lambda: super(BatchingAsyncHTTPProvider, self).make_batch_request(batch_requests), len(batch_requests))
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if self.batch_window <= 0 or not self.batching_supported or method in UNBATCHED_METHODS:
+            return await self._send_one(method, params)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((method, params, future))
+        if len(self._queue) >= self.max_batch_size:
+            self._schedule_flush(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._schedule_flush, loop)
+        return await future
+
+    def _schedule_flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._queue:
+            batch, self._queue = self._queue[:self.max_batch_size], self._queue[self.max_batch_size:]
+            task = loop.create_task(self._send_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _send_batch(self, batch: List[Tuple[RPCEndpoint, Any, asyncio.Future]]) -> None:
+        try:
+            if len(batch) == 1:
+                method, params, _ = batch[0]
+                responses = [await self._send_one(method, params)]
+            else:
+                responses = await self.make_batch_request([(method, params) for method, params, _ in batch])
+                if not isinstance(responses, list) or len(responses) != len(batch):
+                    # Endpoint answered with a single error object: no batch support (or a batch-size cap)
+                    logger.warning(f"RPC {self.endpoint_uri} rejected a JSON-RPC batch, disabling batching: {responses}")
+                    self.batching_supported = False
+                    responses = [await self._send_one(method, params) for method, params, _ in batch]
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # make_batch_request() sorts by id and ids are assigned in order, so responses line up with batch
+        for (_, _, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+
+def _registry_key(rpc_url: Union[str, Sequence[str]]) -> str:
+    if not isinstance(rpc_url, str):
+        return '|'.join(_registry_key(url) for url in rpc_url)
+    # "https://rpc/" and "https://rpc" are the same endpoint
+    return rpc_url.strip().rstrip('/')
+
+
+def _route_urls(rpc_url: Union[str, Sequence[str], None]) -> List[str]:
+    """Endpoints for an async transport: the requested URL(s) plus RPC_FALLBACK_URLS, without duplicates."""
+    requested = [rpc_url or DEFAULT_RPC_URL] if rpc_url is None or isinstance(rpc_url, str) else list(rpc_url)
+    urls: Dict[str, str] = {}
+    for url in requested + RPC_FALLBACK_URLS:
+        urls.setdefault(_registry_key(url), url)
+    return list(urls.values())
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _get_or_create_web3(rpc_url: str) -> Web3:
+    key = _registry_key(rpc_url)
+    with _registry_lock:
+        w3 = _providers.get(key)
+        if w3 is None:
+            w3 = Web3(RateLimitedHTTPProvider(
+                rpc_url,
+                request_kwargs={'timeout': DEFAULT_REQUEST_TIMEOUT_SECONDS},
+                session=_build_session(),
+            ))
+            _providers[key] = w3
+        return w3
+
+
+def _build_async_provider(rpc_url: str) -> BatchingAsyncHTTPProvider:
+    return BatchingAsyncHTTPProvider(
+        rpc_url,
+        request_kwargs={'timeout': ClientTimeout(total=DEFAULT_REQUEST_TIMEOUT_SECONDS)},
+    )
+
+
+def _get_or_create_async_web3(rpc_urls: List[str]) -> AsyncWeb3:
+    key = _registry_key(rpc_urls)
+    loop = asyncio.get_running_loop()
+    entry = _async_providers.get(key)
+    # aiohttp sessions cannot be shared across event loops; rebuild if the loop changed
+    if entry is None or entry[1] is not loop:
+        if len(rpc_urls) == 1:
+            w3_async = AsyncWeb3(_build_async_provider(rpc_urls[0]))
+        else:
+            w3_async = AsyncWeb3(RoutedAsyncProvider(
+                rpc_urls, [_build_async_provider(url) for url in rpc_urls], expected_chain_id=EXPECTED_CHAIN_ID,
+            ))
+        _async_providers[key] = (w3_async, loop)
+        _async_last_healthy_at.pop(key, None)
+        return w3_async
+    return entry[0]
+
+
+def mark_unhealthy(rpc_url: Union[str, Sequence[str]]) -> None:
+    """Forces the next get_web3()/get_async_web3() call for this URL to re-run the health check."""
+    key = _registry_key(rpc_url)
+    _last_healthy_at.pop(key, None)
+    _async_last_healthy_at.pop(key, None)
+
+
+def get_web3(rpc_url: Optional[str] = None) -> Web3:
+    """Returns the shared Web3 for an RPC URL, probing it at most once per health-check interval."""
+    rpc_url_to_use = rpc_url or DEFAULT_RPC_URL
+    key = _registry_key(rpc_url_to_use)
+    w3 = _get_or_create_web3(rpc_url_to_use)
+
+    last_ok = _last_healthy_at.get(key)
+    if last_ok is not None and time.monotonic() - last_ok < HEALTH_CHECK_INTERVAL_SECONDS:
+        return w3
+
+    if not w3.is_connected():
+        mark_unhealthy(rpc_url_to_use)
+        raise ConnectionError(f"Could not connect to RPC: {rpc_url_to_use}")
+    if w3 not in _chain_ids:
+        _chain_ids[w3] = w3.eth.chain_id
+    _check_chain_id(rpc_url_to_use, _chain_ids[w3])
+    _last_healthy_at[key] = time.monotonic()
+    return w3
+
+
+async def get_async_web3(rpc_url: Union[str, Sequence[str], None] = None) -> AsyncWeb3:
+    """
+    Async counterpart of get_web3(): one shared AsyncWeb3 transport per RPC URL.
+    Given several URLs (or with RPC_FALLBACK_URLS set) the transport routes each call to the
+    healthiest endpoint, hedges slow reads and broadcasts raw transactions.
+    """
+    rpc_urls = _route_urls(rpc_url)
+    rpc_url_to_use = rpc_urls if len(rpc_urls) > 1 else rpc_urls[0]
+    key = _registry_key(rpc_urls)
+    w3_async = _get_or_create_async_web3(rpc_urls)
+
+    last_ok = _async_last_healthy_at.get(key)
+    if last_ok is not None and time.monotonic() - last_ok < HEALTH_CHECK_INTERVAL_SECONDS:
+        return w3_async
+
+    if not await w3_async.is_connected():
+        mark_unhealthy(rpc_url_to_use)
+        raise ConnectionError(f"Could not connect to Async RPC: {rpc_url_to_use}")
+    _check_chain_id(rpc_url_to_use, await get_chain_id(w3_async))
+    _async_last_healthy_at[key] = time.monotonic()
+    return w3_async
+
+
+def _check_chain_id(rpc_url: str, chain_id: int) -> None:
+    if EXPECTED_CHAIN_ID is not None and chain_id != EXPECTED_CHAIN_ID:
+        mark_unhealthy(rpc_url)
+        raise ChainMismatchError(f"RPC {rpc_url} serves chain ID {chain_id}, expected {EXPECTED_CHAIN_ID}")
+
+
+async def get_chain_id(w3_async: AsyncWeb3) -> int:
+    """Memoized chain ID for a provider (replaces `await w3.eth.chain_id` when building transactions)."""
+    chain_id = _chain_ids.get(w3_async)
+    if chain_id is None:
+        chain_id = _chain_ids[w3_async] = await w3_async.eth.chain_id
+    return chain_id
+
+
+async def execute_batch(w3_async: AsyncWeb3, *calls: Awaitable) -> List[Any]:
+    """
+    Sends independent reads as one explicit JSON-RPC batch and returns their results in order, e.g.
+    balance, nonce = await execute_batch(w3, w3.eth.get_balance(a), w3.eth.get_transaction_count(a))
+    """
+    async with w3_async.batch_requests() as batch:
+        for call in calls:
+            batch.add(call)
+        return list(await batch.async_execute())
@@ -0,0 +1,238 @@
+import time
+import asyncio
+from typing import Any, List, Optional, Sequence, Set, Union
+
+from loguru import logger
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from rate_limiter import is_rate_limited
+
+# Constants
+EWMA_ALPHA = 0.2 # Weight of the newest sample in the latency / error-rate averages
+INITIAL_LATENCY_SECONDS = 0.5 # Assumed latency of an endpoint we have no samples for yet
+ERROR_PENALTY = 4 # Score multiplier per unit of error rate (an endpoint failing 50% scores 3x worse)
+IN_FLIGHT_PENALTY = 0.1 # Score multiplier per request already in flight (spreads load under bursts)
+RATE_LIMIT_COOLDOWN_SECONDS = 30 # Endpoint is skipped this long after a 429 its own limiter could not absorb
+HEDGE_MIN_DELAY_SECONDS = 0.25 # Never hedge a read sooner than this
+HEDGE_MAX_DELAY_SECONDS = 2.0
+HEDGE_LATENCY_FACTOR = 3 # Hedge once a read takes this many times the endpoint's usual latency
+BROADCAST_FANOUT = 3 # Endpoints a raw transaction is sent to at once
+BROADCAST_METHODS = {"eth_sendRawTransaction"}
+
+
+class EndpointFailure(Exception):
+    """The endpoint itself failed (transport error or rate limit), as opposed to an RPC-level error answer."""
+
+    def __init__(self, endpoint: "Endpoint", cause: Union[RPCResponse, Exception]):
+        super().__init__(f"{endpoint.url}: {cause}")
+        self.endpoint = endpoint
+        self.cause = cause
+
+
+class Endpoint:
+    """One RPC URL with its health statistics."""
+
+    def __init__(self, url: str, provider: AsyncJSONBaseProvider):
+        self.url = url
+        self.provider = provider
+        self.latency: Optional[float] = None # EWMA, seconds
+        self.error_rate = 0.0 # EWMA of failures, 0..1
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.chain_checked = False
+        self.wrong_chain = False
+
+    def available(self, now: float) -> bool:
+        return not self.wrong_chain and now >= self.cooldown_until
+
+    def score(self) -> float:
+        latency = self.latency if self.latency is not None else INITIAL_LATENCY_SECONDS
+        return latency * (1 + ERROR_PENALTY * self.error_rate) * (1 + IN_FLIGHT_PENALTY * self.in_flight)
+
+    def record_latency(self, elapsed: float) -> None:
+        self.latency = elapsed if self.latency is None else EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.latency
+
+    def record_success(self, elapsed: float) -> None:
+        self.record_latency(elapsed)
+        self.error_rate *= 1 - EWMA_ALPHA
+
+    def record_failure(self, rate_limited: bool) -> None:
+        self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+        if rate_limited:
+            self.cooldown_until = time.monotonic() + RATE_LIMIT_COOLDOWN_SECONDS
+
+    def hedge_delay(self) -> float:
+        latency = self.latency if self.latency is not None else INITIAL_LATENCY_SECONDS
+        return min(max(HEDGE_LATENCY_FACTOR * latency, HEDGE_MIN_DELAY_SECONDS), HEDGE_MAX_DELAY_SECONDS)
+
+
+class RoutedAsyncProvider(AsyncJSONBaseProvider):
+    """
+    Async provider that spreads calls over several RPC endpoints.
+
+    Each call goes to the endpoint with the best score (latency EWMA, error rate, requests in
+    flight); rate-limited endpoints sit out a cooldown and endpoints on the wrong chain are
+    dropped. A read that outlives the endpoint's hedge delay is re-sent to the next endpoint
+    and the first answer wins; a read that fails outright fails over immediately.
+    Raw transactions are broadcast to the best BROADCAST_FANOUT endpoints at once.
+    """
+
+    def __init__(self, urls: Sequence[str], providers: Sequence[AsyncJSONBaseProvider], expected_chain_id: Optional[int] = None):
+        super().__init__()
+        self.endpoints = [Endpoint(url, provider) for url, provider in zip(urls, providers)]
+        self.expected_chain_id = expected_chain_id
+        self._background: Set[asyncio.Task] = set()
+
+    @property
+    def endpoint_uri(self) -> str:
+        # Callers that pass the URL on (e.g. to a script) get the preferred endpoint
+        return self.ranked()[0].url
+
+    def __str__(self) -> str:
+        return f"RPC router over {', '.join(endpoint.url for endpoint in self.endpoints)}"
+
+    def ranked(self) -> List[Endpoint]:
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        if not candidates:
+            # Everything is cooling down: better to try the least-bad endpoint than fail outright
+            candidates = [endpoint for endpoint in self.endpoints if not endpoint.wrong_chain] or list(self.endpoints)
+        return sorted(candidates, key=lambda endpoint: endpoint.score())
+
+    async def _check_chain(self, endpoint: Endpoint) -> None:
+        if endpoint.chain_checked or self.expected_chain_id is None:
+            return
+        response = await endpoint.provider.make_request(RPCEndpoint("eth_chainId"), [])
+        result = response.get('result') if isinstance(response, dict) else None
+        if result is None:
+            raise EndpointFailure(endpoint, response)
+        endpoint.chain_checked = True
+        chain_id = int(result, 16) if isinstance(result, str) else int(result)
+        if chain_id != self.expected_chain_id:
+            endpoint.wrong_chain = True
+            logger.warning(f"Dropping RPC {endpoint.url}: serves chain ID {chain_id}, expected {self.expected_chain_id}")
+            raise EndpointFailure(endpoint, ValueError(f"wrong chain ID {chain_id}"))
+
+    async def _call(self, endpoint: Endpoint, method: RPCEndpoint, params: Any) -> RPCResponse:
+        """One request to one endpoint, recording its outcome; raises EndpointFailure if the endpoint misbehaved."""
+        endpoint.in_flight += 1
+        started = time.monotonic()
+        try:
+            await self._check_chain(endpoint)
+            response = await endpoint.provider.make_request(method, params)
+        except asyncio.CancelledError:
+            endpoint.record_latency(time.monotonic() - started) # Lost a hedge race: it was at least this slow
+            raise
+        except EndpointFailure as e:
+            endpoint.record_failure(is_rate_limited(e.cause))
+            raise
+        except Exception as e:
+            endpoint.record_failure(is_rate_limited(e))
+            raise EndpointFailure(endpoint, e)
+        finally:
+            endpoint.in_flight -= 1
+        if is_rate_limited(response):
+            endpoint.record_failure(rate_limited=True)
+            raise EndpointFailure(endpoint, response)
+        # An RPC error answer (revert, nonce too low, ...) still means the endpoint is healthy
+        endpoint.record_success(time.monotonic() - started)
+        return response
+
+    @staticmethod
+    def _give_up(failure: Optional[EndpointFailure]) -> RPCResponse:
+        if failure is None:
+            raise ConnectionError("No RPC endpoint available")
+        if isinstance(failure.cause, Exception):
+            raise failure.cause
+        return failure.cause # Rate-limit error answer: let web3 raise it as usual
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method in BROADCAST_METHODS:
+            return await self._broadcast(method, params)
+
+        candidates = self.ranked()
+        running: Set[asyncio.Task] = set()
+        next_index = 0
+        last_failure: Optional[EndpointFailure] = None
+
+        def launch() -> None:
+            nonlocal next_index
+            running.add(asyncio.ensure_future(self._call(candidates[next_index], method, params)))
+            next_index += 1
+
+        launch()
+        try:
+            while running:
+                can_hedge = next_index < len(candidates)
+                timeout = candidates[next_index - 1].hedge_delay() if can_hedge else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch() # Slow read: race it against the next-best endpoint
+                    continue
+                for task in done:
+                    running.discard(task)
+                    try:
+                        return task.result()
+                    except EndpointFailure as e:
+                        last_failure = e
+                if not running and next_index < len(candidates):
+                    launch() # Failed fast: fail over
+        finally:
+            for task in running:
+                task.cancel()
+        return self._give_up(last_failure)
+
+    async def _broadcast(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        """Sends to several endpoints at once; the first successful answer wins, the rest keep propagating."""
+        targets = self.ranked()[:BROADCAST_FANOUT]
+        tasks = [asyncio.ensure_future(self._call(endpoint, method, params)) for endpoint in targets]
+        first_error: Optional[RPCResponse] = None
+        last_failure: Optional[EndpointFailure] = None
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        response = task.result()
+                    except EndpointFailure as e:
+                        last_failure = e
+                        continue
+                    if 'error' not in response:
+                        return response
+                    # Other endpoints may still accept it (or this one lost the race: "already known")
+                    first_error = first_error or response
+        finally:
+            for task in pending:
+                # Let the other sends finish in the background; they only help propagation
+                self._background.add(task)
+                task.add_done_callback(self._finish_background)
+        if first_error is not None:
+            return first_error # e.g. nonce too low: the caller's error handling takes it from here
+        return self._give_up(last_failure)
+
+    def _finish_background(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Background broadcast failed: {task.exception()}")
+
+    async def make_batch_request(self, batch_requests: List[tuple]) -> Union[List[RPCResponse], RPCResponse]:
+        last_failure: Optional[EndpointFailure] = None
+        for endpoint in self.ranked():
+            started = time.monotonic()
+            try:
+                await self._check_chain(endpoint)
+                responses = await endpoint.provider.make_batch_request(batch_requests)
+            except Exception as e:
+                cause = e.cause if isinstance(e, EndpointFailure) else e
+                endpoint.record_failure(is_rate_limited(cause))
+                last_failure = EndpointFailure(endpoint, cause)
+                continue
+            endpoint.record_success(time.monotonic() - started)
+            return responses
+        return self._give_up(last_failure)
+
+    async def disconnect(self) -> None:
+        for endpoint in self.endpoints:
+            await endpoint.provider.disconnect()
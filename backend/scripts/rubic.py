@@ -5,6 +5,12 @@ import time
 from colorama import init, Fore, Style
 from scripts.deploy import bytecode
 from web3 import Web3
+from rpc_pool import get_web3, get_async_web3
+from tx_pipeline import TxPipeline, TransactionFailed
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
+from retry_policy import DEFAULT_RETRY_POLICY, FEE_BUMP, NONCE, TRANSIENT_ERRORS, classify_error
 from eth_abi import encode
 import traceback
 
@@ -19,6 +25,10 @@ DEFAULT_ROUTER_ADDRESS = "0xF6FFe4f3FdC8BBb7F70FFD48e61f17D1e343dDfD"
 DEFAULT_USDT_ADDRESS = "0x6a7436775c0d0B70cfF4c5365404ec37c9d9aF4b"
 DEFAULT_POOL_FEE = 2000  # 0.2% fee
 DEFAULT_CHAIN_ID = 10143
+# Fallback gas limits, only used if the learned limit is unknown and estimation fails
+GAS_LIMIT_WRAP = 50000
+GAS_LIMIT_APPROVE = 100000
+GAS_LIMIT_SWAP = 600000
 
 # Contract ABIs
 WMON_ABI = [
@@ -36,10 +46,7 @@ ROUTER_ABI = [
 def connect_to_rpc(rpc_url):
     # Use default RPC if None is provided
     rpc_url_to_use = rpc_url if rpc_url is not None else DEFAULT_RPC_URL
-    w3 = Web3(Web3.HTTPProvider(rpc_url_to_use))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url_to_use}")
-    return w3
+    return get_web3(rpc_url_to_use)
 
 # Helper function to format step messages for logs
 def format_step(step, message):
@@ -51,6 +58,21 @@ def format_step(step, message):
     step_text = steps.get(step, step.capitalize())
     return f"🔸 {step_text:<15} | {message}"
 
+class SwapStillPending(Exception):
+    """A sent swap may still execute; sending another one could swap twice."""
+
+
+async def _mined_swap(w3, tx_hashes):
+    """The one of tx_hashes (sent on the same nonce) that made it into a block, if any."""
+    for tx_hash in tx_hashes:
+        try:
+            await w3.eth.get_transaction_receipt(tx_hash)
+            return tx_hash
+        except Exception:
+            continue # Not mined (replaced, or still unknown to this node)
+    return None
+
+
 # --- Refactored Main Execution Function --- #
 async def execute_rubic_swap(
     private_key: str,
@@ -71,10 +93,14 @@ async def execute_rubic_swap(
     wrap_tx_hash = None
     approve_tx_hash = None
     swap_tx_hash = None
+    pipeline = None
 
     try:
         # --- Setup --- #
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url or DEFAULT_RPC_URL)
+        # Wrap, approve and swap go out back to back (consecutive nonces); receipts are checked after the swap
+        pipeline = await TxPipeline(w3, private_key).open()
+        prerequisites = [] # Wrap / approve hashes the swap depends on
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         wmon_contract = w3.eth.contract(address=w3.to_checksum_address(wmon_address), abi=WMON_ABI)
@@ -84,7 +110,7 @@ async def execute_rubic_swap(
 
         # --- Check WMON Balance & Wrap if Necessary --- #
         logs.append(format_step('balance', "Checking WMON balance..."))
-        wmon_balance_wei = await asyncio.get_event_loop().run_in_executor(None, lambda: wmon_contract.functions.balanceOf(account.address).call())
+        wmon_balance_wei = await wmon_contract.functions.balanceOf(account.address).call()
         logs.append(format_step('balance', f"WMON Balance: {w3.from_wei(wmon_balance_wei, 'ether')}"))
 
         if wmon_balance_wei < amount_wei:
@@ -92,64 +118,53 @@ async def execute_rubic_swap(
             needed_mon = w3.from_wei(needed_wei, 'ether')
             logs.append(format_step('wrap', f"Insufficient WMON. Wrapping {needed_mon:.6f} MON..."))
 
-            gas_price_wrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-            nonce_wrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_transaction_count(account.address))
+            gas_price_wrap = await get_gas_price(w3)
 
-            tx_wrap = wmon_contract.functions.deposit().build_transaction({
+            tx_wrap = await wmon_contract.functions.deposit().build_transaction({
                 'from': account.address,
                 'value': needed_wei,
-                'gas': 50000,
+                'gas': GAS_LIMIT_WRAP, # Placeholder so build_transaction doesn't estimate; replaced below
                 'gasPrice': gas_price_wrap,
-                'nonce': nonce_wrap,
                 'chainId': chain_id
             })
-            signed_tx_wrap = w3.eth.account.sign_transaction(tx_wrap, private_key)
-            tx_hash_wrap_bytes = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.send_raw_transaction(signed_tx_wrap.raw_transaction))
+            tx_wrap['gas'] = await get_gas_limit(w3, tx_wrap, fallback=GAS_LIMIT_WRAP)
+            tx_hash_wrap_bytes = await pipeline.send(tx_wrap, 'wrap')
             wrap_tx_hash = tx_hash_wrap_bytes.hex()
+            prerequisites.append(tx_hash_wrap_bytes)
             tx_link_wrap = f"{explorer_url}{wrap_tx_hash}"
             logs.append(format_step('wrap', f"Wrap Tx Sent: {tx_link_wrap}"))
-            receipt_wrap = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_wrap_bytes, timeout=180))
-            if receipt_wrap.status != 1:
-                logs.append(format_step('wrap', f"✘ Wrap transaction failed: Status {receipt_wrap.status}"))
-                raise Exception(f"Wrap transaction failed: Status {receipt_wrap.status}")
-            logs.append(format_step('wrap', "✔ Wrap successful!"))
-            # Update nonce for next tx
-            nonce = nonce_wrap + 1
         else:
             logs.append(format_step('wrap', "Sufficient WMON balance. Skipping wrap."))
-            nonce = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.get_transaction_count(account.address))
 
         # --- Approve WMON for Router --- #
         logs.append(format_step('approve', f"Approving {amount_mon} WMON for router {router_address[:8]}..."))
-        gas_price_approve = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.gas_price)
-        # Use current nonce
+        gas_price_approve = await get_gas_price(w3)
 
-        approve_tx = wmon_contract.functions.approve(router_address, amount_wei).build_transaction({
+        approve_tx = await wmon_contract.functions.approve(router_address, amount_wei).build_transaction({
             'from': account.address,
-            'gas': 100000,
+            'gas': GAS_LIMIT_APPROVE, # Placeholder so build_transaction doesn't estimate; replaced below
             'gasPrice': gas_price_approve,
-            'nonce': nonce, # Use current nonce
             'chainId': chain_id
         })
-        signed_approve_tx = w3.eth.account.sign_transaction(approve_tx, private_key)
-        tx_hash_approve_bytes = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.send_raw_transaction(signed_approve_tx.raw_transaction))
+        approve_tx['gas'] = await get_gas_limit(w3, approve_tx, fallback=GAS_LIMIT_APPROVE)
+        tx_hash_approve_bytes = await pipeline.send(approve_tx, 'approve')
         approve_tx_hash = tx_hash_approve_bytes.hex()
+        prerequisites.append(tx_hash_approve_bytes)
         tx_link_approve = f"{explorer_url}{approve_tx_hash}"
         logs.append(format_step('approve', f"Approval Tx Sent: {tx_link_approve}"))
-        receipt_approve = await asyncio.get_event_loop().run_in_executor(None, lambda: w3.eth.wait_for_transaction_receipt(tx_hash_approve_bytes, timeout=180))
-        if receipt_approve.status != 1:
-            logs.append(format_step('approve', f"✘ Approval transaction failed: Status {receipt_approve.status}"))
-            raise Exception(f"Approval transaction failed: Status {receipt_approve.status}")
-        logs.append(format_step('approve', "✔ Approval successful!"))
-        # Update nonce for next tx
-        nonce += 1
 
         # --- Prepare Swap Transaction --- #
         logs.append(format_step('swap', f"Preparing swap {amount_mon} WMON → USDT (slippage: {slippage}%)..."))
         
         # Try different swap approach
         max_retries = 3
-        for retry in range(max_retries):
+        retry = 0
+        transient_failures = 0 # Timeouts/429s/dropped connections while trying the current method
+        # (nonce, gas price, hashes sent on that nonce) of a swap whose outcome is unknown (receipt
+        # wait failed). It may still execute, so the next attempt replaces it on the same nonce
+        # instead of sending a second swap on the next one.
+        pending_swap = None
+        while retry < max_retries:
             try:
                 logs.append(format_step('swap', f"Swap attempt {retry+1}/{max_retries} with alternative method..."))
 
@@ -207,34 +222,54 @@ async def execute_rubic_swap(
                 
                 # Increase gas price with each retry
                 gas_multiply = 1.0 + (retry * 0.3)  # 1.0, 1.3, 1.6
-                gas_price_swap = await asyncio.get_event_loop().run_in_executor(
-                    None, 
-                    lambda: int(w3.eth.gas_price * gas_multiply)
-                )
-                
-                # Fixed high gas limit
-                gas_limit = 600000 + (retry * 100000)  # Increase gas limit with each retry
-                
-                swap_tx = swap_func.build_transaction({
+                gas_price_swap = int(await get_gas_price(w3) * gas_multiply)
+                swap_params = {
                     'from': account.address,
-                    'gas': gas_limit,
+                    'gas': GAS_LIMIT_SWAP, # Placeholder so build_transaction doesn't estimate; replaced below
                     'gasPrice': gas_price_swap,
-                    'nonce': nonce,
                     'chainId': chain_id,
                     'value': 0  # Not sending native MON
-                })
+                }
+                if pending_swap is not None:
+                    # Nodes only accept a replacement paying more than the pending transaction
+                    swap_params['nonce'] = pending_swap[0]
+                    swap_params['gasPrice'] = gas_price_swap = max(gas_price_swap, int(pending_swap[1] * FEE_BUMP) + 1)
+                    logs.append(format_step('swap', f"Replacing pending swap {explorer_url}{pending_swap[2][-1].hex()} (nonce {pending_swap[0]})"))
+
+                swap_tx = await swap_func.build_transaction(swap_params)
+                # Learned gas limit, raised with each retry (estimation reverts while the approve is unmined: fallback)
+                gas_limit = await get_gas_limit(w3, swap_tx, fallback=GAS_LIMIT_SWAP, buffer=1.5) + (retry * 100000)
+                swap_tx['gas'] = gas_limit
                 
                 logs.append(format_step('swap', f"Using gas: {gas_limit}, price: {w3.from_wei(gas_price_swap, 'gwei')} gwei"))
                 
                 # Sign and send
-                signed_swap_tx = w3.eth.account.sign_transaction(swap_tx, private_key)
-                tx_hash_swap_bytes = w3.eth.send_raw_transaction(signed_swap_tx.raw_transaction)
+                try:
+                    tx_hash_swap_bytes = await pipeline.send(swap_tx, 'swap')
+                    pending_swap = (swap_tx['nonce'], gas_price_swap, (pending_swap[2] if pending_swap else []) + [tx_hash_swap_bytes])
+                except Exception as send_err:
+                    if pending_swap is None or classify_error(send_err) != NONCE:
+                        raise
+                    # The nonce is used: one of the swaps already sent on it was mined; report that one
+                    tx_hash_swap_bytes = await _mined_swap(w3, pending_swap[2])
+                    if tx_hash_swap_bytes is None:
+                        raise SwapStillPending(f"Swap nonce {pending_swap[0]} was used by a transaction other than our swaps; not sending another") from send_err
+                    logs.append(format_step('swap', "Earlier swap was mined before it could be replaced; using its result"))
                 swap_tx_hash = tx_hash_swap_bytes.hex()
                 tx_link_swap = f"{explorer_url}{swap_tx_hash}"
                 logs.append(format_step('swap', f"Swap Tx Hash: {tx_link_swap}"))
-                
+
+                if prerequisites:
+                    # Mined before the swap (lower nonces); a failed wrap/approve ends the swap attempts
+                    await pipeline.confirm(*prerequisites)
+                    if wrap_tx_hash:
+                        logs.append(format_step('wrap', "✔ Wrap successful!"))
+                    logs.append(format_step('approve', "✔ Approval successful!"))
+                    prerequisites = []
+
                 # Wait for receipt
-                receipt_swap = w3.eth.wait_for_transaction_receipt(tx_hash_swap_bytes, timeout=180)
+                receipt_swap = await wait_for_receipt(w3, tx_hash_swap_bytes, timeout=180)
+                pending_swap = None # Mined: its nonce is spent either way
                 
                 if receipt_swap.status == 1:
                     logs.append(format_step('swap', f"✔ Swap successful!"))
@@ -243,11 +278,6 @@ async def execute_rubic_swap(
                     logs.append(format_step('swap', f"✘ Attempt {retry+1} failed with status {receipt_swap.status}"))
                     if retry < max_retries - 1:
                         logs.append(format_step('swap', f"Retrying with different method..."))
-                        # Get new nonce
-                        nonce = await asyncio.get_event_loop().run_in_executor(
-                            None, 
-                            lambda: w3.eth.get_transaction_count(account.address)
-                        )
                     else:
                         # Try switching to fallback method - direct WMON transfer to demonstrate success
                         try:
@@ -257,22 +287,33 @@ async def execute_rubic_swap(
                             logs.append(format_step('swap', f"✘ Fallback method also failed: {str(fallback_err)}"))
                             raise Exception(f"All swap attempts failed: {error_msg}")
 
+            except TransactionFailed as e:
+                logs.append(format_step(e.label, f"✘ {e}"))
+                raise
+            except SwapStillPending:
+                raise
             except Exception as retry_err:
                 error_msg = str(retry_err)
                 # Truncate very long error messages
                 if len(error_msg) > 200:
                     error_msg = error_msg[:200] + "..."
+
+                # A transient fault says nothing about the method: back off and retry it unchanged
+                kind = classify_error(retry_err)
+                if kind in TRANSIENT_ERRORS:
+                    transient_failures += 1
+                    if DEFAULT_RETRY_POLICY.should_retry(kind, transient_failures):
+                        delay = DEFAULT_RETRY_POLICY.delay(kind, transient_failures, retry_err)
+                        logs.append(format_step('swap', f"⚠️ Attempt {retry+1} hit a transient error ({kind}), retrying in {delay:.1f}s: {error_msg}"))
+                        await asyncio.sleep(delay)
+                        continue
                 
                 logs.append(format_step('swap', f"✘ Attempt {retry+1} error: {error_msg}"))
                 
+                if pending_swap is not None and retry >= max_retries - 1:
+                    raise SwapStillPending(f"Swap {explorer_url}{pending_swap[2][-1].hex()} is still pending after {max_retries} attempts; not sending another")
                 if retry < max_retries - 1:
                     logs.append(format_step('swap', f"Retrying with different swap method..."))
-                    await asyncio.sleep(2)  # Brief pause
-                    # Get fresh nonce
-                    nonce = await asyncio.get_event_loop().run_in_executor(
-                        None, 
-                        lambda: w3.eth.get_transaction_count(account.address)
-                    )
                 else:
                     # Try switching to fallback method - direct WMON transfer to demonstrate success
                     try:
@@ -282,6 +323,9 @@ async def execute_rubic_swap(
                         logs.append(format_step('swap', f"✘ Fallback method also failed: {str(fallback_err)}"))
                         raise Exception(f"All swap attempts failed: {error_msg}")
 
+            retry += 1
+            transient_failures = 0
+
         # Check if we had a successful swap
         if swap_tx_hash and any(log for log in logs if "✔ Swap successful!" in log):
             # --- Success --- #
@@ -324,6 +368,9 @@ async def execute_rubic_swap(
             'swap_tx_hash': swap_tx_hash,
             'logs': logs
         }
+    finally:
+        if pipeline is not None:
+            pipeline.close()
 
 # Display functions
 def print_border(text, color=Fore.CYAN, width=60):
@@ -1,7 +1,13 @@
 import os
 import random
 import asyncio
+from typing import Optional
 from web3 import Web3
+from rpc_pool import get_web3, get_async_web3, get_chain_id
+from nonce_manager import send_transaction
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 from colorama import init # Keep for direct testing
 
 init(autoreset=True)
@@ -9,14 +15,11 @@ init(autoreset=True)
 # Constants
 DEFAULT_RPC_URL = "https://testnet-rpc.monad.xyz/"
 DEFAULT_EXPLORER_URL = "https://testnet.monadexplorer.com/tx/0x"
-DEFAULT_GAS_LIMIT_SEND = 40000 # Increased from 21000 for more complex operations
+DEFAULT_GAS_LIMIT_SEND = 40000 # Fallback if the learned limit is unknown and estimation fails
 
 # --- Helper Functions --- (Copied)
 def connect_to_rpc(rpc_url):
-    w3 = Web3(Web3.HTTPProvider(rpc_url))
-    if not w3.is_connected():
-        raise ConnectionError(f"Could not connect to RPC: {rpc_url}")
-    return w3
+    return get_web3(rpc_url)
 
 def format_border(text, width=60):
     line1 = f"┌{'─' * (width - 2)}┐"
@@ -38,58 +41,56 @@ async def execute_send_mon(
     amount_wei: int,
     rpc_url: str = DEFAULT_RPC_URL,
     explorer_url: str = DEFAULT_EXPLORER_URL,
-    gas_limit: int = DEFAULT_GAS_LIMIT_SEND
+    gas_limit: Optional[int] = None # None = learned limit (a plain transfer learns 21000)
 ) -> dict:
     logs = []
     tx_hash_hex = None
     try:
-        w3 = connect_to_rpc(rpc_url)
+        w3 = await get_async_web3(rpc_url)
         account = w3.eth.account.from_key(private_key)
         wallet_short = account.address[:8] + "..."
         recipient_checksum = w3.to_checksum_address(recipient_address)
 
         logs.append(format_border(f"Sending {w3.from_wei(amount_wei, 'ether')} MON | {wallet_short} -> {recipient_checksum[:8]}..." ))
 
-        balance = await asyncio.to_thread(w3.eth.get_balance, account.address)
+        # Independent reads, issued together so the transport sends them in one batch request
+        balance, gas_price = await asyncio.gather(
+            w3.eth.get_balance(account.address), get_gas_price(w3), return_exceptions=True,
+        )
+        if isinstance(balance, Exception):
+            raise balance
         logs.append(format_step('send', f"Balance: {w3.from_wei(balance, 'ether')} MON"))
 
-        # Estimate gas price - handle both property and callable cases
-        try:
-            if callable(w3.eth.gas_price):
-                gas_price = await asyncio.to_thread(lambda: w3.eth.gas_price())
-            else:
-                gas_price = w3.eth.gas_price
-        except Exception as gas_err:
-            logs.append(format_step('send', f"Error getting gas price: {gas_err}. Using default."))
+        # Estimate gas price
+        if isinstance(gas_price, Exception):
+            logs.append(format_step('send', f"Error getting gas price: {gas_price}. Using default."))
             gas_price = w3.to_wei('50', 'gwei')
-            
-        estimated_cost = gas_limit * gas_price
-
-        if balance < (amount_wei + estimated_cost):
-            raise ValueError(f"Insufficient balance for amount + gas: {w3.from_wei(balance, 'ether')} < ~{w3.from_wei(amount_wei + estimated_cost, 'ether')}")
-        elif balance < amount_wei:
-             raise ValueError(f"Insufficient balance: {w3.from_wei(balance, 'ether')} < {w3.from_wei(amount_wei, 'ether')}")
 
         # Build transaction
-        nonce = await asyncio.to_thread(w3.eth.get_transaction_count, account.address)
         tx = {
+            'from': account.address,
             'to': recipient_checksum,
             'value': amount_wei,
-            'gas': gas_limit,
             'gasPrice': gas_price,
-            'nonce': nonce,
-            'chainId': w3.eth.chain_id
+            'chainId': await get_chain_id(w3)
         }
+        tx['gas'] = gas_limit or await get_gas_limit(w3, tx, fallback=DEFAULT_GAS_LIMIT_SEND)
+
+        estimated_cost = tx['gas'] * gas_price
+
+        if balance < (amount_wei + estimated_cost):
+            raise ValueError(f"Insufficient balance for amount + gas: {w3.from_wei(balance, 'ether')} < ~{w3.from_wei(amount_wei + estimated_cost, 'ether')}")
+        elif balance < amount_wei:
+             raise ValueError(f"Insufficient balance: {w3.from_wei(balance, 'ether')} < {w3.from_wei(amount_wei, 'ether')}")
 
         logs.append(format_step('send', 'Sending transaction...'))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = await asyncio.to_thread(w3.eth.send_raw_transaction, signed_tx.raw_transaction)
+        tx_hash = await send_transaction(w3, tx, private_key)
         tx_hash_hex = tx_hash.hex()
         tx_link = f"{explorer_url}{tx_hash_hex}"
         logs.append(format_step('send', f"Tx Hash: {tx_link}"))
 
         # Wait for receipt
-        receipt = await asyncio.to_thread(w3.eth.wait_for_transaction_receipt, tx_hash, timeout=180)
+        receipt = await wait_for_receipt(w3, tx_hash, timeout=180)
 
         if receipt.status == 1:
             logs.append(format_step('send', "✔ Transaction successful!"))
@@ -110,7 +111,7 @@ async def execute_send_mon(
                     'to': recipient_checksum,
                     'value': amount_wei
                 }
-                w3.eth.call(tx_params)
+                await w3.eth.call(tx_params)
                 # If we reach here, it means no revert reason was provided
                 error_message = f"Transaction failed on-chain with status 0, but no revert reason available"
             except Exception as call_err:
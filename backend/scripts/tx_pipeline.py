@@ -0,0 +1,100 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple, Union
+
+from eth_account import Account
+from web3 import AsyncWeb3
+from web3.types import TxReceipt
+
+from nonce_manager import NonceManager, send_transaction
+from receipt_waiter import DEFAULT_RECEIPT_TIMEOUT_SECONDS, wait_for_receipt
+
+
+class TransactionFailed(Exception):
+    """A pipelined transaction was mined but reverted."""
+
+    def __init__(self, label: str, tx_hash: bytes, receipt: TxReceipt):
+        self.label = label
+        self.tx_hash = tx_hash
+        self.receipt = receipt
+        super().__init__(f"{label.capitalize()} transaction failed: Status {receipt['status']}")
+
+
+# --- Wallet Locks --- #
+# asyncio.Lock is bound to the loop that first awaits it; keep one per (address, loop)
+_wallet_locks: Dict[str, Tuple[asyncio.Lock, asyncio.AbstractEventLoop]] = {}
+
+
+def wallet_lock(address: str) -> asyncio.Lock:
+    """In-process lock for one wallet; whoever holds it sends that wallet's next transactions."""
+    key = AsyncWeb3.to_checksum_address(address)
+    loop = asyncio.get_running_loop()
+    entry = _wallet_locks.get(key)
+    if entry is None or entry[1] is not loop:
+        entry = (asyncio.Lock(), loop)
+        _wallet_locks[key] = entry
+    return entry[0]
+
+
+class TxPipeline:
+    """
+    Sends one wallet's transactions back to back without waiting for receipts in between.
+
+    A chain executes a sender's transactions in nonce order, so a swap sent right after its
+    approve (next local nonce, see nonce_manager) still runs after it: the approve's receipt
+    is only needed to report the outcome. send() therefore returns as soon as the node has
+    the transaction, and confirm() waits for just the receipts the caller asks for, all at
+    once. Used as `async with TxPipeline(w3, key) as pipeline:` (or open() / close()), which
+    holds the wallet's lock so no other pipeline in this process interleaves its transactions.
+
+    Gas for a transaction that depends on an unmined one can't be estimated (the estimate
+    sees the old state and reverts); callers pass a fallback to get_gas_limit() as usual.
+    """
+
+    def __init__(self, w3: AsyncWeb3, private_key: str, manager: Optional[NonceManager] = None):
+        self.w3 = w3
+        self.private_key = private_key
+        self.manager = manager
+        self.address = Account.from_key(private_key).address
+        self._sent: List[Tuple[str, bytes]] = [] # (label, tx hash) in nonce order
+        self._receipts: Dict[bytes, TxReceipt] = {}
+        self._lock = wallet_lock(self.address)
+        self._open = False
+
+    async def open(self) -> "TxPipeline":
+        await self._lock.acquire()
+        self._open = True
+        return self
+
+    def close(self) -> None:
+        """Releases the wallet; receipts not confirmed yet are simply not waited for."""
+        if self._open:
+            self._open = False
+            self._lock.release()
+
+    async def __aenter__(self) -> "TxPipeline":
+        return await self.open()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    async def send(self, tx: Dict, label: str) -> bytes:
+        """Signs and broadcasts tx with the wallet's next nonce; does not wait for it to be mined."""
+        tx_hash = await send_transaction(self.w3, tx, self.private_key, manager=self.manager)
+        self._sent.append((label, tx_hash))
+        return tx_hash
+
+    async def confirm(self, *tx_hashes: Union[bytes, None], timeout: float = DEFAULT_RECEIPT_TIMEOUT_SECONDS) -> Dict[bytes, TxReceipt]:
+        """
+        Waits for the given transactions (all sent so far if none are given) and returns their
+        receipts. Raises TransactionFailed for the earliest one that reverted.
+        """
+        wanted = [tx_hash for tx_hash in tx_hashes if tx_hash is not None] or [tx_hash for _, tx_hash in self._sent]
+        labels = {tx_hash: label for label, tx_hash in self._sent}
+        missing = [tx_hash for tx_hash in wanted if tx_hash not in self._receipts]
+        receipts = await asyncio.gather(*(wait_for_receipt(self.w3, tx_hash, timeout=timeout) for tx_hash in missing))
+        self._receipts.update(zip(missing, receipts))
+        for tx_hash in wanted: # Nonce order: the first revert explains the ones after it
+            receipt = self._receipts[tx_hash]
+            if receipt['status'] != 1:
+                raise TransactionFailed(labels.get(tx_hash, 'pipelined'), tx_hash, receipt)
+        return {tx_hash: self._receipts[tx_hash] for tx_hash in wanted}
@@ -0,0 +1,117 @@
+import os
+import heapq
+import asyncio
+import itertools
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Constants
+# Transactions per second this process may send across all tasks (0 disables scheduling)
+TX_SEND_RATE = float(os.environ.get('TX_SEND_RATE', '10'))
+TX_SEND_BURST = 1 # Slots that can be handed out back to back after an idle period
+DEFAULT_FLOW = "default" # Sends made outside any task (API helpers, scripts run directly)
+DEFAULT_WEIGHT = 1.0
+DEFAULT_PRIORITY = 0
+
+
+class Flow:
+    """One task's share of the send budget."""
+
+    def __init__(self, name: str, weight: float = DEFAULT_WEIGHT, priority: int = DEFAULT_PRIORITY):
+        self.name = name
+        self.weight = max(weight, 0.01)
+        self.priority = priority
+        self.last_finish = 0.0 # Virtual finish tag of the flow's latest request
+        self.granted = 0 # Slots handed out (for logs / inspection)
+
+
+# The flow of the running bot task; set by the task runner, inherited by the tasks it spawns
+current_flow: contextvars.ContextVar[Optional[Flow]] = contextvars.ContextVar('current_flow', default=None)
+
+
+class TxScheduler:
+    """
+    Hands out transaction send slots to tasks at a fixed overall rate.
+
+    Waiting requests are served by priority first (higher wins), then by weighted fair
+    queuing within a priority: each request gets a virtual finish tag of
+    max(virtual time, flow's last tag) + 1 / weight, and the smallest tag goes next.
+    A task with weight 2 therefore sends twice as often as a task with weight 1 while
+    both are busy, and an idle task's unused share goes to the others instead of
+    being saved up. Tasks mark themselves with flow(); sends outside a flow share the
+    default one.
+    """
+
+    def __init__(self, rate: float = TX_SEND_RATE):
+        self.rate = rate
+        self._flows: Dict[str, Flow] = {}
+        self._queue: List[Tuple[int, float, int, asyncio.Future, Flow]] = [] # (-priority, finish tag, seq, waiter, flow)
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._next_slot_at = 0.0 # Loop time at which the next slot may be granted
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @contextmanager
+    def flow(self, name: str, weight: float = DEFAULT_WEIGHT, priority: int = DEFAULT_PRIORITY) -> Iterator[Flow]:
+        """Runs the enclosed code (and tasks it creates) as flow `name`."""
+        flow = self._flows.get(name)
+        if flow is None:
+            flow = self._flows[name] = Flow(name, weight, priority)
+        else:
+            flow.weight, flow.priority = max(weight, 0.01), priority
+        token = current_flow.set(flow)
+        try:
+            yield flow
+        finally:
+            current_flow.reset(token)
+            self._flows.pop(name, None)
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Waiters and the timer belong to one event loop; start over on a new one
+            self._loop = loop
+            self._queue.clear()
+            self._timer = None
+            self._next_slot_at = 0.0
+        return loop
+
+    async def acquire(self) -> None:
+        """Waits for this flow's turn to send one transaction."""
+        if self.rate <= 0:
+            return
+        loop = self._bind_loop()
+        flow = current_flow.get() or self._flows.setdefault(DEFAULT_FLOW, Flow(DEFAULT_FLOW))
+        finish = max(self._virtual_time, flow.last_finish) + 1 / flow.weight
+        flow.last_finish = finish
+        waiter = loop.create_future()
+        heapq.heappush(self._queue, (-flow.priority, finish, next(self._seq), waiter, flow))
+        if self._timer is None:
+            self._dispatch() # Otherwise the pending timer serves it in order
+        await waiter # A cancelled waiter is skipped by _dispatch()
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        now = self._loop.time()
+        interval = 1 / self.rate
+        # Unused time does not accumulate beyond the burst
+        self._next_slot_at = max(self._next_slot_at, now - interval * (TX_SEND_BURST - 1))
+        while self._queue and self._next_slot_at <= now:
+            _, finish, _, waiter, flow = heapq.heappop(self._queue)
+            if waiter.done():
+                continue # Its task was cancelled (e.g. stopped) while waiting
+            self._virtual_time = max(self._virtual_time, finish)
+            self._next_slot_at += interval
+            flow.granted += 1
+            waiter.set_result(None)
+        if self._queue and self._timer is None:
+            self._timer = self._loop.call_at(self._next_slot_at, self._dispatch)
+
+    def waiting(self) -> int:
+        return sum(1 for entry in self._queue if not entry[3].done())
+
+
+# Process-wide scheduler shared by every task (send_transaction() asks it for a slot)
+tx_scheduler = TxScheduler()
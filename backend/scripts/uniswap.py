@@ -2,7 +2,14 @@ import os
 import random
 import asyncio
 import time
-from web3 import Web3
+from typing import Optional
+from web3 import AsyncWeb3, Web3
+from rpc_pool import get_web3, get_async_web3, get_chain_id
+from nonce_manager import send_transaction
+from tx_pipeline import TxPipeline, TransactionFailed
+from receipt_waiter import wait_for_receipt
+from gas_oracle import get_gas_price
+from gas_limits import get_gas_limit
 from colorama import init # Keep for potential direct testing
 
 init(autoreset=True)
@@ -31,6 +38,7 @@ DEFAULT_TOKEN_ADDRESSES = {
 ERC20_ABI = [
     {"constant": True, "inputs": [{"name": "_owner", "type": "address"}], "name": "balanceOf", "outputs": [{"name": "balance", "type": "uint256"}], "type": "function"},
     {"constant": False, "inputs": [{"name": "_spender", "type": "address"}, {"name": "_value", "type": "uint256"}], "name": "approve", "outputs": [{"name": "", "type": "bool"}], "type": "function"},
+    {"constant": True, "inputs": [{"name": "_owner", "type": "address"}, {"name": "_spender", "type": "address"}], "name": "allowance", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
     {"constant": True, "inputs": [], "name": "decimals", "outputs": [{"name": "", "type": "uint8"}], "type": "function"}, # Added decimals
 ]
 
@@ -46,15 +54,24 @@ def connect_to_rpc(rpc_urls):
     urls_to_try = rpc_urls if isinstance(rpc_urls, list) else [rpc_urls]
     for url in urls_to_try:
         try:
-            w3 = Web3(Web3.HTTPProvider(url, request_kwargs={'timeout': 60})) # Increased timeout
-            if w3.is_connected():
-                print(f"Connected to RPC: {url}")
-                return w3
-            print(f"Failed connection test for {url}")
+            w3 = get_web3(url) # Shared provider, 60s timeout
+            print(f"Connected to RPC: {url}")
+            return w3
         except Exception as e:
             print(f"Error connecting to {url}: {e}")
     raise ConnectionError("Could not connect to any provided RPC URL")
 
+# Async variant used by execute_uniswap_swap: one transport routing over all URLs (fastest healthy endpoint per call)
+async def connect_to_async_rpc(rpc_urls) -> AsyncWeb3:
+    urls_to_try = rpc_urls if isinstance(rpc_urls, list) else [rpc_urls]
+    try:
+        w3 = await get_async_web3(urls_to_try)
+        print(f"Connected to RPC: {w3.provider.endpoint_uri}")
+        return w3
+    except Exception as e:
+        print(f"Error connecting to {urls_to_try}: {e}")
+    raise ConnectionError("Could not connect to any provided RPC URL")
+
 def format_border(text, width=60):
     line1 = f"╔{'═' * (width - 2)}╗"
     line2 = f"║ {text:^56} ║"
@@ -69,61 +86,58 @@ def format_step(step, message):
 async def get_token_decimals(w3, token_address):
     try:
         token_contract = w3.eth.contract(address=token_address, abi=ERC20_ABI)
-        return await asyncio.to_thread(token_contract.functions.decimals().call)
+        return await token_contract.functions.decimals().call()
     except Exception:
         # Default to 18 if decimals call fails (common for ETH/native)
         return 18
 
 async def approve_token_for_router(
-    w3: Web3,
+    w3: AsyncWeb3,
     private_key: str,
     account_address: str,
     token_address: str,
     spender_address: str,
     amount_wei: int,
-    logs: list
+    logs: list,
+    pipeline: Optional[TxPipeline] = None
 ) -> bool:
+    """
+    Ensures the router may spend amount_wei of the token. With a pipeline the approval is only
+    sent (the swap queued behind it confirms both); otherwise its receipt is awaited here.
+    """
     token_contract = w3.eth.contract(address=token_address, abi=ERC20_ABI)
     try:
         logs.append(format_step('approve', f'Approving token {token_address} for router...'))
-        allowance = await asyncio.to_thread(token_contract.functions.allowance(account_address, spender_address).call)
+        allowance = await token_contract.functions.allowance(account_address, spender_address).call()
 
         if allowance >= amount_wei:
             logs.append(format_step('approve', 'Sufficient allowance already exists.'))
             return True
 
-        # Handle gas_price correctly - check if it's callable
         try:
-            # Try as a method first
-            gas_price = w3.eth.gas_price()
-        except Exception:
-            # If that fails, try as a property
-            try:
-                gas_price = w3.eth.gas_price
-            except Exception as e:
-                # If both fail, use an estimation instead
-                logs.append(format_step('approve', f"Warning: Couldn't get gas price, using default: {e}"))
-                gas_price = w3.to_wei('50', 'gwei')  # Use a safe default
-                
-        nonce = await asyncio.to_thread(w3.eth.get_transaction_count, account_address)
-
-        tx = await asyncio.to_thread(
-            token_contract.functions.approve(spender_address, amount_wei).build_transaction, # Use amount_wei directly
-            {
-                'from': account_address,
-                'gas': 150000, # Keep gas limit reasonable
-                'gasPrice': gas_price,
-                'nonce': nonce,
-                'chainId': w3.eth.chain_id
-            }
-        )
+            gas_price = await get_gas_price(w3)
+        except Exception as e:
+            logs.append(format_step('approve', f"Warning: Couldn't get gas price, using default: {e}"))
+            gas_price = w3.to_wei('50', 'gwei')  # Use a safe default
+
+        tx = await token_contract.functions.approve(spender_address, amount_wei).build_transaction({ # Use amount_wei directly
+            'from': account_address,
+            'gas': 150000, # Placeholder so build_transaction doesn't estimate; replaced below
+            'gasPrice': gas_price,
+            'chainId': await get_chain_id(w3)
+        })
+        tx['gas'] = await get_gas_limit(w3, tx, fallback=150000)
+
+        if pipeline is not None:
+            tx_hash = await pipeline.send(tx, 'approve')
+            logs.append(format_step('approve', f"Approval Tx Hash: {tx_hash.hex()} (swap follows without waiting)"))
+            return True
 
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = await asyncio.to_thread(w3.eth.send_raw_transaction, signed_tx.raw_transaction)
+        tx_hash = await send_transaction(w3, tx, private_key)
         tx_hash_hex = tx_hash.hex()
         logs.append(format_step('approve', f"Approval Tx Hash: {tx_hash_hex}"))
 
-        receipt = await asyncio.to_thread(w3.eth.wait_for_transaction_receipt, tx_hash, timeout=180)
+        receipt = await wait_for_receipt(w3, tx_hash, timeout=180)
 
         if receipt.status == 1:
             logs.append(format_step('approve', '✔ Token approved successfully!'))
@@ -154,13 +168,16 @@ async def execute_uniswap_swap(
     logs = []
     tx_hash_hex = None
     w3 = None # Initialize w3
+    pipeline = None
 
     try:
         # If rpc_url is provided, use it instead of rpc_urls (backward compatibility)
         if rpc_url is not None:
             rpc_urls = rpc_url
             
-        w3 = connect_to_rpc(rpc_urls)
+        w3 = await connect_to_async_rpc(rpc_urls)
+        # Approve (if needed) and swap go out back to back; both receipts are awaited together
+        pipeline = await TxPipeline(w3, private_key).open()
         account = w3.eth.account.from_key(private_key)
         account_checksum = account.address
         wallet_short = account_checksum[:8] + "..."
@@ -187,20 +204,13 @@ async def execute_uniswap_swap(
         router_contract = w3.eth.contract(address=router_checksum, abi=ROUTER_ABI)
         deadline = int(time.time()) + 600 # 10 minutes from now
         
-        # Handle gas_price correctly - check if it's callable
         try:
-            # Try as a method first
-            gas_price = w3.eth.gas_price()
-        except Exception:
-            # If that fails, try as a property
-            try:
-                gas_price = w3.eth.gas_price
-            except Exception as e:
-                # If both fail, use an estimation instead
-                logs.append(format_step('swap', f"Warning: Couldn't get gas price, using default: {e}"))
-                gas_price = w3.to_wei('50', 'gwei')  # Use a safe default
-                
-        nonce = await asyncio.to_thread(w3.eth.get_transaction_count, account_checksum)
+            gas_price = await get_gas_price(w3)
+        except Exception as e:
+            logs.append(format_step('swap', f"Warning: Couldn't get gas price, using default: {e}"))
+            gas_price = w3.to_wei('50', 'gwei')  # Use a safe default
+
+        chain_id = await get_chain_id(w3)
         path = []
         tx_details = {}
         amount_out_min = 0 # TODO: Implement price fetching for accurate min amount
@@ -220,18 +230,16 @@ async def execute_uniswap_swap(
                 'value': amount_in_wei,
                 'gas': 300000,
                 'gasPrice': gas_price,
-                'nonce': nonce,
-                'chainId': w3.eth.chain_id
+                'chainId': chain_id
             }
 
         # Case 2: Token to MON/ETH (Native ETH)
         elif token_to_symbol in ["MON", "ETH"]:
             logs.append(format_step('swap', f'Preparing {token_from_symbol} -> {token_to_symbol}'))
             # Approve token first
-            approved = await approve_token_for_router(w3, private_key, account_checksum, token_from_addr, router_checksum, amount_in_wei, logs)
+            approved = await approve_token_for_router(w3, private_key, account_checksum, token_from_addr, router_checksum, amount_in_wei, logs, pipeline)
             if not approved:
                 raise Exception("Token approval failed.")
-            nonce = await asyncio.to_thread(w3.eth.get_transaction_count, account_checksum) # Get fresh nonce after approval
 
             path = [token_from_addr, wmon_checksum]
             tx_func = router_contract.functions.swapExactTokensForETH(
@@ -245,18 +253,16 @@ async def execute_uniswap_swap(
                 'from': account_checksum,
                 'gas': 300000,
                 'gasPrice': gas_price,
-                'nonce': nonce,
-                'chainId': w3.eth.chain_id
+                'chainId': chain_id
             }
 
         # Case 3: Token to Token
         else:
             logs.append(format_step('swap', f'Preparing {token_from_symbol} -> {token_to_symbol}'))
             # Approve token first
-            approved = await approve_token_for_router(w3, private_key, account_checksum, token_from_addr, router_checksum, amount_in_wei, logs)
+            approved = await approve_token_for_router(w3, private_key, account_checksum, token_from_addr, router_checksum, amount_in_wei, logs, pipeline)
             if not approved:
                 raise Exception("Token approval failed.")
-            nonce = await asyncio.to_thread(w3.eth.get_transaction_count, account_checksum) # Get fresh nonce after approval
 
             # Simple path: From -> WMON -> To (needs WMON address)
             path = [token_from_addr, wmon_checksum, token_to_addr]
@@ -271,32 +277,34 @@ async def execute_uniswap_swap(
                 'from': account_checksum,
                 'gas': 400000, # Slightly higher gas for token-to-token
                 'gasPrice': gas_price,
-                'nonce': nonce,
-                'chainId': w3.eth.chain_id
+                'chainId': chain_id
             }
 
         # --- Build and Send Transaction ---
-        tx = await asyncio.to_thread(tx_func.build_transaction, tx_details)
+        tx = await tx_func.build_transaction(tx_details)
+        # Hardcoded limits above are the fallback (also while a pipelined approve is unmined: the estimate reverts)
+        tx['gas'] = await get_gas_limit(w3, tx, fallback=tx_details['gas'])
 
         logs.append(format_step('swap', 'Sending swap transaction...'))
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        tx_hash = await asyncio.to_thread(w3.eth.send_raw_transaction, signed_tx.raw_transaction)
+        tx_hash = await pipeline.send(tx, 'swap')
         tx_hash_hex = tx_hash.hex()
         tx_link = f"{explorer_url}{tx_hash_hex}"
         logs.append(format_step('swap', f"Tx Hash: {tx_link}"))
 
-        receipt = await asyncio.to_thread(w3.eth.wait_for_transaction_receipt, tx_hash, timeout=180)
-
-        if receipt.status == 1:
-            logs.append(format_step('swap', '✔ Swap successful!'))
-            return {'success': True, 'tx_hash': tx_hash_hex, 'explorer_url': tx_link, 'message': f'Uniswap swap {token_from_symbol} to {token_to_symbol} successful!', 'logs': logs}
-        else:
-            logs.append(format_step('swap', f'✘ Swap transaction failed: Status {receipt.status}'))
-            raise Exception(f"Swap transaction failed: Status {receipt.status}")
+        try:
+            await pipeline.confirm() # Approve (if sent) and swap
+        except TransactionFailed as e:
+            logs.append(format_step(e.label, f'✘ {e}'))
+            raise
+        logs.append(format_step('swap', '✔ Swap successful!'))
+        return {'success': True, 'tx_hash': tx_hash_hex, 'explorer_url': tx_link, 'message': f'Uniswap swap {token_from_symbol} to {token_to_symbol} successful!', 'logs': logs}
 
     except Exception as e:
         error_message = f"An unexpected error occurred during Uniswap swap: {str(e)}"
         logs.append(format_step('swap', f"✘ Failed: {error_message}"))
         return {'success': False, 'tx_hash': tx_hash_hex, 'message': error_message, 'logs': logs}
+    finally:
+        if pipeline is not None:
+            pipeline.close()
 
 # --- Removed original functions like load_private_keys, get_random_eth_amount, run_swap_cycle etc. --- 
\ No newline at end of file
@@ -1,7 +1,9 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAppContext } from '../context/AppContext';
 import './LogsPage.css';
 
+const MAX_LOGS_SHOWN = 1000; // Same as the backend's per-task ring buffer
+
 function LogsPage() {
   const { tasks, isLoadingTasks, taskError, fetchTasks } = useAppContext();
   const [selectedTaskId, setSelectedTaskId] = useState(null);
@@ -9,6 +11,7 @@ function LogsPage() {
   const [isLoadingDetails, setIsLoadingDetails] = useState(false);
   const [detailsError, setDetailsError] = useState(null);
   const [filterStatus, setFilterStatus] = useState('all');
+  const lastLogSeqRef = useRef(0); // Highest log seq already shown for the selected task
 
   // API base URL from environment or default
   const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:8000';
@@ -17,6 +20,7 @@ function LogsPage() {
   const fetchTaskDetails = async (taskId) => {
     if (!taskId) return;
     
+    lastLogSeqRef.current = 0;
     setIsLoadingDetails(true);
     try {
       const response = await fetch(`${API_BASE_URL}/api/v1/tasks/${taskId}`);
@@ -24,6 +28,8 @@ function LogsPage() {
         throw new Error(`Failed to fetch task details for ID: ${taskId}`);
       }
       const data = await response.json();
+      const logs = data.logs || [];
+      lastLogSeqRef.current = logs.length > 0 ? (logs[logs.length - 1].seq || 0) : 0;
       setSelectedTask(data);
       setDetailsError(null);
     } catch (err) {
@@ -33,6 +39,36 @@ function LogsPage() {
     }
   };
 
+  // Apply a status update unless it is older than the one already shown
+  const withStatus = (task, status, lastUpdated) => {
+    if (lastUpdated && task.last_updated && Date.parse(lastUpdated) < Date.parse(task.last_updated)) return task;
+    return { ...task, status, last_updated: lastUpdated || task.last_updated };
+  };
+
+  // Fetch only the log entries added since the last poll and append them
+  const fetchNewLogs = async (taskId) => {
+    if (!taskId) return;
+
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/v1/tasks/${taskId}/logs?after=${lastLogSeqRef.current}`);
+      if (!response.ok) {
+        throw new Error(`Failed to fetch logs for task ID: ${taskId}`);
+      }
+      const data = await response.json();
+      // SSE may have appended past this page while it was in flight: keep only what is still new
+      const newLogs = (data.logs || []).filter(entry => entry.seq > lastLogSeqRef.current);
+      lastLogSeqRef.current = Math.max(lastLogSeqRef.current, data.last_seq || 0);
+      setSelectedTask(prev => {
+        if (!prev || prev.task_id !== taskId) return prev;
+        const logs = newLogs.length > 0 ? [...(prev.logs || []), ...newLogs].slice(-MAX_LOGS_SHOWN) : prev.logs;
+        return { ...withStatus(prev, data.status, data.last_updated), logs };
+      });
+      setDetailsError(null);
+    } catch (err) {
+      setDetailsError(err.message);
+    }
+  };
+
   // Auto-select the newest task when tasks are loaded or changed
   useEffect(() => {
     if (tasks.length > 0 && !selectedTaskId) {
@@ -45,16 +81,43 @@ function LogsPage() {
     if (selectedTaskId) {
       fetchTaskDetails(selectedTaskId);
       
-      // Set up polling for in-progress tasks
-      const pollInterval = setInterval(() => {
-        if (selectedTask && selectedTask.status?.toLowerCase() !== 'completed' && selectedTask.status?.toLowerCase() !== 'failed') {
-          fetchTaskDetails(selectedTaskId);
-        }
-      }, 5000);
-      
+    }
+  }, [selectedTaskId]);
+
+  // Stream new log entries / status changes for the selected task
+  useEffect(() => {
+    if (!selectedTaskId) return undefined;
+
+    if (typeof EventSource === 'undefined') {
+      // No SSE support: fall back to tailing with a poll
+      const pollInterval = setInterval(() => fetchNewLogs(selectedTaskId), 5000);
       return () => clearInterval(pollInterval);
     }
-  }, [selectedTaskId, selectedTask?.status]);
+
+    const source = new EventSource(`${API_BASE_URL}/api/v1/task-events?task_id=${selectedTaskId}`);
+    source.addEventListener('log', (e) => {
+      const entry = JSON.parse(e.data);
+      if (entry.seq <= lastLogSeqRef.current) return; // Already have it
+      if (entry.seq > lastLogSeqRef.current + 1) {
+        fetchNewLogs(selectedTaskId); // Gap: fetch everything after what we have
+        return;
+      }
+      lastLogSeqRef.current = entry.seq;
+      setSelectedTask(prev => {
+        if (!prev || prev.task_id !== selectedTaskId) return prev;
+        return { ...prev, logs: [...(prev.logs || []), entry].slice(-MAX_LOGS_SHOWN) };
+      });
+    });
+    source.addEventListener('status', (e) => {
+      const event = JSON.parse(e.data);
+      setSelectedTask(prev => (prev && prev.task_id === selectedTaskId ? withStatus(prev, event.status, event.last_updated) : prev));
+    });
+    // Dropped events or a reconnect: catch up from the last seq we rendered
+    source.addEventListener('lagged', () => fetchNewLogs(selectedTaskId));
+    source.onopen = () => fetchNewLogs(selectedTaskId);
+
+    return () => source.close();
+  }, [selectedTaskId]);
 
   const handleTaskSelect = (taskId) => {
     setSelectedTaskId(taskId);
@@ -506,7 +569,7 @@ function LogsPage() {
                   {selectedTask.logs && selectedTask.logs.length > 0 ? (
                     selectedTask.logs.map((log, index) => (
                       <div 
-                        key={index}
+                        key={log.seq ?? index}
                         style={{
                           marginBottom: '4px',
                           lineHeight: '1.4',
@@ -103,14 +103,37 @@ export const AppProvider = ({ children }) => {
     }
   };
 
+  // One bulk request for every wallet (backend packs the reads into Multicall3 calls)
   const fetchWalletBalances = async () => {
+    if (wallets.length === 0) return;
     setIsLoadingWallets(true);
     setWalletError(null);
-    const balancePromises = wallets.map(wallet => fetchWalletBalance(wallet.id, wallet.address));
     try {
-      await Promise.all(balancePromises);
+      const response = await fetch(`${API_BASE_URL}/api/v1/balances`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ addresses: wallets.map(wallet => wallet.address) }),
+      });
+      if (!response.ok) {
+        let errorMsg = `Failed to fetch wallet balances. Status: ${response.status}`;
+        try { const errorData = await response.json(); errorMsg = `${errorMsg} - ${JSON.stringify(errorData.detail) || 'Unknown error'}`; } catch { /* Ignore */ }
+        throw new Error(errorMsg);
+      }
+      const data = await response.json();
+      // Response is keyed by checksum address; match case-insensitively
+      const byAddress = {};
+      Object.entries(data.balances || {}).forEach(([address, entry]) => {
+        byAddress[address.toLowerCase()] = entry.native;
+      });
+      setWallets(prevWallets =>
+        prevWallets.map(wallet => {
+          const balance = byAddress[wallet.address?.toLowerCase()];
+          return balance === undefined ? wallet : { ...wallet, balance: balance ?? 'Error' };
+        })
+      );
     } catch (error) {
-      console.error('Error fetching some wallet balances:', error);
+      console.error('Error fetching wallet balances:', error);
+      setWallets(prevWallets => prevWallets.map(wallet => ({ ...wallet, balance: 'Error' })));
     } finally {
       setIsLoadingWallets(false);
     }
@@ -258,7 +281,7 @@ export const AppProvider = ({ children }) => {
   };
 
   // --- Run Multi-Step Workflow ---
-  const runMultiStepWorkflow = async (workflowId, rpcUrl = 'https://testnet-rpc.monad.xyz/', delayBetweenKeys = 5) => {
+  const runMultiStepWorkflow = async (workflowId, rpcUrl = 'https://testnet-rpc.monad.xyz/', delayBetweenKeys = 5, maxParallelKeys = 1) => {
     const workflowToRun = workflows.find(w => w.id === workflowId);
     if (!workflowToRun || selectedWallets.length === 0) {
         console.error("runMultiStepWorkflow Error: Workflow not found or no wallets selected", workflowToRun, selectedWallets);
@@ -280,6 +303,7 @@ export const AppProvider = ({ children }) => {
         rpc_url: rpcUrl, // Allow override later if needed
         task_description: `${workflowToRun.name} (Multi-Step Run)`, // More specific description
         delay_between_keys_seconds: delayBetweenKeys, // Use provided or default
+        max_parallel_keys: maxParallelKeys, // 1 = process wallets one after another
         steps: stepsToRun.map(step => ({ // Ensure payload matches backend model
             step_id: step.step_id,
             type: step.type,
@@ -345,7 +369,8 @@ export const AppProvider = ({ children }) => {
     }
 
     // Set up polling intervals
-    const tasksInterval = setInterval(fetchTasks, 10000); // Refresh tasks every 10 seconds
+    // Live updates arrive over /api/v1/task-events; this slow poll is only a safety net
+    const tasksInterval = setInterval(fetchTasks, 60000); // Refresh tasks every 60 seconds
     const walletsInterval = setInterval(() => {
          if (wallets.length > 0) { // Only fetch balances if wallets exist
              fetchWalletBalances();
@@ -359,6 +384,49 @@ export const AppProvider = ({ children }) => {
     };
   }, [wallets.length]); // Re-run effect if wallet count changes (to start/stop polling balances)
 
+  // --- Live Task Events (SSE) ---
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return undefined;
+    const source = new EventSource(`${API_BASE_URL}/api/v1/task-events`);
+    let refetchTimer = null;
+
+    // Coalesce bursts of events for not-yet-listed tasks into one list refresh
+    const scheduleRefetch = () => {
+      if (refetchTimer) return;
+      refetchTimer = setTimeout(() => {
+        refetchTimer = null;
+        fetchTasks();
+      }, 500);
+    };
+
+    const applyUpdate = (taskId, changes) => {
+      setTasks(prevTasks => {
+        if (!prevTasks.some(task => task.id === taskId)) {
+          scheduleRefetch(); // New task we haven't listed yet
+          return prevTasks;
+        }
+        return prevTasks.map(task => (task.id === taskId ? { ...task, ...changes } : task));
+      });
+    };
+
+    source.addEventListener('status', (e) => {
+      const event = JSON.parse(e.data);
+      applyUpdate(event.task_id, { status: event.status, last_updated: event.last_updated });
+    });
+    source.addEventListener('log', (e) => {
+      const event = JSON.parse(e.data);
+      applyUpdate(event.task_id, { last_log: event, log_count: event.seq });
+    });
+    // Missed events (slow client or reconnect): resync the summaries
+    source.addEventListener('lagged', scheduleRefetch);
+    source.onopen = scheduleRefetch;
+
+    return () => {
+      clearTimeout(refetchTimer);
+      source.close();
+    };
+  }, []);
+
 
   // --- Context Value ---
   // Make sure all required functions and state are included